@@ -0,0 +1,74 @@
+import hashlib
+import logging
+from django.conf import settings
+
+from . import metrics
+from .client import CashfreeConfig, breaker_for
+from .ratelimit import SharedRateLimiter
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+
+def pool_accounts(client_id: str) -> list:
+    """
+    Additional merchant accounts sharing the orders of ``client_id``, as configured
+    in pretix.cfg, returns a list of (client_id, client_secret)
+    """
+    ids = settings.CONFIG_FILE.get(
+        "pretix_cashfree", f"accounts_{client_id}", fallback=""
+    )
+    accounts = []
+    for account in ids.replace(",", " ").split():
+        if account == client_id:
+            continue
+        secret = settings.CONFIG_FILE.get(
+            "pretix_cashfree", f"client_secret_{account}", fallback=""
+        )
+        if not secret:
+            logger.warning("No client secret configured for Cashfree %s", account)
+            continue
+        accounts.append((account, secret))
+    return accounts
+
+
+def _score(client_id: str, key: str) -> int:
+    digest = hashlib.blake2b(f"{client_id}:{key}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _available(config: CashfreeConfig) -> bool:
+    return breaker_for(config).state != "open"
+
+
+def _idle(config: CashfreeConfig) -> bool:
+    return not config.rate_limit or not (
+        SharedRateLimiter(config.client_id, config.rate_limit).saturated()
+    )
+
+
+def route(configs, key: str) -> CashfreeConfig:
+    """
+    Pick the merchant account for a new Cashfree order
+
+    Accounts are ranked by rendezvous hashing of ``key``, so an order always lands on
+    the same account and adding or removing an account only moves the orders of
+    that account. Accounts whose circuit breaker is open or whose rate limit is used
+    up for the current second are passed over for the next in rank.
+    """
+    ranked = sorted(configs, key=lambda c: _score(c.client_id, key), reverse=True)
+    if len(ranked) == 1:
+        return ranked[0]
+
+    for usable in (lambda c: _available(c) and _idle(c), _available):
+        for config in ranked:
+            if usable(config):
+                choice = "preferred" if config is ranked[0] else "rerouted"
+                metrics.inc(
+                    metrics.cashfree_account_routing_total,
+                    account=config.client_id,
+                    choice=choice,
+                )
+                return config
+
+    # Every account is unavailable, the call will fail fast on the preferred one
+    return ranked[0]
@@ -0,0 +1,335 @@
+from typing import TYPE_CHECKING
+
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from urllib3.exceptions import ProtocolError, TimeoutError
+from urllib.parse import quote
+
+from . import metrics
+from .client import CashfreeConfig, breaker_for, get_client, raise_for_status
+from .constants import (
+    ASYNC_EXECUTOR_WORKERS,
+    CLIENT_IDLE_TIMEOUT,
+    CLIENT_MAX_RETRIES,
+    CLIENT_POOL_MAXSIZE,
+    CLIENT_TIMEOUTS,
+)
+from .ratelimit import RateLimitExceeded, SharedRateLimiter
+from .resilience import CircuitOpenError, ahedged, backoff, is_transient
+
+if TYPE_CHECKING:
+    from cashfree_pg.models.create_order_request import CreateOrderRequest
+    from cashfree_pg.models.order_create_refund_request import OrderCreateRefundRequest
+    from cashfree_pg.models.order_entity import OrderEntity
+    from cashfree_pg.models.refund_entity import RefundEntity
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+_executor = None
+_lock = threading.Lock()
+
+
+def async_views_enabled() -> bool:
+    return settings.CONFIG_FILE.getboolean(
+        "pretix_cashfree", "async_views", fallback=False
+    )
+
+
+def _executor_workers():
+    return int(
+        settings.CONFIG_FILE.get(
+            "pretix_cashfree", "async_workers", fallback=ASYNC_EXECUTOR_WORKERS
+        )
+    )
+
+
+def _call(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        # Executor threads outlive requests, their connections must not go stale
+        close_old_connections()
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Run blocking ORM or cache work on the bounded executor shared by all async views
+
+    The caller's context variables, e.g. scopes and the rate limit priority, are
+    visible to ``fn``.
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=_executor_workers(), thread_name_prefix="cashfree-aio"
+                )
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, functools.partial(context.run, _call, fn, args, kwargs)
+    )
+
+
+class AsyncCashfreeClient:
+    """
+    Non-blocking counterpart of ``CashfreeClient`` built on ``httpx``
+
+    Each instance owns a pool of keep-alive connections bound to the event loop it was
+    created on. Timeouts, retries, the circuit breaker and the rate limit behave as
+    in ``CashfreeClient``, and errors are raised as the same ``cashfree_pg`` and
+    ``urllib3`` exceptions, so callers handle both clients alike.
+    """
+
+    def __init__(self, config: CashfreeConfig, maxsize: int = CLIENT_POOL_MAXSIZE):
+        import httpx
+
+        self.config = config
+        self.last_used = time.monotonic()
+        self.loop = asyncio.get_running_loop()
+        self.breaker = breaker_for(config)
+        self.limiter = (
+            SharedRateLimiter(config.client_id, config.rate_limit)
+            if config.rate_limit
+            else None
+        )
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=maxsize, max_keepalive_connections=maxsize
+            ),
+            headers={
+                "Accept": "application/json",
+                "Content-Type": "application/json",
+                "x-api-version": config.api_version,
+                "x-client-id": config.client_id,
+                "x-client-secret": config.client_secret,
+            },
+        )
+
+    async def _send(self, name, method, path, x_request_id, body=None):
+        import httpx
+
+        # Rate limited before the breaker, so a refused call never holds the probe
+        if self.limiter:
+            # Waiting for the shared rate limit sleeps, keep it off the event loop
+            await run_blocking(self.limiter.acquire)
+        probe = self.breaker.allow()
+        connect, read = CLIENT_TIMEOUTS[name]
+        try:
+            with metrics.timed(
+                metrics.cashfree_api_duration_seconds,
+                f"api.{name}",
+                x_request_id=x_request_id,
+                method=name,
+            ):
+                try:
+                    response = await self.http.request(
+                        method,
+                        f"{self.config.host}{path}",
+                        content=json.dumps(body) if body is not None else None,
+                        headers={"x-request-id": x_request_id},
+                        timeout=httpx.Timeout(read, connect=connect),
+                    )
+                except httpx.TimeoutException as e:
+                    raise TimeoutError(str(e)) from e
+                except httpx.TransportError as e:
+                    raise ProtocolError(str(e)) from e
+                raise_for_status(
+                    urllib3.HTTPResponse(
+                        body=response.content,
+                        headers=dict(response.headers),
+                        status=response.status_code,
+                        reason=response.reason_phrase,
+                        preload_content=True,
+                    )
+                )
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure(probe)
+            else:
+                self.breaker.record_success(probe)
+            raise
+        self.breaker.record_success(probe)
+        return response.json()
+
+    async def _request(
+        self, name, method, path, x_request_id, body=None, retry=False
+    ) -> dict:
+        self.last_used = time.monotonic()
+        attempts = CLIENT_MAX_RETRIES + 1 if retry else 1
+        for attempt in range(attempts):
+            try:
+                return await self._send(name, method, path, x_request_id, body)
+            except Exception as e:
+                if (
+                    attempt == attempts - 1
+                    or isinstance(e, (CircuitOpenError, RateLimitExceeded))
+                    or not is_transient(e)
+                ):
+                    raise
+                logger.debug("Retrying Cashfree %s after %s", name, e)
+            metrics.inc(metrics.cashfree_api_retries_total, method=name)
+            await asyncio.sleep(backoff(attempt))
+
+    async def create_order(
+        self, create_order_request: "CreateOrderRequest", x_request_id: str
+    ) -> "OrderEntity":
+        from cashfree_pg.models.order_entity import OrderEntity
+
+        data = await self._request(
+            "create_order",
+            "POST",
+            "/orders",
+            x_request_id,
+            body=create_order_request.to_dict(),
+        )
+        return OrderEntity.from_dict(data)
+
+    async def fetch_order(
+        self, order_id: str, x_request_id: str, hedge: bool = False
+    ) -> "OrderEntity":
+        from cashfree_pg.models.order_entity import OrderEntity
+
+        def fetch():
+            return self._request(
+                "fetch_order",
+                "GET",
+                f"/orders/{quote(order_id, safe='')}",
+                x_request_id,
+                retry=True,
+            )
+
+        if hedge and self.config.hedge_delay:
+            data = await ahedged(fetch, self.config.hedge_delay)
+        else:
+            data = await fetch()
+        return OrderEntity.from_dict(data)
+
+    async def create_refund(
+        self,
+        order_id: str,
+        create_refund_request: "OrderCreateRefundRequest",
+        x_request_id: str,
+    ) -> "RefundEntity":
+        from cashfree_pg.exceptions import ApiException
+        from cashfree_pg.models.refund_entity import RefundEntity
+
+        try:
+            data = await self._request(
+                "create_refund",
+                "POST",
+                f"/orders/{quote(order_id, safe='')}/refunds",
+                x_request_id,
+                body=create_refund_request.to_dict(),
+                retry=True,
+            )
+        except ApiException as e:
+            if e.status != 409:
+                raise
+            return await self.fetch_refund(
+                order_id=order_id,
+                refund_id=create_refund_request.refund_id,
+                x_request_id=x_request_id,
+            )
+        return RefundEntity.from_dict(data)
+
+    async def fetch_refund(
+        self, order_id: str, refund_id: str, x_request_id: str
+    ) -> "RefundEntity":
+        from cashfree_pg.models.refund_entity import RefundEntity
+
+        data = await self._request(
+            "fetch_refund",
+            "GET",
+            f"/orders/{quote(order_id, safe='')}/refunds/{quote(refund_id, safe='')}",
+            x_request_id,
+            retry=True,
+        )
+        return RefundEntity.from_dict(data)
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+class ThreadedCashfreeClient:
+    """
+    Async interface to a ``CashfreeClient`` running on the bounded executor, used
+    when ``httpx`` is not installed
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.config = client.config
+        self.loop = asyncio.get_running_loop()
+        self.last_used = time.monotonic()
+
+    async def create_order(self, **kwargs):
+        return await run_blocking(self.client.create_order, **kwargs)
+
+    async def fetch_order(self, **kwargs):
+        return await run_blocking(self.client.fetch_order, **kwargs)
+
+    async def create_refund(self, **kwargs):
+        return await run_blocking(self.client.create_refund, **kwargs)
+
+    async def fetch_refund(self, **kwargs):
+        return await run_blocking(self.client.fetch_refund, **kwargs)
+
+    async def aclose(self):
+        pass
+
+
+class AsyncClientRegistry:
+    """
+    Async clients keyed by (event, environment, merchant account) for the running
+    event loop
+
+    A client is replaced when the credentials for its key change or it was created
+    on another event loop, and closed once it has been idle for ``idle_timeout``.
+    """
+
+    def __init__(self, idle_timeout: float = CLIENT_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._clients = {}
+
+    async def get(self, event_id, config: CashfreeConfig):
+        loop = asyncio.get_running_loop()
+        key = (event_id, config.sandbox, config.client_id)
+        await self._evict_idle(loop)
+        client = self._clients.get(key)
+        if client is None or client.config != config or client.loop is not loop:
+            if client is not None and client.loop is loop:
+                await client.aclose()
+            logger.debug("Creating async Cashfree client for %s", key)
+            try:
+                client = AsyncCashfreeClient(config)
+            except ImportError:
+                client = ThreadedCashfreeClient(get_client(event_id, config))
+            self._clients[key] = client
+        client.last_used = time.monotonic()
+        return client
+
+    async def _evict_idle(self, loop):
+        deadline = time.monotonic() - self.idle_timeout
+        for key, client in list(self._clients.items()):
+            if client.last_used < deadline:
+                logger.debug("Closing idle async Cashfree client for %s", key)
+                del self._clients[key]
+                if client.loop is loop:
+                    await client.aclose()
+
+
+registry = AsyncClientRegistry()
+
+
+async def get_async_client(event_id, config: CashfreeConfig):
+    return await registry.get(event_id, config)
@@ -0,0 +1,170 @@
+import contextvars
+import glob
+import gzip
+import json
+import logging
+import mmap
+import os
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from django.conf import settings
+
+from .constants import (
+    WEBHOOK_CAPTURE_HEADERS,
+    WEBHOOK_CAPTURE_KEEP,
+    WEBHOOK_CAPTURE_MAX_BYTES,
+)
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+_paused = contextvars.ContextVar("cashfree_capture_paused", default=False)
+
+
+@dataclass(frozen=True, slots=True)
+class CapturedWebhook:
+    time: float
+    headers: dict
+    body: bytes
+
+
+def capture_path() -> str:
+    """
+    The capture log configured with ``webhook_capture`` in pretix.cfg, empty if off
+    """
+    return settings.CONFIG_FILE.get("pretix_cashfree", "webhook_capture", fallback="")
+
+
+def _rotated_files(path):
+    rotated = []
+    for name in glob.glob(f"{glob.escape(path)}.*"):
+        suffix = name.removeprefix(f"{path}.")
+        if suffix.isdigit():
+            rotated.append((int(suffix), name))
+    return [name for _, name in sorted(rotated)]
+
+
+def capture_files(path: str) -> list:
+    """
+    The rotated files of the capture log at ``path``, oldest first, and the log itself
+    """
+    files = _rotated_files(path)
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def _rotate(path):
+    max_bytes = int(
+        settings.CONFIG_FILE.get(
+            "pretix_cashfree",
+            "webhook_capture_max_bytes",
+            fallback=WEBHOOK_CAPTURE_MAX_BYTES,
+        )
+    )
+    keep = int(
+        settings.CONFIG_FILE.get(
+            "pretix_cashfree", "webhook_capture_keep", fallback=WEBHOOK_CAPTURE_KEEP
+        )
+    )
+    try:
+        if os.stat(path).st_size < max_bytes:
+            return
+        os.replace(path, f"{path}.{time.time_ns()}")
+    except FileNotFoundError:
+        # Not written yet, or another worker rotated it first
+        return
+    rotated = _rotated_files(path)
+    for name in rotated[: max(len(rotated) - keep, 0)]:
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def capture_paused():
+    """
+    Do not capture the webhooks handled within the block, e.g. replayed ones
+    """
+    token = _paused.set(True)
+    try:
+        yield
+    finally:
+        _paused.reset(token)
+
+
+def capture_webhook(request):
+    """
+    Append a webhook request to the capture log, if one is configured
+
+    Every record is a gzip member of its own, written with a single append, so the
+    records of concurrent workers do not interleave and the log reads as one gzip
+    file. Capturing never fails the webhook.
+    """
+    path = capture_path()
+    if not path or _paused.get():
+        return
+    try:
+        record = {
+            "t": time.time(),
+            "headers": {
+                name: request.headers[name]
+                for name in WEBHOOK_CAPTURE_HEADERS
+                if name in request.headers
+            },
+            "body": request.body.decode("utf-8", "surrogateescape"),
+        }
+        data = gzip.compress(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+        _rotate(path)
+        # Captured bodies hold buyers' details, only the pretix user may read them
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+    except Exception:
+        logger.exception("Could not capture webhook to %s", path)
+
+
+def _snapshot(files):
+    snapshot = []
+    for name in files:
+        try:
+            with open(name, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size:
+                    # The mapping outlives the file being rotated or pruned
+                    snapshot.append(
+                        (name, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ))
+                    )
+        except FileNotFoundError:
+            logger.warning("Capture log %s was rotated away before replay", name)
+    return snapshot
+
+
+def _read_records(snapshot):
+    for name, data in snapshot:
+        with data, gzip.open(data, "rt", encoding="ascii") as f:
+            try:
+                for line in f:
+                    record = json.loads(line)
+                    yield CapturedWebhook(
+                        time=record["t"],
+                        headers=record["headers"],
+                        body=record["body"].encode("utf-8", "surrogateescape"),
+                    )
+            except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+                # A worker was killed while appending, the records before are intact
+                logger.warning("Capture log %s is truncated: %s", name, e)
+
+
+def read_capture(files):
+    """
+    The ``CapturedWebhook`` records of capture log ``files`` in order
+
+    The files are read as they are when this is called, webhooks captured later and
+    rotating the log in the meantime do not change the records.
+    """
+    return _read_records(_snapshot(files))
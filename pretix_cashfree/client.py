@@ -0,0 +1,328 @@
+from typing import TYPE_CHECKING
+
+import json
+import logging
+import threading
+import time
+import urllib3
+from dataclasses import dataclass
+from urllib.parse import quote
+
+from . import metrics
+from .constants import (
+    CLIENT_IDLE_TIMEOUT,
+    CLIENT_MAX_RETRIES,
+    CLIENT_POOL_MAXSIZE,
+    CLIENT_TIMEOUTS,
+    HOST_PRODUCTION,
+    HOST_SANDBOX,
+    X_API_VERSION,
+)
+from .ratelimit import RateLimitExceeded, SharedRateLimiter
+from .resilience import CircuitBreaker, CircuitOpenError, backoff, hedged, is_transient
+
+if TYPE_CHECKING:
+    # The SDK pulls in pydantic and its API client, it is imported on first use
+    from cashfree_pg.models.create_order_request import CreateOrderRequest
+    from cashfree_pg.models.order_create_refund_request import OrderCreateRefundRequest
+    from cashfree_pg.models.order_entity import OrderEntity
+    from cashfree_pg.models.refund_entity import RefundEntity
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+
+@dataclass(frozen=True)
+class CashfreeConfig:
+    """
+    Immutable set of credentials and environment used to talk to Cashfree
+    """
+
+    client_id: str
+    client_secret: str
+    sandbox: bool
+    api_version: str = X_API_VERSION
+    api_url: str = ""
+    # Delay after which a slow order fetch on the return path is sent a second time
+    hedge_delay: float = 0
+    # API calls per second shared by all workers using this client_id, 0 for no limit
+    rate_limit: float = 0
+
+    @property
+    def host(self):
+        if self.api_url:
+            return self.api_url
+        return HOST_SANDBOX if self.sandbox else HOST_PRODUCTION
+
+
+def raise_for_status(response: urllib3.HTTPResponse):
+    """
+    Raise the ``cashfree_pg`` exception matching an unsuccessful response
+    """
+    if 200 <= response.status <= 299:
+        return
+    from cashfree_pg.exceptions import (
+        ApiException,
+        BadRequestException,
+        ForbiddenException,
+        NotFoundException,
+        ServiceException,
+        UnauthorizedException,
+    )
+    from cashfree_pg.rest import RESTResponse
+
+    http_resp = RESTResponse(response)
+    match response.status:
+        case 400:
+            raise BadRequestException(http_resp=http_resp)
+        case 401:
+            raise UnauthorizedException(http_resp=http_resp)
+        case 403:
+            raise ForbiddenException(http_resp=http_resp)
+        case 404:
+            raise NotFoundException(http_resp=http_resp)
+        case status if 500 <= status <= 599:
+            raise ServiceException(http_resp=http_resp)
+    raise ApiException(http_resp=http_resp)
+
+
+def breaker_for(config: CashfreeConfig) -> CircuitBreaker:
+    """
+    The circuit breaker of a merchant account, shared by all workers using it
+    """
+    return CircuitBreaker(f"{config.host}:{config.client_id}")
+
+
+class CashfreeClient:
+    """
+    Thin client for the Cashfree PG endpoints used by this plugin.
+
+    Unlike ``cashfree_pg.Cashfree``, which keeps credentials in class attributes and
+    reconfigures a process-wide ``ApiClient`` on every call, each instance owns its
+    configuration and a keep-alive connection pool. Connections are reused across
+    requests, so the TCP and TLS handshake is only paid once per pooled connection.
+
+    Every call has a connect and read timeout. Idempotent calls are retried on
+    transient errors, and all calls go through a circuit breaker shared by every
+    worker talking to the same Cashfree host. With a ``rate_limit`` configured,
+    calls wait for the rate limit shared by all workers using the same client_id.
+    """
+
+    def __init__(self, config: CashfreeConfig, maxsize: int = CLIENT_POOL_MAXSIZE):
+        self.config = config
+        self.last_used = time.monotonic()
+        self.breaker = breaker_for(config)
+        self.limiter = (
+            SharedRateLimiter(config.client_id, config.rate_limit)
+            if config.rate_limit
+            else None
+        )
+        self.pool = urllib3.PoolManager(
+            num_pools=1,
+            maxsize=maxsize,
+            block=False,
+            retries=False,
+            headers={
+                "Accept": "application/json",
+                "Content-Type": "application/json",
+                "x-api-version": config.api_version,
+                "x-client-id": config.client_id,
+                "x-client-secret": config.client_secret,
+            },
+        )
+
+    def _send(self, name: str, method: str, path: str, x_request_id: str, body=None):
+        # Rate limited before the breaker, so a refused call never holds the probe
+        if self.limiter:
+            self.limiter.acquire()
+        probe = self.breaker.allow()
+        connect, read = CLIENT_TIMEOUTS[name]
+        try:
+            with metrics.timed(
+                metrics.cashfree_api_duration_seconds,
+                f"api.{name}",
+                x_request_id=x_request_id,
+                method=name,
+            ):
+                response = self.pool.request(
+                    method,
+                    f"{self.config.host}{path}",
+                    body=json.dumps(body) if body is not None else None,
+                    headers={**self.pool.headers, "x-request-id": x_request_id},
+                    timeout=urllib3.Timeout(connect=connect, read=read),
+                )
+                raise_for_status(response)
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure(probe)
+            else:
+                self.breaker.record_success(probe)
+            raise
+        self.breaker.record_success(probe)
+        return json.loads(response.data)
+
+    def _request(
+        self,
+        name: str,
+        method: str,
+        path: str,
+        x_request_id: str,
+        body=None,
+        retry=False,
+    ) -> dict:
+        """
+        Call the Cashfree API, retrying transient errors with jittered backoff if
+        ``retry`` is set. Only idempotent calls may be retried.
+        """
+        self.last_used = time.monotonic()
+        attempts = CLIENT_MAX_RETRIES + 1 if retry else 1
+        for attempt in range(attempts):
+            try:
+                return self._send(name, method, path, x_request_id, body)
+            except Exception as e:
+                if (
+                    attempt == attempts - 1
+                    or isinstance(e, (CircuitOpenError, RateLimitExceeded))
+                    or not is_transient(e)
+                ):
+                    raise
+                logger.debug("Retrying Cashfree %s after %s", name, e)
+            metrics.inc(metrics.cashfree_api_retries_total, method=name)
+            time.sleep(backoff(attempt))
+
+    def create_order(
+        self, create_order_request: "CreateOrderRequest", x_request_id: str
+    ) -> "OrderEntity":
+        from cashfree_pg.models.order_entity import OrderEntity
+
+        data = self._request(
+            "create_order",
+            "POST",
+            "/orders",
+            x_request_id,
+            body=create_order_request.to_dict(),
+        )
+        return OrderEntity.from_dict(data)
+
+    def fetch_order(
+        self, order_id: str, x_request_id: str, hedge: bool = False
+    ) -> "OrderEntity":
+        """
+        Fetch an order, a slow fetch is hedged with a second one if ``hedge`` is set
+        and ``hedge_delay`` is configured
+        """
+        from cashfree_pg.models.order_entity import OrderEntity
+
+        def fetch():
+            return self._request(
+                "fetch_order",
+                "GET",
+                f"/orders/{quote(order_id, safe='')}",
+                x_request_id,
+                retry=True,
+            )
+
+        if hedge and self.config.hedge_delay:
+            data = hedged(fetch, self.config.hedge_delay)
+        else:
+            data = fetch()
+        return OrderEntity.from_dict(data)
+
+    def create_refund(
+        self,
+        order_id: str,
+        create_refund_request: "OrderCreateRefundRequest",
+        x_request_id: str,
+    ) -> "RefundEntity":
+        """
+        Create a refund, retried safely as Cashfree deduplicates it by ``refund_id``
+
+        A refund which already exists, e.g. because a retried call had reached
+        Cashfree before, is fetched instead.
+        """
+        from cashfree_pg.exceptions import ApiException
+        from cashfree_pg.models.refund_entity import RefundEntity
+
+        try:
+            data = self._request(
+                "create_refund",
+                "POST",
+                f"/orders/{quote(order_id, safe='')}/refunds",
+                x_request_id,
+                body=create_refund_request.to_dict(),
+                retry=True,
+            )
+        except ApiException as e:
+            if e.status != 409:
+                raise
+            return self.fetch_refund(
+                order_id=order_id,
+                refund_id=create_refund_request.refund_id,
+                x_request_id=x_request_id,
+            )
+        return RefundEntity.from_dict(data)
+
+    def fetch_refund(
+        self, order_id: str, refund_id: str, x_request_id: str
+    ) -> "RefundEntity":
+        from cashfree_pg.models.refund_entity import RefundEntity
+
+        data = self._request(
+            "fetch_refund",
+            "GET",
+            f"/orders/{quote(order_id, safe='')}/refunds/{quote(refund_id, safe='')}",
+            x_request_id,
+            retry=True,
+        )
+        return RefundEntity.from_dict(data)
+
+    def close(self):
+        self.pool.clear()
+
+
+class ClientRegistry:
+    """
+    Process-wide registry of ``CashfreeClient`` instances keyed by (event, environment,
+    merchant account)
+
+    A client is replaced when the credentials for its key change and closed once it
+    has not been used for ``idle_timeout`` seconds.
+    """
+
+    def __init__(self, idle_timeout: float = CLIENT_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, event_id, config: CashfreeConfig) -> CashfreeClient:
+        key = (event_id, config.sandbox, config.client_id)
+        with self._lock:
+            self._evict_idle()
+            client = self._clients.get(key)
+            if client is None or client.config != config:
+                if client is not None:
+                    client.close()
+                logger.debug("Creating Cashfree client for %s", key)
+                client = self._clients[key] = CashfreeClient(config)
+            client.last_used = time.monotonic()
+            return client
+
+    def _evict_idle(self):
+        deadline = time.monotonic() - self.idle_timeout
+        for key, client in list(self._clients.items()):
+            if client.last_used < deadline:
+                logger.debug("Closing idle Cashfree client for %s", key)
+                client.close()
+                del self._clients[key]
+
+    def clear(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+
+registry = ClientRegistry()
+
+
+def get_client(event_id, config: CashfreeConfig) -> CashfreeClient:
+    return registry.get(event_id, config)
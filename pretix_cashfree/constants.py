@@ -4,8 +4,128 @@ RETURN_URL_PARAM = "order_id"
 REDIRECT_URL_PAYMENT_SESSION_ID = "payment_session_id"
 REDIRECT_URL_MODE = "mode"
 WEBHOOK_TYPE_PAYMENT = "PAYMENT_SUCCESS_WEBHOOK"
+WEBHOOK_TYPE_REFUND = "REFUND_STATUS_WEBHOOK"
+WEBHOOK_ROUTE_TAG = "pretix_route"
+WEBHOOK_ROUTE_SALT = "pretix_cashfree.webhooks.route"
 PAYMENT_STATUS_SUCCESS = "SUCCESS"
+REFUND_STATUS_SUCCESS = "SUCCESS"
+REFUND_STATUS_CANCELLED = "CANCELLED"
 DATE_FORMAT = "SHORT_DATETIME_FORMAT"
 
 SUPPORTED_CURRENCIES = ["INR"]
 SUPPORTED_COUNTRY_CODES = [91]
+
+HOST_PRODUCTION = "https://api.cashfree.com/pg"
+HOST_SANDBOX = "https://sandbox.cashfree.com/pg"
+CLIENT_POOL_MAXSIZE = 10
+CLIENT_IDLE_TIMEOUT = 300
+
+WEBHOOK_INBOX_BATCH_SIZE = 100
+WEBHOOK_INBOX_MAX_ATTEMPTS = 5
+WEBHOOK_INBOX_LOCK_TIMEOUT = 60
+WEBHOOK_INBOX_SCHEDULE_DEBOUNCE = 1
+
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+SINGLE_FLIGHT_WAIT_TIMEOUT = 10
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+SINGLE_FLIGHT_RESULT_TTL = 30
+
+ORDER_STATUS_CACHE_TTL = {
+    "ACTIVE": 5,
+    "TERMINATION_REQUESTED": 5,
+    "PAID": 24 * 3600,
+    "EXPIRED": 24 * 3600,
+    "TERMINATED": 24 * 3600,
+}
+ORDER_STATUS_CACHE_DEFAULT_TTL = 5
+
+RECONCILE_CHUNK_SIZE = 200
+RECONCILE_WORKERS = 4
+RECONCILE_RATE_LIMIT = 10
+RECONCILE_MIN_AGE_MINUTES = 15
+
+REFUND_CHUNK_SIZE = 100
+REFUND_CONCURRENCY = 4
+REFUND_RATE_LIMIT = 5
+REFUND_SCHEDULE_DEBOUNCE = 30
+# Key set in the info of refunds queued by execute_refund, looked up by name only
+REFUND_QUEUED_KEY = "cashfree_queued"
+REFUND_POLL_INTERVAL_MINUTES = 15
+
+IDEMPOTENCY_LRU_SIZE = 10000
+# Another process may still fail and discard a key, its local copy must expire soon
+IDEMPOTENCY_LRU_TTL = 10
+WEBHOOK_IDEMPOTENCY_TTL = 7 * 24 * 3600
+
+# (connect, read) timeouts in seconds per Cashfree API method
+CLIENT_TIMEOUTS = {
+    "create_order": (3.05, 10),
+    "fetch_order": (3.05, 5),
+    "create_refund": (3.05, 10),
+    "fetch_refund": (3.05, 5),
+}
+CLIENT_MAX_RETRIES = 2
+CLIENT_BACKOFF_BASE = 0.2
+CLIENT_BACKOFF_MAX = 2
+CLIENT_HEDGE_WORKERS = 8
+
+BREAKER_FAILURE_THRESHOLD = 10
+BREAKER_WINDOW = 30
+BREAKER_COOLDOWN = 30
+
+PRIORITY_CRITICAL = "critical"
+PRIORITY_BACKGROUND = "background"
+# Share of the rate limit usable by and maximum wait in seconds of each priority
+RATE_LIMIT_PRIORITIES = {
+    PRIORITY_CRITICAL: (1.0, 2),
+    PRIORITY_BACKGROUND: (0.5, 30),
+}
+
+# Upper bound for reusing a Cashfree payment session, capped by the order expiry
+PAYMENT_SESSION_TTL = 24 * 3600
+# A session about to expire within this many seconds is not reused
+PAYMENT_SESSION_MARGIN = 5 * 60
+
+REDIRECT_MODE_JS = "js"
+REDIRECT_MODE_SERVER = "server"
+REDIRECT_TIMING_SALT = "pretix_cashfree.views.redirect_timing"
+# Seconds a redirect page may report its hand-off timing after it was rendered
+REDIRECT_TIMING_MAX_AGE = 120
+HOSTED_CHECKOUT_PRODUCTION = "https://payments.cashfree.com/order/#"
+HOSTED_CHECKOUT_SANDBOX = "https://payments-test.cashfree.com/order/#"
+
+# Days after their last update PaymentAttempts are pruned, by Cashfree order status.
+# None keeps them forever, "unknown" covers attempts without a status.
+RETENTION_DAYS = {
+    "ACTIVE": 180,
+    "EXPIRED": 90,
+    "TERMINATED": 90,
+    "TERMINATION_REQUESTED": 90,
+    "unknown": 180,
+}
+# Kept forever, late refunds, refund webhooks and settlements are attributed through them
+RETENTION_KEPT_STATUSES = ("PAID",)
+RETENTION_INBOX_DAYS = 30
+RETENTION_CHUNK_SIZE = 500
+# Rough storage cost of a row and its index entries beyond its text columns
+RETENTION_ROW_OVERHEAD = 120
+
+# Threads for blocking ORM and cache work of the async views, per process
+ASYNC_EXECUTOR_WORKERS = 8
+
+SETTLEMENT_CHUNK_SIZE = 500
+# Cashfree's settlement reports state times without an offset in Indian time
+SETTLEMENT_REPORT_TIMEZONE = "Asia/Kolkata"
+# Exports up to this size are assembled in memory, larger ones in a temporary file
+EXPORT_SPOOL_SIZE = 4 * 1024 * 1024
+
+# Request headers stored with a captured webhook, the body is stored as received
+WEBHOOK_CAPTURE_HEADERS = (
+    "content-type",
+    "x-webhook-signature",
+    "x-webhook-timestamp",
+    "x-webhook-version",
+)
+WEBHOOK_CAPTURE_MAX_BYTES = 64 * 1024 * 1024
+WEBHOOK_CAPTURE_KEEP = 10
+REPLAY_CONCURRENCY = 4
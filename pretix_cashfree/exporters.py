@@ -0,0 +1,85 @@
+import io
+import tempfile
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from django import forms
+from django.utils.timezone import make_aware
+from django.utils.translation import gettext_lazy as _, pgettext_lazy
+from pretix.base.exporter import BaseExporter
+from pretix.base.forms.widgets import DatePickerWidget
+
+from .constants import EXPORT_SPOOL_SIZE
+from .settlements import iter_rows, write_rows
+
+CONTENT_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+class SettlementExporter(BaseExporter):
+    """
+    Cashfree payments and refunds of an organizer, matched with Cashfree's settlements
+    """
+
+    identifier = "cashfree_settlements"
+    verbose_name = _("Cashfree payments and settlements")
+    category = pgettext_lazy("export_category", "Payments")
+    description = _(
+        "All Cashfree payments and refunds along with the settlement they were paid "
+        "out in, according to the imported Cashfree settlement reports. Entries that "
+        "do not match are flagged."
+    )
+
+    @property
+    def export_form_fields(self):
+        return OrderedDict(
+            [
+                (
+                    "date_from",
+                    forms.DateField(
+                        label=_("Start date"),
+                        widget=DatePickerWidget,
+                        required=False,
+                    ),
+                ),
+                (
+                    "date_to",
+                    forms.DateField(
+                        label=_("End date"),
+                        widget=DatePickerWidget,
+                        required=False,
+                    ),
+                ),
+                (
+                    "format",
+                    forms.ChoiceField(
+                        label=_("Format"),
+                        choices=(("csv", "CSV"), ("jsonl", "JSON Lines")),
+                        initial="csv",
+                    ),
+                ),
+            ]
+        )
+
+    def _day_start(self, value):
+        return make_aware(
+            datetime.combine(date.fromisoformat(str(value)), time.min), self.timezone
+        )
+
+    def render(self, form_data: dict, output_file=None):
+        format = form_data.get("format") or "csv"
+        start = end = None
+        if form_data.get("date_from"):
+            start = self._day_start(form_data["date_from"])
+        if form_data.get("date_to"):
+            end = self._day_start(form_data["date_to"]) + timedelta(days=1)
+
+        # Rows are written as they are read, straight into pretix's file if possible
+        out = output_file or tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+        text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+        write_rows(text, iter_rows(self.events, start, end, tz=self.timezone), format)
+        text.detach()
+
+        filename = f"{self.organizer.slug}_cashfree_settlements.{format}"
+        if output_file:
+            return filename, CONTENT_TYPES[format], None
+        out.seek(0)
+        return filename, CONTENT_TYPES[format], out.read()
@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.utils.timezone import now
+
+from .constants import (
+    IDEMPOTENCY_LRU_SIZE,
+    IDEMPOTENCY_LRU_TTL,
+    WEBHOOK_IDEMPOTENCY_TTL,
+)
+from .models import IdempotencyKey
+from .retention import delete_in_chunks
+from .utils import cache
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+
+def digest(payload) -> str:
+    """
+    Compact fingerprint of a payload, stored instead of the payload itself
+    """
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe in-process map with per-entry expiry
+    """
+
+    def __init__(self, maxsize=IDEMPOTENCY_LRU_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class IdempotencyStore:
+    """
+    Remembers which keys have been seen within ``ttl`` seconds
+
+    Lookups go through three layers: a per-process LRU which absorbs hot retries,
+    the shared cache with an atomic ``add`` and finally a database table, so that
+    keys survive a cache flush. ``discard`` only reaches the LRU of its own process,
+    so keys are kept there for ``lru_ttl`` seconds only and a retry of a discarded
+    key gets through every process soon after.
+    """
+
+    def __init__(
+        self,
+        namespace,
+        ttl,
+        lru_size=IDEMPOTENCY_LRU_SIZE,
+        lru_ttl=IDEMPOTENCY_LRU_TTL,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.lru_ttl = min(ttl, lru_ttl)
+        self.lru = LRUCache(lru_size)
+
+    def _key(self, key):
+        return f"plugins:pretix_cashfree:idempotency:{self.namespace}:{key}"
+
+    def _claim_durable(self, key, value) -> bool:
+        expires = now() + timedelta(seconds=self.ttl)
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(key=key, digest=value, expires=expires)
+            return True
+        except IntegrityError:
+            # An expired row counts as absent, take it over
+            return bool(
+                IdempotencyKey.objects.filter(key=key, expires__lt=now()).update(
+                    digest=value, expires=expires
+                )
+            )
+
+    def add(self, key, payload=b"") -> bool:
+        """
+        Record ``key``, returns ``False`` if it has already been recorded
+        """
+        key = self._key(key)
+        value = digest(payload)
+
+        seen = self.lru.get(key)
+        if seen is None:
+            if not cache.add(key, value, timeout=self.ttl):
+                seen = cache.get(key, value)
+            elif not self._claim_durable(key, value):
+                seen = (
+                    IdempotencyKey.objects.filter(key=key)
+                    .values_list("digest", flat=True)
+                    .first()
+                )
+        self.lru.set(key, value if seen is None else seen, self.lru_ttl)
+
+        if seen is None:
+            return True
+        if seen != value:
+            logger.warning("Idempotency key %s was reused with another payload", key)
+        return False
+
+    def discard(self, key):
+        """
+        Forget ``key`` again, e.g. because processing it failed and should be retried
+        """
+        key = self._key(key)
+        self.lru.delete(key)
+        cache.delete(key)
+        IdempotencyKey.objects.filter(key=key).delete()
+
+
+def prune_idempotency_keys() -> int:
+    return delete_in_chunks(IdempotencyKey.objects.filter(expires__lt=now()))
+
+
+webhook_store = IdempotencyStore("webhook", ttl=WEBHOOK_IDEMPOTENCY_TTL)
@@ -0,0 +1,33 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+
+from pretix_cashfree.constants import SETTLEMENT_CHUNK_SIZE
+from pretix_cashfree.settlements import import_settlements
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a Cashfree settlement report in CSV format, to match it with payments "
+        "and refunds in the settlement export"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("report", help="Path to the report, - for stdin")
+        parser.add_argument("--chunk-size", type=int, default=SETTLEMENT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["report"] == "-":
+            report = self._import(sys.stdin, options["chunk_size"])
+        else:
+            with open(options["report"], newline="", encoding="utf-8-sig") as f:
+                report = self._import(f, options["chunk_size"])
+        self.stdout.write(
+            f"Imported {report.rows} settlement entries, skipped {report.skipped}, "
+            f"in {report.duration:.1f}s"
+        )
+
+    def _import(self, lines, chunk_size):
+        try:
+            return import_settlements(lines, chunk_size=chunk_size)
+        except ValueError as e:
+            raise CommandError(str(e)) from e
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+
+from pretix_cashfree.constants import RETENTION_CHUNK_SIZE, RETENTION_KEPT_STATUSES
+from pretix_cashfree.retention import prune, retention_policy
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive or delete Cashfree payment attempts, webhook inbox events and "
+        "idempotency keys past their retention period"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=RETENTION_CHUNK_SIZE)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be removed and how much space it takes",
+        )
+        parser.add_argument(
+            "--no-archive",
+            action="store_true",
+            help="Delete payment attempts instead of archiving them",
+        )
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        for status, days in retention_policy().items():
+            self.stdout.write(
+                f"  {status}: {'kept' if days is None else f'{days} days'}"
+            )
+        for status in RETENTION_KEPT_STATUSES:
+            self.stdout.write(f"  {status}: kept")
+
+        report = prune(
+            dry_run=options["dry_run"],
+            chunk_size=options["chunk_size"],
+            archive=False if options["no_archive"] else None,
+        )
+        verb = "Would remove" if options["dry_run"] else "Removed"
+        self.stdout.write(
+            f"{verb} {sum(report.attempts.values())} payment attempts with "
+            f"{report.history} history entries, {report.inbox_events} inbox events "
+            f"and {report.idempotency_keys} idempotency keys, about "
+            f"{report.bytes / 1024 / 1024:.1f} MiB, in {report.duration:.1f}s"
+        )
+        for status, count in sorted(report.attempts.items()):
+            self.stdout.write(f"  {status}: {count}")
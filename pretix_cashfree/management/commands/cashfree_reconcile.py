@@ -0,0 +1,61 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from pretix_cashfree.constants import (
+    RECONCILE_CHUNK_SIZE,
+    RECONCILE_MIN_AGE_MINUTES,
+    RECONCILE_RATE_LIMIT,
+    RECONCILE_WORKERS,
+)
+from pretix_cashfree.reconciliation import reconcile_payments
+
+
+class Command(BaseCommand):
+    help = "Reconcile open Cashfree payments with their order status at Cashfree"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=RECONCILE_CHUNK_SIZE)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=RECONCILE_WORKERS,
+            help="Number of concurrent requests to Cashfree",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=RECONCILE_RATE_LIMIT,
+            help="Maximum number of requests to Cashfree per second",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=RECONCILE_MIN_AGE_MINUTES,
+            help="Only check payments created at least this many minutes ago",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report mismatches without updating payments",
+        )
+
+    def handle(self, *args, **options):
+        report = reconcile_payments(
+            chunk_size=options["chunk_size"],
+            workers=options["workers"],
+            rate=options["rate"],
+            older_than=now() - timedelta(minutes=options["min_age"]),
+            dry_run=options["dry_run"],
+            on_mismatch=lambda m: self.stdout.write(
+                f"{m.payment_id}: {m.payment_state} in pretix, {m.order_status} at Cashfree"
+            ),
+        )
+        self.stdout.write(
+            f"Checked {report.checked} payments in {report.duration:.1f}s "
+            f"({report.throughput:.1f}/s): {sum(report.mismatches.values())} mismatches, "
+            f"{report.updated} updated, {report.missing} not found at Cashfree, "
+            f"{report.errors} errors"
+        )
+        for status, count in sorted(report.mismatches.items()):
+            self.stdout.write(f"  {status}: {count}")
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django_scopes import scopes_disabled
+from pretix.base.models import Event
+
+from pretix_cashfree.constants import (
+    REFUND_CHUNK_SIZE,
+    REFUND_CONCURRENCY,
+    REFUND_RATE_LIMIT,
+)
+from pretix_cashfree.refunds import execute_refunds, queued_refunds
+
+
+class Command(BaseCommand):
+    help = (
+        "Submit queued Cashfree refunds in bulk. Interrupted runs can be restarted, "
+        "refunds already known to Cashfree are not submitted twice."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--event", help="Limit to one event, given as organizer/event slug"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=REFUND_CONCURRENCY,
+            help="Number of concurrent requests to Cashfree",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=REFUND_RATE_LIMIT,
+            help="Maximum number of requests to Cashfree per second",
+        )
+        parser.add_argument("--chunk-size", type=int, default=REFUND_CHUNK_SIZE)
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        queryset = queued_refunds()
+        if options["event"]:
+            try:
+                organizer, event = options["event"].split("/")
+                event = Event.objects.get(organizer__slug=organizer, slug=event)
+            except (ValueError, Event.DoesNotExist):
+                raise CommandError("Event not found")
+            queryset = queryset.filter(order__event=event)
+
+        total = queryset.count()
+        self.stdout.write(f"{total} refunds queued")
+
+        report = execute_refunds(
+            queryset,
+            concurrency=options["concurrency"],
+            rate=options["rate"],
+            chunk_size=options["chunk_size"],
+            progress=lambda r: self.stdout.write(
+                f"{r.submitted + r.failed + r.deferred}/{total} processed: "
+                f"{r.submitted} submitted, {r.failed} failed, {r.deferred} deferred"
+            ),
+        )
+        self.stdout.write(
+            f"Submitted {report.submitted} refunds in {report.duration:.1f}s "
+            f"({report.throughput:.1f}/s), {report.failed} failed, "
+            f"{report.deferred} deferred to the next run"
+        )
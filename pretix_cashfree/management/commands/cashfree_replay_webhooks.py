@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from itertools import islice
+
+from pretix_cashfree.capture import capture_files, capture_path, read_capture
+from pretix_cashfree.constants import REPLAY_CONCURRENCY
+from pretix_cashfree.replay import http_sender, in_process_sender, replay
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay captured Cashfree webhooks against the webhook view, in this process "
+        "or over HTTP, and report their latency and outcomes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "capture",
+            nargs="*",
+            help="Capture logs to replay, by default the configured webhook_capture",
+        )
+        parser.add_argument(
+            "--url",
+            help="Webhook URL of a running pretix, instead of calling the view here",
+        )
+        parser.add_argument(
+            "--speed",
+            type=float,
+            default=1.0,
+            help="Multiple of the captured rate, 0 sends as fast as possible",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=REPLAY_CONCURRENCY,
+            help="Number of webhooks sent at the same time",
+        )
+        parser.add_argument("--limit", type=int, help="Replay at most this many")
+
+    def handle(self, *args, **options):
+        files = []
+        for path in options["capture"] or [capture_path()]:
+            files.extend(capture_files(path) if path else [])
+        if not files:
+            raise CommandError("No capture log found")
+
+        records = read_capture(files)
+        if options["limit"]:
+            records = islice(records, options["limit"])
+        send = (
+            http_sender(options["url"], options["concurrency"])
+            if options["url"]
+            else in_process_sender()
+        )
+        report = replay(
+            records,
+            send,
+            speed=options["speed"],
+            concurrency=options["concurrency"],
+        )
+        self.stdout.write(
+            f"Replayed {report.sent} webhooks in {report.duration:.1f}s "
+            f"({report.throughput:.1f}/s), up to {report.lag:.1f}s behind schedule"
+        )
+        self.stdout.write(
+            "Latency "
+            + " ".join(
+                f"{label}={report.percentile(p) * 1000:.1f}ms"
+                for label, p in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1))
+            )
+        )
+        for outcome, count in sorted(report.outcomes.items()):
+            self.stdout.write(f"  {outcome}: {count}")
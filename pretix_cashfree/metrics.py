@@ -0,0 +1,330 @@
+import asyncio
+import functools
+import logging
+import socket
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from django.conf import settings
+from pretix.base.metrics import Counter, Histogram
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+# Metrics are stored through a pluggable backend, selected with ``metrics`` in the
+# [pretix_cashfree] section of pretix.cfg:
+#
+# - ``pretix`` (default if pretix metrics are enabled) uses pretix' metrics backend,
+#   exported in Prometheus text format on its /metrics endpoint
+# - ``statsd`` sends them to ``statsd_host``:``statsd_port`` over UDP
+# - ``off`` (default otherwise) disables them
+#
+# Setting ``tracing = on`` additionally records OpenTelemetry spans, if installed.
+
+cashfree_singleflight_calls_total = Counter(
+    "pretix_cashfree_singleflight_calls_total",
+    "Order status fetches by single-flight outcome (leader, coalesced, timeout).",
+    ["outcome"],
+)
+cashfree_singleflight_wait_seconds_total = Counter(
+    "pretix_cashfree_singleflight_wait_seconds_total",
+    "Time spent waiting for an in-flight order status fetch.",
+    ["outcome"],
+)
+cashfree_api_duration_seconds = Histogram(
+    "pretix_cashfree_api_duration_seconds",
+    "Latency of Cashfree API calls by method and outcome.",
+    ["method", "outcome"],
+)
+cashfree_operation_duration_seconds = Histogram(
+    "pretix_cashfree_operation_duration_seconds",
+    "Latency of payment provider operations by outcome.",
+    ["operation", "outcome"],
+)
+cashfree_view_duration_seconds = Histogram(
+    "pretix_cashfree_view_duration_seconds",
+    "Latency of the Cashfree views by response status class.",
+    ["view", "status"],
+)
+cashfree_redirect_handoff_seconds = Histogram(
+    "pretix_cashfree_redirect_handoff_seconds",
+    "Time from loading the redirect page until the buyer is handed to Cashfree.",
+    ["mode"],
+)
+cashfree_webhook_dedupe_total = Counter(
+    "pretix_cashfree_webhook_dedupe_total",
+    "Payment webhooks by idempotency check result (new, duplicate).",
+    ["result"],
+)
+cashfree_circuit_breaker_transitions_total = Counter(
+    "pretix_cashfree_circuit_breaker_transitions_total",
+    "Cashfree circuit breaker state changes by new state (open, closed).",
+    ["state"],
+)
+cashfree_circuit_breaker_rejected_total = Counter(
+    "pretix_cashfree_circuit_breaker_rejected_total",
+    "Cashfree API calls failed fast by an open circuit breaker.",
+    [],
+)
+cashfree_api_retries_total = Counter(
+    "pretix_cashfree_api_retries_total",
+    "Retried Cashfree API calls by method.",
+    ["method"],
+)
+cashfree_hedged_requests_total = Counter(
+    "pretix_cashfree_hedged_requests_total",
+    "Hedged second requests sent for slow Cashfree order fetches.",
+    [],
+)
+cashfree_rate_limit_wait_seconds_total = Counter(
+    "pretix_cashfree_rate_limit_wait_seconds_total",
+    "Time spent waiting for the shared Cashfree rate limit by priority.",
+    ["priority"],
+)
+cashfree_rate_limited_total = Counter(
+    "pretix_cashfree_rate_limited_total",
+    "Cashfree API calls given up after waiting for the rate limit by priority.",
+    ["priority"],
+)
+cashfree_account_routing_total = Counter(
+    "pretix_cashfree_account_routing_total",
+    "New Cashfree orders by merchant account and whether they were rerouted.",
+    ["account", "choice"],
+)
+cashfree_webhook_inbox_exhausted_total = Counter(
+    "pretix_cashfree_webhook_inbox_exhausted_total",
+    "Webhook inbox events given up after the maximum number of attempts.",
+    [],
+)
+cashfree_confirmation_lag_seconds = Histogram(
+    "pretix_cashfree_confirmation_lag_seconds",
+    "Time between a payment at Cashfree and its confirmation in pretix.",
+    ["source"],
+)
+
+
+class NullBackend:
+    enabled = False
+
+    def inc(self, counter, amount, labels):
+        pass
+
+    def observe(self, histogram, amount, labels):
+        pass
+
+
+class PretixBackend(NullBackend):
+    enabled = True
+
+    def inc(self, counter, amount, labels):
+        counter.inc(amount, **labels)
+
+    def observe(self, histogram, amount, labels):
+        histogram.observe(amount, **labels)
+
+
+class StatsdBackend(NullBackend):
+    """
+    Plain statsd over UDP, labels become part of the metric name
+    """
+
+    enabled = True
+
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _name(self, metric, labels):
+        return ".".join([metric.name, *(str(labels[n]) for n in metric.labelnames)])
+
+    def _send(self, line):
+        try:
+            self.socket.sendto(line.encode(), self.address)
+        except OSError as e:
+            logger.debug("Could not send metric to statsd: %s", e)
+
+    def inc(self, counter, amount, labels):
+        self._send(f"{self._name(counter, labels)}:{amount}|c")
+
+    def observe(self, histogram, amount, labels):
+        if histogram.name.endswith("_seconds"):
+            self._send(f"{self._name(histogram, labels)}:{amount * 1000:.3f}|ms")
+        else:
+            self._send(f"{self._name(histogram, labels)}:{amount}|h")
+
+
+def _config(option, fallback):
+    return settings.CONFIG_FILE.get("pretix_cashfree", option, fallback=fallback)
+
+
+@functools.lru_cache(maxsize=None)
+def get_backend():
+    default = "pretix" if settings.METRICS_ENABLED else "off"
+    match _config("metrics", default):
+        case "pretix":
+            return PretixBackend()
+        case "statsd":
+            return StatsdBackend(
+                _config("statsd_host", "localhost"), int(_config("statsd_port", 8125))
+            )
+        case _:
+            return NullBackend()
+
+
+@functools.lru_cache(maxsize=None)
+def get_tracer():
+    if _config("tracing", "off") != "on":
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("Cashfree tracing is enabled, but opentelemetry is missing")
+        return None
+    return trace.get_tracer("pretix_cashfree")
+
+
+def inc(counter, amount=1, **labels):
+    backend = get_backend()
+    if backend.enabled:
+        backend.inc(counter, amount, labels)
+
+
+def observe(histogram, amount, **labels):
+    backend = get_backend()
+    if backend.enabled:
+        backend.observe(histogram, amount, labels)
+
+
+@contextmanager
+def span(name, x_request_id=None, **attributes):
+    """
+    Trace span, carrying the ``x_request_id`` sent to Cashfree if there is one
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        yield None
+        return
+    if x_request_id:
+        attributes["cashfree.x_request_id"] = x_request_id
+    with tracer.start_as_current_span(f"cashfree.{name}", attributes=attributes) as s:
+        yield s
+
+
+def _outcome(e):
+    status = getattr(e, "status", None)
+    return f"{status // 100}xx" if status else type(e).__name__
+
+
+@contextmanager
+def timed(histogram, name, x_request_id=None, **labels):
+    """
+    Record the duration and outcome of the enclosed block in ``histogram``
+    """
+    if not get_backend().enabled and get_tracer() is None:
+        yield
+        return
+    start = time.perf_counter()
+    outcome = "success"
+    with span(name, x_request_id=x_request_id, **labels):
+        try:
+            yield
+        except Exception as e:
+            outcome = _outcome(e)
+            raise
+        finally:
+            observe(histogram, time.perf_counter() - start, outcome=outcome, **labels)
+
+
+def instrumented(operation):
+    """
+    Decorator recording a payment provider operation
+    """
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timed(
+                    cashfree_operation_duration_seconds, operation, operation=operation
+                ):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(
+                cashfree_operation_duration_seconds, operation, operation=operation
+            ):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def instrumented_view(view):
+    """
+    Decorator recording a view by the status class of its response
+    """
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(request, *args, **kwargs):
+                if not get_backend().enabled and get_tracer() is None:
+                    return await fn(request, *args, **kwargs)
+                start = time.perf_counter()
+                status = "5xx"
+                with span(f"view.{view}"):
+                    try:
+                        response = await fn(request, *args, **kwargs)
+                        status = f"{response.status_code // 100}xx"
+                        return response
+                    finally:
+                        observe(
+                            cashfree_view_duration_seconds,
+                            time.perf_counter() - start,
+                            view=view,
+                            status=status,
+                        )
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(request, *args, **kwargs):
+            if not get_backend().enabled and get_tracer() is None:
+                return fn(request, *args, **kwargs)
+            start = time.perf_counter()
+            status = "5xx"
+            with span(f"view.{view}"):
+                try:
+                    response = fn(request, *args, **kwargs)
+                    status = f"{response.status_code // 100}xx"
+                    return response
+                finally:
+                    observe(
+                        cashfree_view_duration_seconds,
+                        time.perf_counter() - start,
+                        view=view,
+                        status=status,
+                    )
+
+        return wrapper
+
+    return decorator
+
+
+def observe_confirmation_lag(paid_at: str, source: str):
+    """
+    Record the time from the payment at Cashfree, as told by a webhook, until now
+    """
+    if not get_backend().enabled:
+        return
+    try:
+        lag = time.time() - datetime.fromisoformat(paid_at).timestamp()
+    except (TypeError, ValueError):
+        return
+    if lag >= 0:
+        observe(cashfree_confirmation_lag_seconds, lag, source=source)
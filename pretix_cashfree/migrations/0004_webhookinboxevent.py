@@ -0,0 +1,48 @@
+# Generated by Django 4.2.24 on 2026-10-16 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretixbase", "0286_alter_event_currency_and_more"),
+        ("pretix_cashfree", "0003_rename_order_id_paymentattempt_reference"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WebhookInboxEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False
+                    ),
+                ),
+                ("reference", models.CharField(max_length=190)),
+                ("event_type", models.CharField(max_length=50)),
+                ("payload", models.TextField()),
+                ("received_at", models.DateTimeField(auto_now_add=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True, null=True)),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="pretixbase.orderpayment",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["processed_at", "id"],
+                        name="pretix_cash_process_973b0b_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.24 on 2026-10-16 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_cashfree", "0004_webhookinboxevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdempotencyKey",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False
+                    ),
+                ),
+                ("key", models.CharField(max_length=190, unique=True)),
+                ("digest", models.CharField(max_length=32)),
+                ("expires", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.24 on 2026-10-16 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_cashfree", "0005_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="paymentattempt",
+            name="payment_session_id",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="paymentattempt",
+            name="session_expires",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 4.2.24 on 2026-10-16 22:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_cashfree", "0006_paymentattempt_session"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="paymentattempt",
+            name="amount",
+            field=models.DecimalField(decimal_places=2, max_digits=13, null=True),
+        ),
+        migrations.AddField(
+            model_name="paymentattempt",
+            name="attempts",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of times the buyer was sent to Cashfree"
+            ),
+        ),
+        migrations.AddField(
+            model_name="paymentattempt",
+            name="cf_order_id",
+            field=models.CharField(blank=True, max_length=190, null=True),
+        ),
+        migrations.AddField(
+            model_name="paymentattempt",
+            name="created",
+            field=models.DateTimeField(
+                auto_now_add=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="paymentattempt",
+            name="status",
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name="paymentattempt",
+            name="updated",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="paymentattempt",
+            index=models.Index(
+                fields=["status", "created"], name="cashfree_attempt_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="paymentattempt",
+            index=models.Index(
+                fields=["session_expires"], name="cashfree_attempt_expires_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="paymentattempt",
+            index=models.Index(
+                fields=["cf_order_id"], name="cashfree_attempt_cf_order_idx"
+            ),
+        ),
+        migrations.CreateModel(
+            name="PaymentAttemptHistory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False
+                    ),
+                ),
+                ("status", models.CharField(max_length=32)),
+                ("source", models.CharField(max_length=16)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "attempt",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="history",
+                        to="pretix_cashfree.paymentattempt",
+                    ),
+                ),
+            ],
+        ),
+    ]
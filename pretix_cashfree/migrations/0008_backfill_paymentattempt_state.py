@@ -0,0 +1,63 @@
+import json
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    """
+    Copy the Cashfree order state from ``OrderPayment.info`` into the new columns
+
+    Every chunk is written in its own short transaction, so that a large table is
+    never locked for the whole run.
+    """
+    PaymentAttempt = apps.get_model("pretix_cashfree", "PaymentAttempt")
+    PaymentAttemptHistory = apps.get_model("pretix_cashfree", "PaymentAttemptHistory")
+
+    last_pk = 0
+    while True:
+        chunk = list(
+            PaymentAttempt.objects.filter(pk__gt=last_pk, status__isnull=True)
+            .select_related("payment")
+            .order_by("pk")[:CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+
+        history = []
+        for attempt in chunk:
+            if attempt.payment is None:
+                continue
+            try:
+                info = json.loads(attempt.payment.info or "{}")
+            except ValueError:
+                info = {}
+            attempt.created = attempt.payment.created
+            attempt.cf_order_id = info.get("cf_order_id")
+            attempt.status = info.get("order_status")
+            attempt.amount = info.get("order_amount")
+            if attempt.status:
+                history.append(
+                    PaymentAttemptHistory(
+                        attempt=attempt, status=attempt.status, source="backfill"
+                    )
+                )
+
+        with transaction.atomic():
+            PaymentAttempt.objects.bulk_update(
+                chunk, ["created", "cf_order_id", "status", "amount"]
+            )
+            PaymentAttemptHistory.objects.bulk_create(history)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("pretix_cashfree", "0007_paymentattempt_state"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
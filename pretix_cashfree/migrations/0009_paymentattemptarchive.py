@@ -0,0 +1,28 @@
+# Generated by Django 4.2.24 on 2026-10-16 22:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_cashfree", "0008_backfill_paymentattempt_state"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentAttemptArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False
+                    ),
+                ),
+                ("reference", models.CharField(db_index=True, max_length=190)),
+                ("status", models.CharField(blank=True, max_length=32, null=True)),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                ("data", models.BinaryField()),
+            ],
+        ),
+    ]
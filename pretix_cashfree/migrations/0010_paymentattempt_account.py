@@ -0,0 +1,23 @@
+# Generated by Django 4.2.24 on 2026-10-16 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_cashfree", "0009_paymentattemptarchive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="paymentattempt",
+            name="account",
+            field=models.CharField(
+                blank=True,
+                help_text="Client ID of the merchant account holding the Cashfree order",
+                max_length=190,
+                null=True,
+            ),
+        ),
+    ]
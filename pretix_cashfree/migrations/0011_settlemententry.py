@@ -0,0 +1,81 @@
+# Generated by Django 4.2.24 on 2026-10-17 00:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_cashfree", "0010_paymentattempt_account"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SettlementEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False
+                    ),
+                ),
+                (
+                    "event_id",
+                    models.CharField(
+                        help_text="Cashfree payment ID or refund ID of this entry",
+                        max_length=190,
+                    ),
+                ),
+                ("event_type", models.CharField(max_length=32)),
+                ("order_id", models.CharField(max_length=190)),
+                (
+                    "cf_payment_id",
+                    models.CharField(blank=True, max_length=190, null=True),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(decimal_places=2, max_digits=13, null=True),
+                ),
+                (
+                    "settlement_amount",
+                    models.DecimalField(decimal_places=2, max_digits=13, null=True),
+                ),
+                (
+                    "service_charge",
+                    models.DecimalField(decimal_places=2, max_digits=13, null=True),
+                ),
+                (
+                    "service_tax",
+                    models.DecimalField(decimal_places=2, max_digits=13, null=True),
+                ),
+                (
+                    "settlement_id",
+                    models.CharField(blank=True, max_length=190, null=True),
+                ),
+                (
+                    "settlement_utr",
+                    models.CharField(blank=True, max_length=190, null=True),
+                ),
+                ("event_time", models.DateTimeField(blank=True, null=True)),
+                ("settled_at", models.DateTimeField(blank=True, null=True)),
+                ("imported", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["order_id", "event_type"],
+                        name="cashfree_settlement_order_idx",
+                    ),
+                    models.Index(
+                        fields=["event_time"], name="cashfree_settlement_time_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("event_type", "event_id"),
+                        name="cashfree_settlement_uniq",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -1,10 +1,13 @@
-from typing import Optional
-
+from datetime import timedelta
 from django.db import models
-from pydantic import BaseModel
+from django.utils.timezone import now
 
 
 class PaymentAttempt(models.Model):
+    """
+    Cashfree order of a pretix order, with its latest known state at Cashfree
+    """
+
     reference = models.CharField(max_length=190, db_index=True, unique=True)
     payment = models.ForeignKey(
         "pretixbase.OrderPayment",
@@ -13,28 +16,132 @@ class PaymentAttempt(models.Model):
         on_delete=models.CASCADE,
         help_text="Latest payment attempt for this order",
     )
+    payment_session_id = models.CharField(max_length=255, null=True, blank=True)
+    session_expires = models.DateTimeField(null=True, blank=True)
+    cf_order_id = models.CharField(max_length=190, null=True, blank=True)
+    status = models.CharField(max_length=32, null=True, blank=True)
+    amount = models.DecimalField(max_digits=13, decimal_places=2, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    attempts = models.PositiveIntegerField(
+        default=0, help_text="Number of times the buyer was sent to Cashfree"
+    )
+    account = models.CharField(
+        max_length=190,
+        null=True,
+        blank=True,
+        help_text="Client ID of the merchant account holding the Cashfree order",
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "created"], name="cashfree_attempt_status_idx"
+            ),
+            models.Index(
+                fields=["session_expires"], name="cashfree_attempt_expires_idx"
+            ),
+            models.Index(fields=["cf_order_id"], name="cashfree_attempt_cf_order_idx"),
+        ]
+
+    def has_valid_session(self, margin: timedelta = timedelta()) -> bool:
+        """
+        Whether the stored Cashfree payment session can still be used for ``margin``
+        """
+        return bool(
+            self.payment_session_id
+            and self.session_expires
+            and self.session_expires > now() + margin
+        )
+
+
+class PaymentAttemptHistory(models.Model):
+    """
+    Append-only log of the Cashfree states a payment attempt went through
+    """
+
+    attempt = models.ForeignKey(
+        PaymentAttempt, on_delete=models.CASCADE, related_name="history"
+    )
+    status = models.CharField(max_length=32)
+    source = models.CharField(max_length=16)
+    created = models.DateTimeField(auto_now_add=True)
+
+
+class PaymentAttemptArchive(models.Model):
+    """
+    Compressed copy of a pruned ``PaymentAttempt`` and its history
+    """
+
+    reference = models.CharField(max_length=190, db_index=True)
+    status = models.CharField(max_length=32, null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.BinaryField()
 
 
-class CashfreePaymentInfo(BaseModel):
-    x_request_id: str
-    order_id: str
-    cf_order_id: str
-    order_status: str
-    order_amount: float
-    order_currency: str
-    customer_id: str
-    updated_at: str
-
-
-class CashfreeRefundInfo(BaseModel):
-    x_request_id: str
-    order_id: str
-    refund_id: str
-    cf_refund_id: str
-    cf_payment_id: str
-    refund_type: str
-    refund_status: str
-    refund_amount: float
-    refund_currency: str
-    processed_at: Optional[str]
-    updated_at: str
+class WebhookInboxEvent(models.Model):
+    """
+    Verified webhook waiting to be applied to its payment by the inbox worker
+    """
+
+    payment = models.ForeignKey(
+        "pretixbase.OrderPayment",
+        on_delete=models.CASCADE,
+    )
+    reference = models.CharField(max_length=190)
+    event_type = models.CharField(max_length=50)
+    payload = models.TextField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["processed_at", "id"]),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    Durable record of processed idempotency keys, consulted when the cache has lost them
+    """
+
+    key = models.CharField(max_length=190, unique=True)
+    digest = models.CharField(max_length=32)
+    expires = models.DateTimeField(db_index=True)
+
+
+class SettlementEntry(models.Model):
+    """
+    Row of a Cashfree settlement report, imported to reconcile payments and refunds
+    """
+
+    event_id = models.CharField(
+        max_length=190, help_text="Cashfree payment ID or refund ID of this entry"
+    )
+    event_type = models.CharField(max_length=32)
+    order_id = models.CharField(max_length=190)
+    cf_payment_id = models.CharField(max_length=190, null=True, blank=True)
+    amount = models.DecimalField(max_digits=13, decimal_places=2, null=True)
+    settlement_amount = models.DecimalField(max_digits=13, decimal_places=2, null=True)
+    service_charge = models.DecimalField(max_digits=13, decimal_places=2, null=True)
+    service_tax = models.DecimalField(max_digits=13, decimal_places=2, null=True)
+    settlement_id = models.CharField(max_length=190, null=True, blank=True)
+    settlement_utr = models.CharField(max_length=190, null=True, blank=True)
+    event_time = models.DateTimeField(null=True, blank=True)
+    settled_at = models.DateTimeField(null=True, blank=True)
+    imported = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event_type", "event_id"], name="cashfree_settlement_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["order_id", "event_type"], name="cashfree_settlement_order_idx"
+            ),
+            models.Index(fields=["event_time"], name="cashfree_settlement_time_idx"),
+        ]
@@ -1,30 +1,20 @@
+from typing import TYPE_CHECKING
+
 import logging
-from cashfree_pg.api_client import Cashfree, PGWebhookEvent
-from cashfree_pg.exceptions import NotFoundException
-from cashfree_pg.models.create_order_request import CreateOrderRequest
-from cashfree_pg.models.customer_details import CustomerDetails
-from cashfree_pg.models.order_create_refund_request import OrderCreateRefundRequest
-from cashfree_pg.models.order_entity import OrderEntity
-from cashfree_pg.models.order_meta import OrderMeta
-from cashfree_pg.models.refund_entity import RefundEntity
 from collections import OrderedDict
-from datetime import datetime
+from datetime import datetime, timedelta
 from decimal import Decimal
 from django import forms
+from django.conf import settings as django_settings
 from django.contrib import messages
-from django.core.cache import caches
+from django.db.models import F
 from django.http import HttpRequest
 from django.template.loader import get_template
 from django.urls import reverse
 from django.utils.formats import date_format
 from django.utils.safestring import mark_safe
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
-from phonenumber_field.formfields import PhoneNumberField
-from phonenumber_field.phonenumber import PhoneNumber
-from pretix.base.forms.questions import (
-    WrappedPhoneNumberPrefixWidget,
-    guess_phone_prefix_from_request,
-)
 from pretix.base.models import Event, Order, OrderPayment, OrderRefund
 from pretix.base.payment import BasePaymentProvider, PaymentException
 from pretix.base.settings import SettingsSandbox
@@ -33,29 +23,52 @@ from pretix.helpers.urls import build_absolute_uri as build_global_uri
 from pretix.multidomain.urlreverse import build_absolute_uri
 from urllib.parse import urlencode
 
+from . import metrics
+from .accounts import pool_accounts, route
+from .client import CashfreeConfig, get_client
 from .constants import (
     DATE_FORMAT,
+    PAYMENT_SESSION_MARGIN,
+    PAYMENT_SESSION_TTL,
     PAYMENT_STATUS_SUCCESS,
+    REDIRECT_MODE_JS,
+    REDIRECT_MODE_SERVER,
     REDIRECT_URL_PAYMENT_SESSION_ID,
+    REFUND_QUEUED_KEY,
     RETURN_URL_PARAM,
     SESSION_KEY_ORDER_ID,
     SUPPORTED_COUNTRY_CODES,
     SUPPORTED_CURRENCIES,
-    X_API_VERSION,
+    WEBHOOK_ROUTE_TAG,
 )
-from .models import (
-    CashfreePaymentInfo,
-    CashfreeRefundInfo,
-    PaymentAttempt,
+from .idempotency import webhook_store
+from .models import PaymentAttempt, PaymentAttemptHistory
+from .ratelimit import RateLimitExceeded
+from .resilience import CircuitOpenError
+from .singleflight import single_flight
+from .status_cache import get_order_status, invalidate_order_status, set_order_status
+from .tasks import (
+    enqueue_webhook_event,
+    schedule_order_precreation,
+    schedule_queued_refunds,
 )
 from .utils import create_request_id
+from .webhooks import CashfreeWebhook, route_token
+
+if TYPE_CHECKING:
+    # This module is imported whenever pretix lists payment providers, the SDK,
+    # pydantic and phonenumbers are only imported once a Cashfree payment needs them
+    from cashfree_pg.models.create_order_request import CreateOrderRequest
+    from cashfree_pg.models.order_create_refund_request import OrderCreateRefundRequest
+    from cashfree_pg.models.order_entity import OrderEntity
+    from cashfree_pg.models.refund_entity import RefundEntity
+    from phonenumber_field.phonenumber import PhoneNumber
 
 logger = logging.getLogger("pretix.plugins.cashfree")
 
-try:
-    cache = caches["redis"]
-except Exception:
-    cache = caches["default"]
+UNAVAILABLE_MESSAGE = _(
+    "Cashfree is temporarily unavailable. Please try again in a few minutes."
+)
 
 
 class CashfreePaymentProvider(BasePaymentProvider):
@@ -86,6 +99,49 @@ class CashfreePaymentProvider(BasePaymentProvider):
                     widget=forms.PasswordInput(render_value=True),
                 ),
             ),
+            (
+                "queue_refunds",
+                forms.BooleanField(
+                    label=_("Queue refunds for batch execution"),
+                    help_text=_(
+                        "Refunds are submitted to Cashfree in the background with "
+                        "limited concurrency instead of one by one. Recommended "
+                        "before cancelling large events."
+                    ),
+                    required=False,
+                ),
+            ),
+            (
+                "precreate_orders",
+                forms.BooleanField(
+                    label=_("Create Cashfree orders ahead of payment"),
+                    help_text=_(
+                        "When a customer chooses Cashfree to pay an existing order, "
+                        "the Cashfree order is created in the background right away, "
+                        "so that the redirect to Cashfree needs no further request."
+                    ),
+                    required=False,
+                ),
+            ),
+            (
+                "redirect_mode",
+                forms.ChoiceField(
+                    label=_("Redirect to Cashfree"),
+                    choices=(
+                        (REDIRECT_MODE_JS, _("Through Cashfree's checkout SDK")),
+                        (
+                            REDIRECT_MODE_SERVER,
+                            _("Directly to Cashfree's hosted checkout page"),
+                        ),
+                    ),
+                    initial=REDIRECT_MODE_JS,
+                    help_text=_(
+                        "The direct redirect does not need any JavaScript in the "
+                        "customer's browser, which is faster on slow devices."
+                    ),
+                    required=False,
+                ),
+            ),
             (
                 "debug_tunnel",
                 forms.URLField(
@@ -108,13 +164,11 @@ class CashfreePaymentProvider(BasePaymentProvider):
         """
         Configure Cashfree API credentials
         """
-        is_sandbox = self.event.testmode
         client_id = self.settings.client_id or self.settings.global_client_id
         if not client_id:
             raise PaymentException(
                 "Cashfree Client ID is not configured. Please set it in the plugin settings."
             )
-        Cashfree.XClientId = client_id
 
         client_secret = (
             self.settings.client_secret or self.settings.global_client_secret
@@ -123,23 +177,91 @@ class CashfreePaymentProvider(BasePaymentProvider):
             raise PaymentException(
                 "Cashfree Client Secret is not configured. Please set it in the plugin settings."
             )
-        Cashfree.XClientSecret = client_secret
 
-        Cashfree.XEnvironment = (
-            Cashfree.XSandbox if is_sandbox else Cashfree.XProduction
+        self.config = self._make_config(client_id, client_secret)
+        # Merchant accounts new orders are spread across, the configured one first
+        self.configs = {client_id: self.config}
+        for account, secret in pool_accounts(client_id):
+            self.configs[account] = self._make_config(account, secret)
+
+    def _make_config(self, client_id: str, client_secret: str) -> CashfreeConfig:
+        return CashfreeConfig(
+            client_id=client_id,
+            client_secret=client_secret,
+            sandbox=self.event.testmode,
+            # Lets a load test point the plugin at a local stand-in for Cashfree
+            api_url=django_settings.CONFIG_FILE.get(
+                "pretix_cashfree", "api_url", fallback=""
+            ),
+            hedge_delay=float(
+                django_settings.CONFIG_FILE.get(
+                    "pretix_cashfree", "hedge_delay", fallback=0
+                )
+            ),
+            rate_limit=float(
+                django_settings.CONFIG_FILE.get(
+                    "pretix_cashfree",
+                    f"rate_limit_{client_id}",
+                    fallback=django_settings.CONFIG_FILE.get(
+                        "pretix_cashfree", "rate_limit", fallback=0
+                    ),
+                )
+            ),
         )
 
+    @property
+    def client(self):
+        return get_client(self.event.pk, self.config)
+
+    def config_for(self, account: str = None) -> CashfreeConfig:
+        config = self.configs.get(account or self.config.client_id)
+        if config is None:
+            logger.warning("Cashfree account %s is no longer configured", account)
+            return self.config
+        return config
+
+    def client_for(self, account: str = None):
+        return get_client(self.event.pk, self.config_for(account))
+
+    async def get_async_client(self, account: str = None):
+        from .aio import get_async_client
+
+        return await get_async_client(self.event.pk, self.config_for(account))
+
+    def payment_account(self, payment: OrderPayment) -> str:
+        """
+        The merchant account holding the Cashfree order of ``payment``
+
+        The Cashfree order is shared by all payments of a pretix order, so a payment
+        of an order created at Cashfree before uses the account of its attempt. Only
+        orders never created are routed to an account of the pool, one whose order
+        predates the pool belongs to the configured account.
+        """
+        info = payment.info_data or {}
+        if info.get("account"):
+            return info["account"]
+        if info.get("cf_order_id") or len(self.configs) == 1:
+            return self.config.client_id
+        attempt = (
+            PaymentAttempt.objects.filter(reference=payment.order.full_code)
+            .values_list("account")
+            .first()
+        )
+        if attempt:
+            return attempt[0] or self.config.client_id
+        return route(self.configs.values(), payment.order.full_code).client_id
+
     def _build_redirect_url(self, request: HttpRequest, session_id: str) -> str:
         base_url = build_absolute_uri(request.event, "plugins:pretix_cashfree:redirect")
         query = urlencode({REDIRECT_URL_PAYMENT_SESSION_ID: session_id})
         return f"{base_url}?{query}"
 
-    def _build_return_url(self, request: HttpRequest, order_id: str) -> str:
-        base_url = build_absolute_uri(request.event, "plugins:pretix_cashfree:return")
+    def _build_return_url(self, order_id: str) -> str:
+        base_url = build_absolute_uri(self.event, "plugins:pretix_cashfree:return")
         query = urlencode({RETURN_URL_PARAM: order_id})
         return f"{base_url}?{query}"
 
-    def _build_notify_url(self, request: HttpRequest) -> str:
+    def _build_notify_url(self) -> str:
         return (
             f"{self.settings.debug_tunnel}{reverse('plugins:pretix_cashfree:webhook')}"
             if self.settings.debug_tunnel
@@ -147,10 +269,11 @@ class CashfreePaymentProvider(BasePaymentProvider):
         )
 
     def _create_cashfree_order_request(
-        self, request: HttpRequest, payment: OrderPayment
-    ) -> CreateOrderRequest:
-
-        phone: PhoneNumber = request.session[self.payment_phone_session_key]
+        self, payment: OrderPayment, phone: "PhoneNumber", account: str
+    ) -> "CreateOrderRequest":
+        from cashfree_pg.models.create_order_request import CreateOrderRequest
+        from cashfree_pg.models.customer_details import CustomerDetails
+        from cashfree_pg.models.order_meta import OrderMeta
 
         customer_phone = str(phone.national_number)
         customer_details = CustomerDetails(
@@ -166,33 +289,64 @@ class CashfreePaymentProvider(BasePaymentProvider):
             order_currency=self.event.currency,
             customer_details=customer_details,
             order_meta=OrderMeta(
-                return_url=self._build_return_url(request, order_id),
-                notify_url=self._build_notify_url(request),
+                return_url=self._build_return_url(order_id),
+                notify_url=self._build_notify_url(),
             ),
-            order_note=f"{request.event.name} tickets",
+            order_note=f"{self.event.name} tickets",
+            # Lets the webhook find its payment and signing key without a lookup
+            order_tags={
+                WEBHOOK_ROUTE_TAG: route_token(self.event.pk, payment.pk, account)
+            },
         )
 
-    def _create_cashfree_order(self, request, payment: OrderPayment):
+    def _create_order_entity(self, payment: OrderPayment, phone: "PhoneNumber"):
+        """
+        Create the Cashfree order of a payment and remember its payment session
 
-        try:
-            logger.debug("Creating Cashfree order for : %s", payment)
-            create_order_request = self._create_cashfree_order_request(request, payment)
+        Concurrent calls for the same order, e.g. a checkout racing the background
+        pre-creation, share a single order at Cashfree.
+        """
+        from cashfree_pg.models.order_entity import OrderEntity
 
+        def create():
+            logger.debug("Creating Cashfree order for : %s", payment)
+            account = self.payment_account(payment)
+            create_order_request = self._create_cashfree_order_request(
+                payment, phone, account
+            )
             x_request_id = create_request_id()
-            api_response = Cashfree().PGCreateOrder(
-                x_api_version=X_API_VERSION,
+            order_entity = self.client_for(account).create_order(
                 create_order_request=create_order_request,
                 x_request_id=x_request_id,
             )
 
-            if not api_response or not api_response.data:
+            if not order_entity:
                 raise Exception("Did not receive order details")
 
-            order_entity = api_response.data
-            payment.info_data = self._create_payment_info(x_request_id, order_entity)
+            set_order_status(order_entity)
+            payment.info_data = self._create_payment_info(
+                x_request_id, order_entity, account
+            )
             payment.save()
+            self._record_payment_attempt(payment, order_entity, "create")
+            return {"payment_id": payment.pk, "order": order_entity.to_dict()}
+
+        result, leader = single_flight(f"create:{payment.order.full_code}", create)
+        if not leader and result["payment_id"] == payment.pk:
+            payment.refresh_from_db()
+        return OrderEntity.from_dict(result["order"])
+
+    @metrics.instrumented("create_order")
+    def _create_cashfree_order(self, request, payment: OrderPayment):
+
+        try:
+            phone: "PhoneNumber" = request.session[self.payment_phone_session_key]
+            order_entity = self._create_order_entity(payment, phone)
             return self._redirect_cashfree(request, payment, order_entity)
 
+        except (CircuitOpenError, RateLimitExceeded) as e:
+            logger.warning("Not creating Cashfree order for %s: %s", payment, e)
+            raise PaymentException(UNAVAILABLE_MESSAGE) from e
         except Exception as e:
             logger.exception("Error creating Cashfree order: %s", e)
             messages.error(
@@ -201,7 +355,11 @@ class CashfreePaymentProvider(BasePaymentProvider):
             )
             raise PaymentException from e
 
-    def _create_payment_info(self, x_request_id: str, order_entity: OrderEntity):
+    def _create_payment_info(
+        self, x_request_id: str, order_entity: "OrderEntity", account: str
+    ):
+        from .schemas import CashfreePaymentInfo
+
         local_dt = datetime.now()
         updated_at = date_format(local_dt, DATE_FORMAT)
         obj = CashfreePaymentInfo(
@@ -213,10 +371,13 @@ class CashfreePaymentProvider(BasePaymentProvider):
             order_amount=order_entity.order_amount,
             customer_id=order_entity.customer_details.customer_id,
             updated_at=updated_at,
+            account=account,
         )
         return obj.dict()
 
-    def _create_refund_info(self, x_request_id: str, refund_entity: RefundEntity):
+    def _create_refund_info(self, x_request_id: str, refund_entity: "RefundEntity"):
+        from .schemas import CashfreeRefundInfo
+
         local_dt = datetime.now()
         updated_at = date_format(local_dt, DATE_FORMAT)
         date = (
@@ -241,17 +402,58 @@ class CashfreePaymentProvider(BasePaymentProvider):
         return obj.dict()
 
     def _redirect_cashfree(
-        self, request: HttpRequest, payment: OrderPayment, order_entity: OrderEntity
+        self,
+        request: HttpRequest,
+        payment: OrderPayment,
+        order_entity: "OrderEntity",
     ):
         logger.debug("Redirecting to Cashfree for payment: %s", payment)
         request.session[SESSION_KEY_ORDER_ID] = order_entity.order_id
-        PaymentAttempt.objects.update_or_create(
-            reference=order_entity.order_id, defaults={"payment": payment}
-        )
+        self._record_payment_attempt(payment, order_entity, "redirect", redirected=True)
         return self._build_redirect_url(request, order_entity.payment_session_id)
 
+    def _record_payment_attempt(
+        self,
+        payment: OrderPayment,
+        order_entity: "OrderEntity",
+        source: str,
+        redirected: bool = False,
+    ):
+        """
+        Store the state of a Cashfree order in its ``PaymentAttempt`` and log status
+        changes to its history
+        """
+        expires = now() + timedelta(seconds=PAYMENT_SESSION_TTL)
+        if order_entity.order_expiry_time:
+            expires = min(expires, order_entity.order_expiry_time)
+        values = {
+            "payment": payment,
+            "payment_session_id": order_entity.payment_session_id,
+            "session_expires": (
+                expires if order_entity.order_status == "ACTIVE" else None
+            ),
+            "cf_order_id": order_entity.cf_order_id,
+            "status": order_entity.order_status,
+            "amount": order_entity.order_amount,
+        }
+        if payment.info_data.get("account"):
+            values["account"] = payment.info_data["account"]
+        attempt, created = PaymentAttempt.objects.get_or_create(
+            reference=order_entity.order_id,
+            defaults={**values, "attempts": int(redirected)},
+        )
+        if not created:
+            PaymentAttempt.objects.filter(pk=attempt.pk).update(
+                **values, updated=now(), attempts=F("attempts") + int(redirected)
+            )
+        if created or attempt.status != order_entity.order_status:
+            PaymentAttemptHistory.objects.create(
+                attempt=attempt, status=order_entity.order_status, source=source
+            )
+        return attempt
+
     def _handle_cashfree_order_status(
-        self, payment: OrderPayment, order_entity: OrderEntity
+        self, payment: OrderPayment, order_entity: "OrderEntity"
     ):
         match order_entity.order_status:
             case "ACTIVE":
@@ -269,40 +471,50 @@ class CashfreePaymentProvider(BasePaymentProvider):
             case "TERMINATION_REQUESTED":
                 logger.debug("%s termination requested", payment)
 
+    def _handle_cashfree_refund_status(
+        self, refund: OrderRefund, refund_entity: "RefundEntity"
+    ):
+        match refund_entity.refund_status:
+            case "SUCCESS":
+                logger.debug("%s is successful", refund.full_id)
+                refund.done()
+            case "CANCELLED":
+                logger.debug("%s was cancelled", refund.full_id)
+                refund.state = OrderRefund.REFUND_STATE_FAILED
+                refund.save()
+                refund.order.log_action(
+                    "pretix.event.order.refund.failed",
+                    {
+                        "local_id": refund.local_id,
+                        "provider": refund.provider,
+                        "error": refund_entity.status_description,
+                    },
+                )
+            case _:
+                logger.debug(
+                    "%s is %s at Cashfree", refund.full_id, refund_entity.refund_status
+                )
+                refund.state = OrderRefund.REFUND_STATE_TRANSIT
+                refund.save()
+
     def _is_payment_confirmed(self, payment):
         return payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
 
-    def _verify_webhook_signature(self, signature, timestamp, raw_payload):
-        try:
-            webhook_response = Cashfree().PGVerifyWebhookSignature(
-                signature=signature, timestamp=timestamp, rawBody=raw_payload
-            )
-        except Exception as e:
-            logger.Error("Error: %s", e)
-            return None
-
-        return webhook_response
-
-    def _check_webhook_payload(
-        self, payment: OrderPayment, webhook_event: PGWebhookEvent
-    ):
+    def _check_webhook_payload(self, payment: OrderPayment, webhook: CashfreeWebhook):
         # Check idempotency using cf_payment_id
-        cf_payment_obj = webhook_event.object["data"]["payment"]
-        cf_payment_id = str(cf_payment_obj["cf_payment_id"])
-        payment_status = cf_payment_obj["payment_status"]
+        cf_payment_id = webhook.cf_payment_id
 
-        key = f"plugins:pretix_cachfree:webhook:payment:{cf_payment_id}"
-        if cache.has_key(key=key):
+        if not webhook_store.add(f"payment:{cf_payment_id}", webhook.raw):
+            metrics.inc(metrics.cashfree_webhook_dedupe_total, result="duplicate")
             logger.debug(
                 "Webhook payload with cf_payment_id: %s already processed. Skipping...",
                 cf_payment_id,
             )
-            return True
-
-        cache.set(key=key, value=webhook_event.raw)
+            return False
+        metrics.inc(metrics.cashfree_webhook_dedupe_total, result="new")
 
         # Verify the payment if Cashfree reports it as successful
-        return payment_status == PAYMENT_STATUS_SUCCESS
+        return webhook.payment_status == PAYMENT_STATUS_SUCCESS
 
     def is_allowed(self, request: HttpRequest, total: Decimal = None) -> bool:
         return (
@@ -321,6 +533,20 @@ class CashfreePaymentProvider(BasePaymentProvider):
         if self._is_payment_confirmed(payment):
             return None
 
+        # A live payment session, e.g. of a pre-created order, needs no round trip
+        attempt = PaymentAttempt.objects.filter(
+            reference=payment.order.full_code, payment=payment
+        ).first()
+        if attempt and attempt.has_valid_session(
+            timedelta(seconds=PAYMENT_SESSION_MARGIN)
+        ):
+            logger.debug("Reusing Cashfree payment session for: %s", payment)
+            PaymentAttempt.objects.filter(pk=attempt.pk).update(
+                updated=now(), attempts=F("attempts") + 1
+            )
+            request.session[SESSION_KEY_ORDER_ID] = attempt.reference
+            return self._build_redirect_url(request, attempt.payment_session_id)
+
         # Check existing payment status
         order_entity = self.verify_payment(payment)
         if order_entity:
@@ -334,33 +560,140 @@ class CashfreePaymentProvider(BasePaymentProvider):
         # Otherwise create a new Cashfree order and redirect
         return self._create_cashfree_order(request, payment)
 
-    def verify_payment(self, payment: OrderPayment):
+    def _apply_cashfree_order(
+        self, payment: OrderPayment, x_request_id: str, order_entity: "OrderEntity"
+    ):
+        account = self.payment_account(payment)
+        self._handle_cashfree_order_status(payment, order_entity)
+        payment.info_data = self._create_payment_info(
+            x_request_id=x_request_id, order_entity=order_entity, account=account
+        )
+        payment.save()
+        self._record_payment_attempt(payment, order_entity, "fetch")
+
+    def _fetch_cashfree_order(self, payment: OrderPayment, hedge: bool = False):
         """
-        Verify existing Cashfree order status and update payment accordingly
+        Fetch the Cashfree order of a payment and apply its status to the payment
         """
+        from cashfree_pg.exceptions import NotFoundException
 
         order_id = payment.order.full_code
 
         try:
             logger.debug("Fetching Cashfree order for pretix order: %s", order_id)
             x_request_id = create_request_id()
-            api_response = Cashfree().PGFetchOrder(
-                x_api_version=X_API_VERSION,
+            order_entity = self.client_for(self.payment_account(payment)).fetch_order(
                 order_id=order_id,
                 x_request_id=x_request_id,
+                hedge=hedge,
             )
+        except NotFoundException:
+            logger.debug("Cashfree order not found for payment: %s", payment)
+            return None
 
-            order_entity = api_response.data
-            self._handle_cashfree_order_status(payment, order_entity)
-            payment.info_data = self._create_payment_info(
-                x_request_id=x_request_id, order_entity=order_entity
-            )
-            payment.save()
-            return order_entity
+        return self._store_fetched_order(payment, x_request_id, order_entity)
 
+    async def _afetch_cashfree_order(self, payment: OrderPayment, hedge: bool = False):
+        from cashfree_pg.exceptions import NotFoundException
+
+        from .aio import run_blocking
+
+        order_id = payment.order.full_code
+        client = await self.get_async_client(
+            await run_blocking(self.payment_account, payment)
+        )
+
+        try:
+            logger.debug("Fetching Cashfree order for pretix order: %s", order_id)
+            x_request_id = create_request_id()
+            order_entity = await client.fetch_order(
+                order_id=order_id,
+                x_request_id=x_request_id,
+                hedge=hedge,
+            )
         except NotFoundException:
             logger.debug("Cashfree order not found for payment: %s", payment)
             return None
+
+        return await run_blocking(
+            self._store_fetched_order, payment, x_request_id, order_entity
+        )
+
+    def _store_fetched_order(
+        self, payment: OrderPayment, x_request_id: str, order_entity: "OrderEntity"
+    ):
+        self._apply_cashfree_order(payment, x_request_id, order_entity)
+        set_order_status(order_entity)
+        return {
+            "payment_id": payment.pk,
+            "x_request_id": x_request_id,
+            "order": order_entity.to_dict(),
+        }
+
+    def _cached_order_status(self, payment: OrderPayment):
+        order_entity = get_order_status(payment.order.full_code)
+        # A terminal status which has not been applied to this payment yet needs a live fetch
+        if order_entity and (
+            order_entity.order_status == "ACTIVE"
+            or payment.state
+            not in (
+                OrderPayment.PAYMENT_STATE_CREATED,
+                OrderPayment.PAYMENT_STATE_PENDING,
+            )
+        ):
+            logger.debug("Using cached Cashfree order for: %s", payment)
+            return order_entity
+        return None
+
+    def _apply_shared_result(self, payment: OrderPayment, result: dict):
+        """
+        Apply the result of a fetch run by another caller of the same single flight
+        """
+        from cashfree_pg.models.order_entity import OrderEntity
+
+        order_entity = OrderEntity.from_dict(result["order"])
+        if result["payment_id"] == payment.pk:
+            # The payment has already been updated by the call we waited for
+            payment.refresh_from_db()
+        else:
+            self._apply_cashfree_order(payment, result["x_request_id"], order_entity)
+        return order_entity
+
+    @metrics.instrumented("verify_payment")
+    def verify_payment(
+        self, payment: OrderPayment, use_cache: bool = True, hedge: bool = False
+    ):
+        """
+        Verify existing Cashfree order status and update payment accordingly
+
+        A recently fetched status is answered from the cache unless ``use_cache`` is
+        unset. Concurrent calls for the same order share a single fetch from Cashfree,
+        which is hedged if ``hedge`` is set.
+        """
+
+        from cashfree_pg.models.order_entity import OrderEntity
+
+        order_id = payment.order.full_code
+
+        if use_cache:
+            order_entity = self._cached_order_status(payment)
+            if order_entity:
+                return order_entity
+
+        try:
+            result, leader = single_flight(
+                f"verify:{order_id}",
+                lambda: self._fetch_cashfree_order(payment, hedge=hedge),
+            )
+            if result is None:
+                return None
+            if not leader:
+                return self._apply_shared_result(payment, result)
+            return OrderEntity.from_dict(result["order"])
+
+        except (CircuitOpenError, RateLimitExceeded) as e:
+            logger.warning("Not verifying Cashfree order %s: %s", order_id, e)
+            raise PaymentException(UNAVAILABLE_MESSAGE) from e
         except Exception as e:
             logger.debug(
                 "Error occured while fetching Cashfree order having id: %s", order_id
@@ -368,23 +701,132 @@ class CashfreePaymentProvider(BasePaymentProvider):
             logger.error(e)
             raise PaymentException from e
 
-    def handle_webhook(self, raw_payload, signature, timestamp, payment: OrderPayment):
-        webhook_event = self._verify_webhook_signature(
-            signature=signature, timestamp=timestamp, raw_payload=raw_payload
-        )
-        if not webhook_event:
-            raise Exception(
-                "Could not verify webhook signature of payment: %s", payment
+    @metrics.instrumented("verify_payment")
+    async def averify_payment(
+        self, payment: OrderPayment, use_cache: bool = True, hedge: bool = False
+    ):
+        """
+        Async variant of ``verify_payment``, only the ORM work occupies a thread
+        """
+        from cashfree_pg.models.order_entity import OrderEntity
+
+        from .aio import run_blocking
+        from .singleflight import asingle_flight
+
+        order_id = payment.order.full_code
+
+        if use_cache:
+            order_entity = await run_blocking(self._cached_order_status, payment)
+            if order_entity:
+                return order_entity
+
+        try:
+            result, leader = await asingle_flight(
+                f"verify:{order_id}",
+                lambda: self._afetch_cashfree_order(payment, hedge=hedge),
+            )
+            if result is None:
+                return None
+            if not leader:
+                return await run_blocking(self._apply_shared_result, payment, result)
+            return OrderEntity.from_dict(result["order"])
+
+        except (CircuitOpenError, RateLimitExceeded) as e:
+            logger.warning("Not verifying Cashfree order %s: %s", order_id, e)
+            raise PaymentException(UNAVAILABLE_MESSAGE) from e
+        except Exception as e:
+            logger.debug(
+                "Error occured while fetching Cashfree order having id: %s", order_id
+            )
+            logger.error(e)
+            raise PaymentException from e
+
+    @metrics.instrumented("handle_webhook")
+    def handle_webhook(self, webhook: CashfreeWebhook, payment: OrderPayment):
+        """
+        Apply a payment webhook whose signature has already been verified
+        """
+        invalidate_order_status(payment.order.full_code)
+        if not self._check_webhook_payload(payment=payment, webhook=webhook):
+            return
+
+        try:
+            if self.settings.get("global_webhook_async", as_type=bool, default=False):
+                enqueue_webhook_event(payment, webhook)
+            else:
+                was_confirmed = self._is_payment_confirmed(payment)
+                self.verify_payment(payment)
+                if not was_confirmed and self._is_payment_confirmed(payment):
+                    metrics.observe_confirmation_lag(webhook.paid_at, "webhook")
+        except Exception:
+            # Let Cashfree's retry of this webhook through again
+            webhook_store.discard(f"payment:{webhook.cf_payment_id}")
+            raise
+
+    @metrics.instrumented("handle_webhook")
+    async def ahandle_webhook(self, webhook: CashfreeWebhook, payment: OrderPayment):
+        """
+        Async variant of ``handle_webhook``, confirming the payment on the executor
+        """
+        from .aio import run_blocking
+
+        invalidate_order_status(payment.order.full_code)
+        if not await run_blocking(self._check_webhook_payload, payment, webhook):
+            return
+
+        try:
+            if await run_blocking(
+                self.settings.get, "global_webhook_async", as_type=bool, default=False
+            ):
+                await run_blocking(enqueue_webhook_event, payment, webhook)
+            else:
+                was_confirmed = self._is_payment_confirmed(payment)
+                await self.averify_payment(payment)
+                if not was_confirmed and self._is_payment_confirmed(payment):
+                    metrics.observe_confirmation_lag(webhook.paid_at, "webhook")
+        except Exception:
+            await run_blocking(
+                webhook_store.discard, f"payment:{webhook.cf_payment_id}"
             )
-        if self._check_webhook_payload(payment=payment, webhook_event=webhook_event):
-            self.verify_payment(payment)
+            raise
+
+    def handle_refund_webhook(self, webhook: CashfreeWebhook, order: Order):
+        """
+        Apply a refund status webhook whose signature has already been verified
+        """
+        from cashfree_pg.models.refund_entity import RefundEntity
+
+        refund_entity = RefundEntity.from_dict(webhook.refund)
+        # Refunds issued elsewhere, e.g. in the Cashfree dashboard, are not ours
+        refund_id = refund_entity.refund_id or ""
+        local_id = refund_id.removeprefix(f"{order.code}-R-")
+        refund = None
+        if local_id != refund_id and local_id.isdigit():
+            refund = order.refunds.filter(
+                provider=self.identifier, local_id=int(local_id)
+            ).first()
+        if refund is None:
+            logger.info("Ignoring webhook for refund %s not made by pretix", refund_id)
+            return
+        if refund.state not in (
+            OrderRefund.REFUND_STATE_CREATED,
+            OrderRefund.REFUND_STATE_TRANSIT,
+        ):
+            logger.debug("%s is already %s. Skipping...", refund.full_id, refund.state)
+            return
+
+        refund.info_data = self._create_refund_info(
+            x_request_id=refund.info_data.get("x_request_id") or create_request_id(),
+            refund_entity=refund_entity,
+        )
+        self._handle_cashfree_refund_status(refund, refund_entity)
 
     def checkout_prepare(self, request, cart):
         # HACK The following method call validats payment form and copies the form values to the session.
         if not super().checkout_prepare(request, cart):
             return False
 
-        phone: PhoneNumber = request.session[self.payment_phone_session_key]
+        phone: "PhoneNumber" = request.session[self.payment_phone_session_key]
 
         is_valid_country = phone.country_code in SUPPORTED_COUNTRY_CODES
         is_valid_length = len(str(phone.national_number)) == 10
@@ -399,6 +841,16 @@ class CashfreePaymentProvider(BasePaymentProvider):
 
         return True
 
+    def payment_prepare(self, request, payment):
+        if not self.checkout_prepare(request, None):
+            return False
+
+        if self.settings.get("precreate_orders", as_type=bool, default=False):
+            schedule_order_precreation(
+                payment, request.session[self.payment_phone_session_key]
+            )
+        return True
+
     def checkout_confirm_render(
         self, request: HttpRequest, order: Order = None, info_data: dict = None
     ):
@@ -424,6 +876,9 @@ class CashfreePaymentProvider(BasePaymentProvider):
                     return phone
 
     def payment_form_render(self, request, total, order: Order = None):
+        from phonenumber_field.phonenumber import PhoneNumber
+        from pretix.base.forms.questions import guess_phone_prefix_from_request
+
         if not request.session.get(self.payment_phone_session_key):
             phone = (
                 str(order.phone) if order else self._extract_phone_from_session(request)
@@ -438,8 +893,10 @@ class CashfreePaymentProvider(BasePaymentProvider):
 
     @property
     def payment_form_fields(self):
+        from phonenumber_field.formfields import PhoneNumberField
+        from pretix.base.forms.questions import WrappedPhoneNumberPrefixWidget
+
         logger.debug("payment_form_fields() called")
-        logger.debug("+++++++++++++++++++++++++++++++++++++++++++")
         fields = [
             (
                 "phone",
@@ -465,35 +922,51 @@ class CashfreePaymentProvider(BasePaymentProvider):
     def payment_partial_refund_supported(self, payment):
         return False
 
+    def _create_refund_request(self, refund: OrderRefund) -> "OrderCreateRefundRequest":
+        from cashfree_pg.models.order_create_refund_request import (
+            OrderCreateRefundRequest,
+        )
+
+        return OrderCreateRefundRequest(
+            refund_id=refund.full_id,
+            refund_amount=float(refund.amount),
+            refund_note=refund.comment,
+        )
+
+    @metrics.instrumented("execute_refund")
     def execute_refund(self, refund: OrderRefund):
 
+        if self.settings.get("queue_refunds", as_type=bool, default=False):
+            logger.debug("Queueing refund %s for batch execution", refund.full_id)
+            refund.state = OrderRefund.REFUND_STATE_TRANSIT
+            # Only refunds marked here are ever submitted by the batch run
+            refund.info_data = {REFUND_QUEUED_KEY: True}
+            refund.save(update_fields=["state", "info"])
+            schedule_queued_refunds()
+            return
+
         order_id = refund.order.full_code
 
         logger.debug("Creating a refund for order_id: %s", order_id)
 
-        create_refund_request = OrderCreateRefundRequest(
-            refund_id=refund.full_id,
-            refund_amount=float(refund.amount),
-            refund_note=refund.comment,
-        )
+        create_refund_request = self._create_refund_request(refund)
         x_request_id = create_request_id()
 
         try:
-            api_response = Cashfree().PGOrderCreateRefund(
-                x_api_version=X_API_VERSION,
+            client = self.client_for(self.payment_account(refund.payment))
+            refund_entity = client.create_refund(
                 order_id=order_id,
-                order_create_refund_request=create_refund_request,
+                create_refund_request=create_refund_request,
                 x_request_id=x_request_id,
             )
 
-            if not api_response or not api_response.data:
+            if not refund_entity:
                 raise Exception("Did not receive refund details")
 
             refund.info_data = self._create_refund_info(
-                x_request_id=x_request_id, refund_entity=api_response.data
+                x_request_id=x_request_id, refund_entity=refund_entity
             )
-            refund.save()
-            refund.done()
+            self._handle_cashfree_refund_status(refund, refund_entity)
 
         except Exception as e:
             logger.error("Error occurred: %s", e)
@@ -504,7 +977,10 @@ class CashfreePaymentProvider(BasePaymentProvider):
         return template.render({"refund_info": refund.info_data})
 
     def matching_id(self, payment):
+        from .schemas import CashfreePaymentInfo
+
         return CashfreePaymentInfo(**payment.info_data).x_request_id
 
     def refund_matching_id(self, refund):
-        return CashfreeRefundInfo(**refund.info_data).x_request_id
+        # Queued refunds have no Cashfree details yet
+        return refund.info_data.get("x_request_id")
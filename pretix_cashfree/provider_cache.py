@@ -0,0 +1,123 @@
+import logging
+import threading
+from django.db import transaction
+
+from .utils import cache
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+GLOBAL_VERSION_KEY = "plugins:pretix_cashfree:settings:version"
+
+_providers = {}
+_secrets = None
+_lock = threading.Lock()
+
+
+def _event_version_key(event_id):
+    return f"{GLOBAL_VERSION_KEY}:{event_id}"
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def get_provider(event):
+    """
+    Return a ``CashfreePaymentProvider`` for ``event``, shared within this process
+
+    Providers are reused as long as neither the event, its settings nor the
+    organizer or global settings changed, saving the hierarchical settings lookups
+    and ``init_cashfree`` on every webhook and return request.
+    """
+    from .payment import CashfreePaymentProvider
+
+    versions = cache.get_many([GLOBAL_VERSION_KEY, _event_version_key(event.pk)])
+    version = (
+        versions.get(GLOBAL_VERSION_KEY, 0),
+        versions.get(_event_version_key(event.pk), 0),
+    )
+
+    entry = _providers.get(event.pk)
+    if entry and entry[0] == version:
+        return entry[1]
+
+    prov = CashfreePaymentProvider(event)
+    with _lock:
+        _providers[event.pk] = (version, prov)
+    return prov
+
+
+def _load_secrets():
+    from pretix.base.models import (
+        Event_SettingsStore,
+        GlobalSettingsObject_SettingsStore,
+        Organizer_SettingsStore,
+    )
+
+    from .accounts import pool_accounts
+
+    values = set()
+    by_account = {}
+    for model, prefix in (
+        (Event_SettingsStore, "payment_cashfree_"),
+        (Organizer_SettingsStore, "payment_cashfree_"),
+        (GlobalSettingsObject_SettingsStore, "payment_cashfree_global_"),
+    ):
+        # Pair the client ID and secret set on the same event or organizer
+        objects = {}
+        for row in model.objects.filter(
+            key__in=(f"{prefix}client_id", f"{prefix}client_secret")
+        ).values():
+            objects.setdefault(row.get("object_id"), {})[row["key"]] = row["value"]
+        for setting in objects.values():
+            client_id = setting.get(f"{prefix}client_id")
+            secret = setting.get(f"{prefix}client_secret")
+            if secret:
+                values.add(secret)
+            if client_id:
+                accounts = [(client_id, secret)] + pool_accounts(client_id)
+                for account, account_secret in accounts:
+                    if account_secret:
+                        values.add(account_secret)
+                        by_account.setdefault(account, set()).add(account_secret)
+    return (
+        tuple(v.encode() for v in values),
+        {k: tuple(v.encode() for v in s) for k, s in by_account.items()},
+    )
+
+
+def webhook_secrets(account: str = None):
+    """
+    Cashfree client secrets configured on this instance, shared within this process
+
+    With ``account``, only the secrets of that merchant account are returned, as long
+    as it is known. Otherwise a webhook can only be attributed to an event after it
+    has been looked up, so its signature is checked against every secret first.
+    """
+    global _secrets
+    version = cache.get(GLOBAL_VERSION_KEY, 0)
+    if _secrets is None or _secrets[0] != version:
+        _secrets = (version, *_load_secrets())
+    if account and account in _secrets[2]:
+        return _secrets[2][account]
+    return _secrets[1]
+
+
+def invalidate_provider(event_id=None):
+    """
+    Drop cached providers of one event or, without ``event_id``, of all events
+    """
+    global _secrets
+    logger.debug("Invalidating cached Cashfree providers of %s", event_id or "all")
+    with _lock:
+        if event_id is None:
+            _secrets = None
+            _providers.clear()
+        else:
+            _providers.pop(event_id, None)
+    # Other processes must not rebuild their providers before the change is visible
+    key = GLOBAL_VERSION_KEY if event_id is None else _event_version_key(event_id)
+    transaction.on_commit(lambda: _bump(key))
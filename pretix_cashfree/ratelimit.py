@@ -0,0 +1,126 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from . import metrics
+from .constants import PRIORITY_BACKGROUND, PRIORITY_CRITICAL, RATE_LIMIT_PRIORITIES
+from .utils import cache
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+_priority = contextvars.ContextVar("cashfree_priority", default=PRIORITY_CRITICAL)
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when no Cashfree API call could be made within the caller's wait budget
+    """
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing ``rate`` calls per second with bursts of ``capacity``
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Block until a token is available
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+@contextmanager
+def background():
+    """
+    Mark the Cashfree API calls made within the block as background work
+    """
+    token = _priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class SharedRateLimiter:
+    """
+    Rate limit shared by all workers and nodes through the cache
+
+    Each second ``rate`` tokens are handed out from an atomic counter. Background
+    calls may only take tokens while less than their share of the second's budget
+    is used, so checkout calls keep the rest. A caller finding no token waits for
+    the next second, up to the maximum wait of its priority.
+    """
+
+    def __init__(self, name, rate: float):
+        self.name = name
+        self.rate = rate
+
+    def _key(self, window):
+        return f"plugins:pretix_cashfree:ratelimit:{self.name}:{window}"
+
+    def saturated(self) -> bool:
+        """
+        Whether the budget of the current second is used up
+        """
+        return cache.get(self._key(int(time.time())), 0) >= max(1, int(self.rate))
+
+    def acquire(self, priority=None):
+        priority = priority or _priority.get()
+        share, max_wait = RATE_LIMIT_PRIORITIES[priority]
+        limit = max(1, int(self.rate * share))
+        start = time.monotonic()
+        waited = False
+
+        while True:
+            now = time.time()
+            key = self._key(int(now))
+            cache.add(key, 0, timeout=5)
+            try:
+                count = cache.incr(key)
+            except ValueError:
+                # The counter was evicted in between, rather let the call through
+                return
+            if count <= limit:
+                if waited:
+                    metrics.inc(
+                        metrics.cashfree_rate_limit_wait_seconds_total,
+                        time.monotonic() - start,
+                        priority=priority,
+                    )
+                return
+            # Hand the token back, others may still be within their share
+            cache.decr(key)
+
+            wait = int(now) + 1 - now + random.uniform(0, 0.05)
+            if time.monotonic() - start + wait > max_wait:
+                metrics.inc(metrics.cashfree_rate_limited_total, priority=priority)
+                logger.warning(
+                    "Cashfree rate limit of %s exhausted for %s call",
+                    self.name,
+                    priority,
+                )
+                raise RateLimitExceeded(f"Rate limit of {self.name} exhausted")
+            time.sleep(wait)
+            waited = True
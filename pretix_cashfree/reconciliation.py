@@ -0,0 +1,168 @@
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderPayment
+
+from .constants import RECONCILE_CHUNK_SIZE, RECONCILE_RATE_LIMIT, RECONCILE_WORKERS
+from .models import PaymentAttempt
+from .ratelimit import TokenBucket, background
+from .status_cache import set_order_status
+from .utils import create_request_id
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+TERMINAL_ORDER_STATUSES = ("PAID", "EXPIRED", "TERMINATED")
+
+
+@dataclass
+class Mismatch:
+    order_code: str
+    payment_id: str
+    payment_state: str
+    order_status: str
+
+
+@dataclass
+class ReconciliationReport:
+    checked: int = 0
+    updated: int = 0
+    missing: int = 0
+    errors: int = 0
+    mismatches: Counter = field(default_factory=Counter)
+    duration: float = 0
+
+    @property
+    def throughput(self):
+        return self.checked / self.duration if self.duration else 0
+
+
+def pending_attempts(chunk_size=RECONCILE_CHUNK_SIZE, older_than=None):
+    """
+    Stream the attempts of open Cashfree payments in keyset-paginated chunks
+    """
+    qs = PaymentAttempt.objects.filter(
+        payment__provider="cashfree",
+        payment__state__in=(
+            OrderPayment.PAYMENT_STATE_CREATED,
+            OrderPayment.PAYMENT_STATE_PENDING,
+        ),
+    )
+    if older_than:
+        qs = qs.filter(payment__created__lt=older_than)
+    qs = qs.select_related("payment__order__event__organizer").order_by("pk")
+
+    last_pk = 0
+    while True:
+        chunk = list(qs.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def _fetch(bucket, client, attempt):
+    from cashfree_pg.exceptions import NotFoundException
+
+    bucket.acquire()
+    x_request_id = create_request_id()
+    try:
+        with background():
+            order_entity = client.fetch_order(
+                order_id=attempt.reference, x_request_id=x_request_id
+            )
+        return x_request_id, order_entity, None
+    except NotFoundException:
+        return x_request_id, None, None
+    except Exception as e:
+        return x_request_id, None, e
+
+
+@scopes_disabled()
+def reconcile_payments(
+    chunk_size=RECONCILE_CHUNK_SIZE,
+    workers=RECONCILE_WORKERS,
+    rate=RECONCILE_RATE_LIMIT,
+    older_than=None,
+    dry_run=False,
+    on_mismatch=None,
+) -> ReconciliationReport:
+    """
+    Fetch the Cashfree status of all open Cashfree payments and apply it
+
+    Status fetches run on a bounded thread pool limited to ``rate`` calls per second,
+    results are applied to the payments on the calling thread.
+    """
+    from .payment import CashfreePaymentProvider
+
+    report = ReconciliationReport()
+    bucket = TokenBucket(rate)
+    providers = {}
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in pending_attempts(chunk_size, older_than):
+            jobs = []
+            for attempt in chunk:
+                event = attempt.payment.order.event
+                if event.pk not in providers:
+                    try:
+                        providers[event.pk] = CashfreePaymentProvider(event)
+                    except Exception as e:
+                        logger.warning("Cannot reconcile payments of %s: %s", event, e)
+                        providers[event.pk] = None
+                if providers[event.pk] is None:
+                    report.errors += 1
+                    continue
+                jobs.append((attempt, providers[event.pk]))
+
+            results = executor.map(
+                lambda job: _fetch(
+                    bucket,
+                    job[1].client_for(
+                        job[0].account or job[1].payment_account(job[0].payment)
+                    ),
+                    job[0],
+                ),
+                jobs,
+            )
+            for (attempt, prov), (x_request_id, order_entity, error) in zip(
+                jobs, results
+            ):
+                report.checked += 1
+                payment = attempt.payment
+                if error:
+                    logger.warning("Could not fetch status of %s: %s", payment, error)
+                    report.errors += 1
+                    continue
+                if order_entity is None:
+                    report.missing += 1
+                    continue
+                if order_entity.order_status not in TERMINAL_ORDER_STATUSES:
+                    continue
+
+                mismatch = Mismatch(
+                    order_code=payment.order.code,
+                    payment_id=payment.full_id,
+                    payment_state=payment.state,
+                    order_status=order_entity.order_status,
+                )
+                report.mismatches[order_entity.order_status] += 1
+                logger.info("Reconciliation mismatch: %s", mismatch)
+                if on_mismatch:
+                    on_mismatch(mismatch)
+                if dry_run:
+                    continue
+
+                try:
+                    prov._apply_cashfree_order(payment, x_request_id, order_entity)
+                    set_order_status(order_entity)
+                    report.updated += 1
+                except Exception as e:
+                    logger.exception("Could not reconcile %s: %s", payment, e)
+                    report.errors += 1
+
+    report.duration = time.monotonic() - start
+    return report
@@ -0,0 +1,297 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from django.db import transaction
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderRefund
+
+from .constants import (
+    REFUND_CHUNK_SIZE,
+    REFUND_CONCURRENCY,
+    REFUND_QUEUED_KEY,
+    REFUND_RATE_LIMIT,
+    REFUND_STATUS_CANCELLED,
+    REFUND_STATUS_SUCCESS,
+)
+from .ratelimit import TokenBucket, background
+from .resilience import is_transient
+from .utils import create_request_id
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+REFUND_FINAL_STATUSES = (REFUND_STATUS_SUCCESS, REFUND_STATUS_CANCELLED)
+
+
+@dataclass
+class RefundPollReport:
+    checked: int = 0
+    updated: int = 0
+    errors: int = 0
+    duration: float = 0
+
+
+@dataclass
+class RefundReport:
+    submitted: int = 0
+    failed: int = 0
+    deferred: int = 0
+    duration: float = 0
+
+    @property
+    def throughput(self):
+        return self.submitted / self.duration if self.duration else 0
+
+
+def queued_refunds():
+    """
+    Cashfree refunds ``execute_refund`` queued which have not been submitted yet
+
+    Refunds stay queued when an event stops queueing refunds later on. Refunds
+    created in other ways, e.g. through the API, are never picked up.
+    """
+    return OrderRefund.objects.filter(
+        provider="cashfree",
+        state=OrderRefund.REFUND_STATE_TRANSIT,
+        info__contains=f'"{REFUND_QUEUED_KEY}"',
+    ).exclude(info__contains='"cf_refund_id"')
+
+
+def in_transit_refunds():
+    """
+    Cashfree refunds which have been submitted but are not final yet
+    """
+    return OrderRefund.objects.filter(
+        provider="cashfree",
+        state=OrderRefund.REFUND_STATE_TRANSIT,
+        info__contains='"cf_refund_id"',
+    )
+
+
+def _submit(bucket, client, order_id, create_refund_request):
+    """
+    Create a refund at Cashfree within the shared rate budget
+
+    The client retries transient errors and fetches a refund which an earlier,
+    interrupted run already created, as its ``refund_id`` is the pretix refund id.
+    """
+    x_request_id = create_request_id()
+    bucket.acquire()
+    try:
+        with background():
+            refund_entity = client.create_refund(
+                order_id=order_id,
+                create_refund_request=create_refund_request,
+                x_request_id=x_request_id,
+            )
+        return x_request_id, refund_entity, None
+    except Exception as e:
+        return x_request_id, None, e
+
+
+def _write_results(results, report):
+    submitted = []
+    for prov, refund, x_request_id, refund_entity, error in results:
+        if refund_entity:
+            refund.info_data = prov._create_refund_info(
+                x_request_id=x_request_id, refund_entity=refund_entity
+            )
+            submitted.append((prov, refund, refund_entity))
+        elif is_transient(error):
+            logger.warning("Refund %s deferred: %s", refund.full_id, error)
+            report.deferred += 1
+        else:
+            logger.error("Refund %s failed: %s", refund.full_id, error)
+            with transaction.atomic():
+                refund.state = OrderRefund.REFUND_STATE_FAILED
+                refund.save(update_fields=["state"])
+                refund.order.log_action(
+                    "pretix.event.order.refund.failed",
+                    {
+                        "local_id": refund.local_id,
+                        "provider": refund.provider,
+                        "error": str(error),
+                    },
+                )
+            report.failed += 1
+
+    # Refunds still in progress at Cashfree are written in bulk, final ones one by one
+    finished = []
+    for prov, refund, refund_entity in submitted:
+        if refund_entity.refund_status in REFUND_FINAL_STATUSES:
+            finished.append((prov, refund, refund_entity))
+        else:
+            refund.state = OrderRefund.REFUND_STATE_TRANSIT
+    OrderRefund.objects.bulk_update(
+        [refund for _, refund, _ in submitted], ["info", "state"]
+    )
+    for prov, refund, refund_entity in finished:
+        prov._handle_cashfree_refund_status(refund, refund_entity)
+    report.submitted += len(submitted)
+
+
+@scopes_disabled()
+def execute_refunds(
+    queryset=None,
+    concurrency=REFUND_CONCURRENCY,
+    rate=REFUND_RATE_LIMIT,
+    chunk_size=REFUND_CHUNK_SIZE,
+    progress=None,
+) -> RefundReport:
+    """
+    Submit queued Cashfree refunds concurrently within a rate and concurrency budget
+
+    Refunds are processed in chunks and each chunk is written back before the next
+    one starts, so an interrupted run can simply be started again.
+    """
+    from .payment import CashfreePaymentProvider
+
+    queryset = queued_refunds() if queryset is None else queryset
+    queryset = queryset.select_related("order__event__organizer", "payment").order_by(
+        "pk"
+    )
+    report = RefundReport()
+    bucket = TokenBucket(rate)
+    providers = {}
+    start = time.monotonic()
+    last_pk = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+
+            jobs = []
+            for refund in chunk:
+                event = refund.order.event
+                if event.pk not in providers:
+                    providers[event.pk] = CashfreePaymentProvider(event)
+                prov = providers[event.pk]
+                jobs.append(
+                    (
+                        prov,
+                        refund,
+                        refund.order.full_code,
+                        prov._create_refund_request(refund),
+                    )
+                )
+
+            futures = [
+                executor.submit(
+                    _submit,
+                    bucket,
+                    prov.client_for(prov.payment_account(refund.payment)),
+                    order_id,
+                    request,
+                )
+                for prov, refund, order_id, request in jobs
+            ]
+            _write_results(
+                [
+                    (prov, refund, *future.result())
+                    for (prov, refund, _, _), future in zip(jobs, futures)
+                ],
+                report,
+            )
+            if progress:
+                progress(report)
+
+    report.duration = time.monotonic() - start
+    return report
+
+
+def _fetch(bucket, client, refund):
+    bucket.acquire()
+    try:
+        with background():
+            refund_entity = client.fetch_refund(
+                order_id=refund.order.full_code,
+                refund_id=refund.full_id,
+                x_request_id=create_request_id(),
+            )
+        return refund_entity, None
+    except Exception as e:
+        return None, e
+
+
+@scopes_disabled()
+def poll_refunds(
+    queryset=None,
+    concurrency=REFUND_CONCURRENCY,
+    rate=REFUND_RATE_LIMIT,
+    chunk_size=REFUND_CHUNK_SIZE,
+) -> RefundPollReport:
+    """
+    Fetch the status of in-transit refunds from Cashfree and apply changes
+
+    Refunds are read in keyset-paginated chunks and only refunds whose status has
+    changed are written, so a cycle costs a few queries per chunk.
+    """
+    from .payment import CashfreePaymentProvider
+
+    queryset = in_transit_refunds() if queryset is None else queryset
+    queryset = queryset.select_related("order__event__organizer", "payment").order_by(
+        "pk"
+    )
+    report = RefundPollReport()
+    bucket = TokenBucket(rate)
+    providers = {}
+    start = time.monotonic()
+    last_pk = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+
+            jobs = []
+            for refund in chunk:
+                event = refund.order.event
+                if event.pk not in providers:
+                    providers[event.pk] = CashfreePaymentProvider(event)
+                jobs.append((providers[event.pk], refund))
+
+            futures = [
+                executor.submit(
+                    _fetch,
+                    bucket,
+                    prov.client_for(prov.payment_account(refund.payment)),
+                    refund,
+                )
+                for prov, refund in jobs
+            ]
+            changed = []
+            for (prov, refund), future in zip(jobs, futures):
+                report.checked += 1
+                refund_entity, error = future.result()
+                if error:
+                    logger.warning("Could not poll %s: %s", refund.full_id, error)
+                    report.errors += 1
+                    continue
+                if refund_entity.refund_status == refund.info_data.get("refund_status"):
+                    continue
+                refund.info_data = prov._create_refund_info(
+                    x_request_id=refund.info_data.get("x_request_id"),
+                    refund_entity=refund_entity,
+                )
+                changed.append((prov, refund, refund_entity))
+
+            OrderRefund.objects.bulk_update(
+                [
+                    refund
+                    for _, refund, refund_entity in changed
+                    if refund_entity.refund_status not in REFUND_FINAL_STATUSES
+                ],
+                ["info"],
+            )
+            for prov, refund, refund_entity in changed:
+                if refund_entity.refund_status in REFUND_FINAL_STATUSES:
+                    prov._handle_cashfree_refund_status(refund, refund_entity)
+            report.updated += len(changed)
+
+    report.duration = time.monotonic() - start
+    return report
@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from django.db import close_old_connections
+
+from .capture import CapturedWebhook, capture_paused
+from .constants import REPLAY_CONCURRENCY
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+
+@dataclass
+class ReplayReport:
+    sent: int = 0
+    outcomes: Counter = field(default_factory=Counter)
+    latencies: list = field(default_factory=list)
+    # How far sending fell behind the captured schedule at most
+    lag: float = 0
+    duration: float = 0
+
+    @property
+    def throughput(self):
+        return self.sent / self.duration if self.duration else 0
+
+    def percentile(self, p) -> float:
+        if not self.latencies:
+            return 0
+        samples = sorted(self.latencies)
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def in_process_sender():
+    """
+    Send captured webhooks straight to ``webhook_view``, skipping the middleware
+
+    Replayed webhooks are not captured again, so a replay of the configured capture
+    log does not append to it.
+    """
+    from django.test import RequestFactory
+
+    from .views import webhook_view
+
+    factory = RequestFactory()
+
+    def send(record: CapturedWebhook):
+        headers = {
+            f"HTTP_{name.upper().replace('-', '_')}": value
+            for name, value in record.headers.items()
+            if name != "content-type"
+        }
+        request = factory.post(
+            "/_cashfree/webhook/",
+            data=record.body,
+            content_type=record.headers.get("content-type", "application/json"),
+            **headers,
+        )
+        try:
+            with capture_paused():
+                return webhook_view(request).status_code
+        finally:
+            close_old_connections()
+
+    return send
+
+
+def http_sender(url: str, concurrency: int = REPLAY_CONCURRENCY):
+    """
+    Send captured webhooks to the webhook URL of a running pretix
+    """
+    import urllib3
+
+    pool = urllib3.PoolManager(
+        maxsize=concurrency,
+        retries=False,
+        timeout=urllib3.Timeout(connect=5, read=30),
+    )
+
+    def send(record: CapturedWebhook):
+        response = pool.request("POST", url, body=record.body, headers=record.headers)
+        return response.status
+
+    return send
+
+
+def replay(records, send, speed=1.0, concurrency=REPLAY_CONCURRENCY) -> ReplayReport:
+    """
+    Send captured webhooks with ``send`` from ``concurrency`` threads
+
+    With a ``speed`` of 1 the webhooks are sent with the gaps they were captured
+    with, 10 sends them ten times as fast and 0 as fast as the threads handle them.
+    Outcomes are the status codes returned by ``send`` or the names of the
+    exceptions it raised.
+    """
+    report = ReplayReport()
+    lock = threading.Lock()
+    # Keeps only as many records in memory as are being sent
+    slots = threading.BoundedSemaphore(concurrency)
+
+    def run(record):
+        started = time.perf_counter()
+        try:
+            outcome = str(send(record))
+        except Exception as e:
+            logger.debug("Replaying webhook failed: %s", e)
+            outcome = type(e).__name__
+        finally:
+            slots.release()
+        with lock:
+            report.outcomes[outcome] += 1
+            report.latencies.append(time.perf_counter() - started)
+
+    started = time.monotonic()
+    first = None
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for record in records:
+            if first is None:
+                first = record.time
+            slots.acquire()
+            if speed:
+                delay = (record.time - first) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    report.lag = max(report.lag, -delay)
+            executor.submit(run, record)
+            report.sent += 1
+    report.duration = time.monotonic() - started
+    return report
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib3.exceptions import HTTPError
+
+from . import metrics
+from .constants import (
+    BREAKER_COOLDOWN,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_WINDOW,
+    CLIENT_BACKOFF_BASE,
+    CLIENT_BACKOFF_MAX,
+    CLIENT_HEDGE_WORKERS,
+)
+from .ratelimit import RateLimitExceeded
+from .utils import cache
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling Cashfree while the circuit breaker is open
+    """
+
+
+def is_transient(e) -> bool:
+    """
+    Whether an error is worth retrying and counts as Cashfree being unhealthy
+    """
+    if isinstance(e, (CircuitOpenError, RateLimitExceeded)):
+        return True
+    from cashfree_pg.exceptions import ApiException
+
+    if isinstance(e, ApiException):
+        return e.status == 429 or (e.status or 0) >= 500
+    return isinstance(e, (HTTPError, OSError))
+
+
+def backoff(attempt, base=CLIENT_BACKOFF_BASE, cap=CLIENT_BACKOFF_MAX) -> float:
+    """
+    Exponential backoff with full jitter
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker whose state lives in the shared cache, so all workers trip together
+
+    After ``threshold`` transient failures within ``window`` seconds all calls fail
+    fast for ``cooldown`` seconds. Afterwards a single probe call is let through,
+    its outcome closes the breaker or opens it again.
+    """
+
+    def __init__(
+        self,
+        name,
+        threshold=BREAKER_FAILURE_THRESHOLD,
+        window=BREAKER_WINDOW,
+        cooldown=BREAKER_COOLDOWN,
+    ):
+        self.name = name
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+
+    def _key(self, suffix):
+        return f"plugins:pretix_cashfree:breaker:{self.name}:{suffix}"
+
+    @property
+    def state(self) -> str:
+        keys = cache.get_many([self._key("open"), self._key("tripped")])
+        if self._key("open") in keys:
+            return "open"
+        if self._key("tripped") in keys:
+            return "half-open"
+        return "closed"
+
+    def allow(self) -> bool:
+        """
+        Raise ``CircuitOpenError`` unless a call may go through, returns whether the
+        call is a probe
+        """
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half-open" and cache.add(
+            self._key("probe"), 1, timeout=self.cooldown
+        ):
+            logger.info("Probing Cashfree through half-open breaker %s", self.name)
+            return True
+        metrics.inc(metrics.cashfree_circuit_breaker_rejected_total)
+        raise CircuitOpenError(f"Circuit breaker {self.name} is open")
+
+    def record_success(self, probe=False):
+        if probe:
+            logger.warning("Closing Cashfree circuit breaker %s", self.name)
+            cache.delete_many([self._key("tripped"), self._key("probe")])
+            metrics.inc(
+                metrics.cashfree_circuit_breaker_transitions_total, state="closed"
+            )
+
+    def record_failure(self, probe=False):
+        if probe:
+            self.trip()
+            return
+        key = self._key(f"failures:{int(time.time() // self.window)}")
+        cache.add(key, 0, timeout=self.window * 2)
+        try:
+            failures = cache.incr(key)
+        except ValueError:
+            return
+        if failures == self.threshold:
+            self.trip()
+
+    def trip(self):
+        logger.warning(
+            "Opening Cashfree circuit breaker %s for %ds", self.name, self.cooldown
+        )
+        # Once the open state has expired, what remains is half-open
+        cache.set(self._key("tripped"), 1, timeout=None)
+        cache.set(self._key("open"), 1, timeout=self.cooldown)
+        cache.delete(self._key("probe"))
+        metrics.inc(metrics.cashfree_circuit_breaker_transitions_total, state="open")
+
+
+_hedge_executor = None
+
+
+def hedged(fn, delay):
+    """
+    Call ``fn`` and, if it has not returned after ``delay`` seconds, call it a second
+    time concurrently. The first successful result wins.
+    """
+    global _hedge_executor
+    if _hedge_executor is None:
+        _hedge_executor = ThreadPoolExecutor(
+            max_workers=CLIENT_HEDGE_WORKERS, thread_name_prefix="cashfree-hedge"
+        )
+
+    pending = {_hedge_executor.submit(fn)}
+    done, _ = wait(pending, timeout=delay)
+    if not done:
+        metrics.inc(metrics.cashfree_hedged_requests_total)
+        pending.add(_hedge_executor.submit(fn))
+
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def ahedged(fn, delay):
+    """
+    Like ``hedged`` for a coroutine function, the slower call is cancelled
+    """
+    pending = {asyncio.ensure_future(fn())}
+    done, _ = await asyncio.wait(pending, timeout=delay)
+    if not done:
+        metrics.inc(metrics.cashfree_hedged_requests_total)
+        pending.add(asyncio.ensure_future(fn()))
+
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+    finally:
+        for future in pending:
+            future.cancel()
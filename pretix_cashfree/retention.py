@@ -0,0 +1,216 @@
+import json
+import logging
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, Length
+from django.utils.timezone import now
+
+from .constants import (
+    RETENTION_CHUNK_SIZE,
+    RETENTION_DAYS,
+    RETENTION_INBOX_DAYS,
+    RETENTION_KEPT_STATUSES,
+    RETENTION_ROW_OVERHEAD,
+)
+from .models import (
+    IdempotencyKey,
+    PaymentAttempt,
+    PaymentAttemptArchive,
+    PaymentAttemptHistory,
+    WebhookInboxEvent,
+)
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+ATTEMPT_TEXT_FIELDS = ("reference", "payment_session_id", "cf_order_id", "status")
+
+
+@dataclass
+class RetentionReport:
+    attempts: Counter = field(default_factory=Counter)
+    history: int = 0
+    inbox_events: int = 0
+    idempotency_keys: int = 0
+    bytes: int = 0
+    duration: float = 0
+
+
+def retention_policy() -> dict:
+    """
+    Retention in days by Cashfree order status, overridable in pretix.cfg with e.g.
+    ``retention_active = 365`` or ``retention_active = never``
+
+    Attempts of paid orders are never pruned, whatever the policy says.
+    """
+    policy = {}
+    for status, days in RETENTION_DAYS.items():
+        value = settings.CONFIG_FILE.get(
+            "pretix_cashfree", f"retention_{status.lower()}", fallback=days
+        )
+        policy[status] = None if value in (None, "never") else int(value)
+    return policy
+
+
+def archive_enabled() -> bool:
+    return (
+        settings.CONFIG_FILE.get("pretix_cashfree", "retention_action", fallback="")
+        != "delete"
+    )
+
+
+def stale_attempts(policy=None):
+    policy = retention_policy() if policy is None else policy
+    q = Q()
+    for status, days in policy.items():
+        if days is None:
+            continue
+        if status == "unknown":
+            by_status = Q(status__isnull=True) | ~Q(
+                status__in=[*policy, *RETENTION_KEPT_STATUSES]
+            )
+        else:
+            by_status = Q(status=status)
+        q |= by_status & Q(updated__lt=now() - timedelta(days=days))
+    if not q:
+        return PaymentAttempt.objects.none()
+    return PaymentAttempt.objects.filter(q).exclude(status__in=RETENTION_KEPT_STATUSES)
+
+
+def stale_inbox_events():
+    return WebhookInboxEvent.objects.filter(
+        received_at__lt=now() - timedelta(days=RETENTION_INBOX_DAYS)
+    )
+
+
+def delete_in_chunks(queryset, chunk_size=RETENTION_CHUNK_SIZE) -> int:
+    """
+    Delete the rows of ``queryset`` in small transactions, returns the number deleted
+    """
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by("pk").values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            queryset.model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+
+
+def _text_size(queryset, fields):
+    return sum(
+        queryset.aggregate(**{f: Coalesce(Sum(Length(f)), 0) for f in fields}).values()
+    )
+
+
+def _archive(attempt, history):
+    data = {
+        "reference": attempt.reference,
+        "payment": attempt.payment_id,
+        "cf_order_id": attempt.cf_order_id,
+        "status": attempt.status,
+        "amount": str(attempt.amount) if attempt.amount is not None else None,
+        "created": attempt.created.isoformat(),
+        "updated": attempt.updated.isoformat(),
+        "attempts": attempt.attempts,
+        "history": [(h.status, h.source, h.created.isoformat()) for h in history],
+    }
+    return PaymentAttemptArchive(
+        reference=attempt.reference,
+        status=attempt.status,
+        data=zlib.compress(json.dumps(data, separators=(",", ":")).encode()),
+    )
+
+
+def _estimate(report, attempts, inbox_events, idempotency_keys):
+    for row in attempts.values("status").annotate(n=Count("pk")):
+        report.attempts[row["status"] or "unknown"] += row["n"]
+    report.history = PaymentAttemptHistory.objects.filter(attempt__in=attempts).count()
+    report.inbox_events = inbox_events.count()
+    report.idempotency_keys = idempotency_keys.count()
+    report.bytes = (
+        _text_size(attempts, ATTEMPT_TEXT_FIELDS)
+        + _text_size(inbox_events, ("reference", "payload"))
+        + (
+            sum(report.attempts.values())
+            + report.history
+            + report.inbox_events
+            + report.idempotency_keys
+        )
+        * RETENTION_ROW_OVERHEAD
+    )
+
+
+def prune(
+    dry_run=False, chunk_size=RETENTION_CHUNK_SIZE, archive=None, policy=None
+) -> RetentionReport:
+    """
+    Remove PaymentAttempts, inbox events and idempotency keys past their retention
+
+    Attempts are archived to compressed rows in ``PaymentAttemptArchive`` unless
+    archiving is disabled. Rows are removed in keyset-paginated chunks, each in its
+    own short transaction, so no lock is held for long. With ``dry_run`` nothing
+    is changed and the report tells what would be removed.
+    """
+    archive = archive_enabled() if archive is None else archive
+    report = RetentionReport()
+    start = time.monotonic()
+    attempts = stale_attempts(policy)
+    inbox_events = stale_inbox_events()
+    idempotency_keys = IdempotencyKey.objects.filter(expires__lt=now())
+
+    if dry_run:
+        _estimate(report, attempts, inbox_events, idempotency_keys)
+        report.duration = time.monotonic() - start
+        return report
+
+    last_pk = 0
+    while True:
+        chunk = list(
+            attempts.filter(pk__gt=last_pk)
+            .prefetch_related("history")
+            .order_by("pk")[:chunk_size]
+        )
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+
+        pks = [a.pk for a in chunk]
+        with transaction.atomic():
+            if archive:
+                PaymentAttemptArchive.objects.bulk_create(
+                    [_archive(a, a.history.all()) for a in chunk]
+                )
+            history, _ = PaymentAttemptHistory.objects.filter(
+                attempt_id__in=pks
+            ).delete()
+            PaymentAttempt.objects.filter(pk__in=pks).delete()
+
+        for attempt in chunk:
+            report.attempts[attempt.status or "unknown"] += 1
+            report.bytes += RETENTION_ROW_OVERHEAD + sum(
+                len(getattr(attempt, f) or "") for f in ATTEMPT_TEXT_FIELDS
+            )
+        report.history += history
+        report.bytes += history * RETENTION_ROW_OVERHEAD
+
+    report.bytes += _text_size(inbox_events, ("reference", "payload"))
+    report.inbox_events = delete_in_chunks(inbox_events, chunk_size)
+    report.idempotency_keys = delete_in_chunks(idempotency_keys, chunk_size)
+    report.bytes += (report.inbox_events + report.idempotency_keys) * (
+        RETENTION_ROW_OVERHEAD
+    )
+
+    report.duration = time.monotonic() - start
+    logger.info(
+        "Pruned %d Cashfree payment attempts, %d inbox events and %d idempotency keys",
+        sum(report.attempts.values()),
+        report.inbox_events,
+        report.idempotency_keys,
+    )
+    return report
@@ -0,0 +1,30 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class CashfreePaymentInfo(BaseModel):
+    x_request_id: str
+    order_id: str
+    cf_order_id: str
+    order_status: str
+    order_amount: float
+    order_currency: str
+    customer_id: str
+    updated_at: str
+    # Merchant account holding the order, unset for orders created before pooling
+    account: Optional[str] = None
+
+
+class CashfreeRefundInfo(BaseModel):
+    x_request_id: str
+    order_id: str
+    refund_id: str
+    cf_refund_id: str
+    cf_payment_id: str
+    refund_type: str
+    refund_status: str
+    refund_amount: float
+    refund_currency: str
+    processed_at: Optional[str]
+    updated_at: str
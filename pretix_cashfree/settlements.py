@@ -0,0 +1,394 @@
+import csv
+import json
+import logging
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import is_naive, make_aware
+from itertools import islice
+from pretix.base.models import OrderPayment, OrderRefund
+from zoneinfo import ZoneInfo
+
+from .constants import SETTLEMENT_CHUNK_SIZE, SETTLEMENT_REPORT_TIMEZONE
+from .models import PaymentAttempt, SettlementEntry
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+EVENT_TYPE_PAYMENT = "PAYMENT"
+EVENT_TYPE_REFUND = "REFUND"
+
+# Columns of a Cashfree settlement report by field, under the names Cashfree used
+REPORT_COLUMNS = {
+    "event_id": ("event_id",),
+    "event_type": ("event_type", "type"),
+    "order_id": ("order_id", "merchant_order_id"),
+    "cf_payment_id": ("cf_payment_id", "payment_id"),
+    "amount": ("event_amount", "amount"),
+    "settlement_amount": ("event_settlement_amount", "settlement_amount"),
+    "service_charge": ("event_service_charge", "service_charge"),
+    "service_tax": ("event_service_tax", "service_tax"),
+    "settlement_id": ("cf_settlement_id", "settlement_id"),
+    "settlement_utr": ("settlement_utr", "utr"),
+    "event_time": ("event_time",),
+    "settled_at": ("settlement_date", "settled_at"),
+}
+AMOUNT_FIELDS = ("amount", "settlement_amount", "service_charge", "service_tax")
+TIME_FIELDS = ("event_time", "settled_at")
+REQUIRED_FIELDS = {"event_id", "event_type", "order_id"}
+
+EXPORT_COLUMNS = (
+    "type",
+    "event",
+    "order",
+    "order_id",
+    "local_id",
+    "account",
+    "date",
+    "state",
+    "currency",
+    "amount",
+    "cashfree_status",
+    "cashfree_id",
+    "settlement_id",
+    "settlement_utr",
+    "settled_at",
+    "settlement_amount",
+    "service_charge",
+    "service_tax",
+    "mismatch",
+)
+
+# Completed in pretix but missing from the settlement reports
+MISMATCH_NOT_SETTLED = "not_settled"
+# Settled by Cashfree but not completed in pretix
+MISMATCH_NOT_COMPLETED = "not_completed"
+MISMATCH_AMOUNT = "amount"
+# Settlement entry of a Cashfree order which is no payment or refund, e.g. a chargeback
+MISMATCH_UNMATCHED = "unmatched"
+
+
+@dataclass
+class SettlementImport:
+    rows: int = 0
+    skipped: int = 0
+    duration: float = 0
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", name.strip().lower()).strip("_")
+
+
+def _decimal(value):
+    return Decimal(value.replace(",", "")) if value else None
+
+
+def _datetime(value):
+    if not value:
+        return None
+    dt = parse_datetime(value)
+    if dt is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date {value!r}")
+        dt = datetime.combine(day, datetime.min.time())
+    if is_naive(dt):
+        dt = make_aware(dt, ZoneInfo(SETTLEMENT_REPORT_TIMEZONE))
+    return dt
+
+
+def _parse_row(row, columns):
+    values = {
+        field: row[index].strip() if index < len(row) else ""
+        for field, index in columns.items()
+    }
+    if not all(values[field] for field in REQUIRED_FIELDS):
+        return None
+    try:
+        for field in AMOUNT_FIELDS:
+            values[field] = _decimal(values.get(field))
+        for field in TIME_FIELDS:
+            values[field] = _datetime(values.get(field))
+    except (InvalidOperation, ValueError) as e:
+        logger.warning("Skipping settlement entry %s: %s", values["event_id"], e)
+        return None
+    values["event_type"] = values["event_type"].upper()
+    return SettlementEntry(**{k: None if v == "" else v for k, v in values.items()})
+
+
+def _save(entries):
+    with transaction.atomic():
+        SettlementEntry.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=["event_type", "event_id"],
+            update_fields=[
+                field
+                for field in (*REPORT_COLUMNS, "imported")
+                if field not in ("event_type", "event_id")
+            ],
+        )
+
+
+def import_settlements(lines, chunk_size=SETTLEMENT_CHUNK_SIZE) -> SettlementImport:
+    """
+    Import a Cashfree settlement report in CSV format from an iterable of lines
+
+    Entries are upserted in chunks of ``chunk_size``, each in its own transaction,
+    so reports of any size are read with flat memory and importing an overlapping
+    report again updates the entries already stored.
+    """
+    started = time.monotonic()
+    report = SettlementImport()
+    reader = csv.reader(lines)
+    names = [_normalize(name) for name in next(reader, [])]
+    columns = {}
+    for field, aliases in REPORT_COLUMNS.items():
+        index = next((names.index(a) for a in aliases if a in names), None)
+        if index is not None:
+            columns[field] = index
+    missing = REQUIRED_FIELDS - set(columns)
+    if missing:
+        raise ValueError(
+            f"Settlement report lacks the columns {', '.join(sorted(missing))}"
+        )
+
+    chunk = {}
+    for row in reader:
+        entry = _parse_row(row, columns)
+        if entry is None:
+            report.skipped += 1
+            continue
+        # A report may list an entry twice, the last one wins like in the table
+        chunk[(entry.event_type, entry.event_id)] = entry
+        if len(chunk) >= chunk_size:
+            _save(list(chunk.values()))
+            report.rows += len(chunk)
+            chunk = {}
+    if chunk:
+        _save(list(chunk.values()))
+        report.rows += len(chunk)
+
+    report.duration = time.monotonic() - started
+    return report
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _settlements(event_type, field, keys):
+    by_key = defaultdict(list)
+    if keys:
+        for entry in SettlementEntry.objects.filter(
+            event_type=event_type, **{f"{field}__in": keys}
+        ).iterator():
+            by_key[getattr(entry, field)].append(entry)
+    return by_key
+
+
+def _total(entries, field):
+    values = [getattr(e, field) for e in entries if getattr(e, field) is not None]
+    return sum(values) if values else None
+
+
+def _joined(entries, field):
+    return " ".join(sorted({getattr(e, field) for e in entries} - {None})) or None
+
+
+def _settlement_columns(entries, tz):
+    settled_at = max((e.settled_at for e in entries if e.settled_at), default=None)
+    return {
+        "settlement_id": _joined(entries, "settlement_id"),
+        "settlement_utr": _joined(entries, "settlement_utr"),
+        "settled_at": _isoformat(settled_at, tz),
+        "settlement_amount": _total(entries, "settlement_amount"),
+        "service_charge": _total(entries, "service_charge"),
+        "service_tax": _total(entries, "service_tax"),
+    }
+
+
+def _mismatches(entries, completed, amount):
+    flags = []
+    if completed and not entries:
+        flags.append(MISMATCH_NOT_SETTLED)
+    if entries and not completed:
+        flags.append(MISMATCH_NOT_COMPLETED)
+    settled = _total(entries, "amount")
+    if settled is not None and abs(settled) != abs(amount):
+        flags.append(MISMATCH_AMOUNT)
+    return " ".join(flags)
+
+
+def _isoformat(value, tz):
+    if value is None:
+        return None
+    return (value.astimezone(tz) if tz else value).isoformat()
+
+
+def _in_range(qs, field, start, end):
+    if start:
+        qs = qs.filter(**{f"{field}__gte": start})
+    if end:
+        qs = qs.filter(**{f"{field}__lt": end})
+    return qs
+
+
+def _payment_rows(events, start, end, tz, chunk_size):
+    qs = _in_range(
+        OrderPayment.objects.filter(
+            provider="cashfree", order__event__in=events
+        ).annotate(date=Coalesce("payment_date", "created")),
+        "date",
+        start,
+        end,
+    ).values(
+        "local_id",
+        "state",
+        "amount",
+        "date",
+        "order__code",
+        "order__event__slug",
+        "order__event__currency",
+        "paymentattempt__reference",
+        "paymentattempt__status",
+        "paymentattempt__account",
+    )
+    # A server-side cursor on PostgreSQL, rows are joined with their settlement
+    # entries one chunk at a time
+    for chunk in _chunks(qs.iterator(chunk_size=chunk_size), chunk_size):
+        settlements = _settlements(
+            EVENT_TYPE_PAYMENT,
+            "order_id",
+            [p["paymentattempt__reference"] for p in chunk],
+        )
+        for p in chunk:
+            # Only the payment holding the Cashfree order can have been settled
+            reference = p["paymentattempt__reference"]
+            entries = settlements.get(reference, []) if reference else []
+            completed = p["state"] in (
+                OrderPayment.PAYMENT_STATE_CONFIRMED,
+                OrderPayment.PAYMENT_STATE_REFUNDED,
+            )
+            yield {
+                "type": "payment",
+                "event": p["order__event__slug"],
+                "order": p["order__code"],
+                "order_id": reference,
+                "local_id": p["local_id"],
+                "account": p["paymentattempt__account"],
+                "date": _isoformat(p["date"], tz),
+                "state": p["state"],
+                "currency": p["order__event__currency"],
+                "amount": p["amount"],
+                "cashfree_status": p["paymentattempt__status"],
+                "cashfree_id": _joined(entries, "cf_payment_id"),
+                **_settlement_columns(entries, tz),
+                "mismatch": _mismatches(entries, completed, p["amount"]),
+            }
+
+
+def _refund_rows(events, start, end, tz, chunk_size):
+    qs = _in_range(
+        OrderRefund.objects.filter(
+            provider="cashfree", order__event__in=events
+        ).annotate(date=Coalesce("execution_date", "created")),
+        "date",
+        start,
+        end,
+    ).values(
+        "local_id",
+        "state",
+        "amount",
+        "date",
+        "info",
+        "order__code",
+        "order__event__slug",
+        "order__event__currency",
+    )
+    for chunk in _chunks(qs.iterator(chunk_size=chunk_size), chunk_size):
+        infos = [json.loads(r["info"] or "{}") for r in chunk]
+        settlements = _settlements(
+            EVENT_TYPE_REFUND,
+            "event_id",
+            [info["cf_refund_id"] for info in infos if info.get("cf_refund_id")],
+        )
+        for r, info in zip(chunk, infos):
+            entries = settlements.get(info.get("cf_refund_id"), [])
+            yield {
+                "type": "refund",
+                "event": r["order__event__slug"],
+                "order": r["order__code"],
+                "order_id": info.get("order_id"),
+                "local_id": r["local_id"],
+                "account": None,
+                "date": _isoformat(r["date"], tz),
+                "state": r["state"],
+                "currency": r["order__event__currency"],
+                "amount": r["amount"],
+                "cashfree_status": info.get("refund_status"),
+                "cashfree_id": info.get("cf_refund_id"),
+                **_settlement_columns(entries, tz),
+                "mismatch": _mismatches(
+                    entries, r["state"] == OrderRefund.REFUND_STATE_DONE, r["amount"]
+                ),
+            }
+
+
+def _unmatched_rows(events, start, end, tz, chunk_size):
+    # Entries are attributed to events through the Cashfree orders created for them,
+    # event slugs are only unique within an organizer. Payment and refund entries of
+    # those orders are listed with the payments and refunds they belong to.
+    attempts = PaymentAttempt.objects.filter(payment__order__event__in=events)
+    qs = _in_range(
+        SettlementEntry.objects.filter(order_id__in=attempts.values("reference"))
+        .exclude(event_type__in=(EVENT_TYPE_PAYMENT, EVENT_TYPE_REFUND))
+        .annotate(date=Coalesce("event_time", "settled_at")),
+        "date",
+        start,
+        end,
+    )
+    for entry in qs.iterator(chunk_size=chunk_size):
+        yield {
+            "type": entry.event_type.lower(),
+            "order_id": entry.order_id,
+            "date": _isoformat(entry.date, tz),
+            "amount": entry.amount,
+            "cashfree_id": entry.event_id,
+            **_settlement_columns([entry], tz),
+            "mismatch": MISMATCH_UNMATCHED,
+        }
+
+
+def iter_rows(events, start=None, end=None, tz=None, chunk_size=SETTLEMENT_CHUNK_SIZE):
+    """
+    Cashfree payments and refunds of ``events`` between ``start`` and ``end``, each
+    with the settlement entries it was matched with and the mismatches found, then
+    the other settlement entries of their Cashfree orders, e.g. chargebacks
+
+    Rows are read and yielded in chunks of ``chunk_size``, so memory stays flat
+    however many rows are exported.
+    """
+    yield from _payment_rows(events, start, end, tz, chunk_size)
+    yield from _refund_rows(events, start, end, tz, chunk_size)
+    yield from _unmatched_rows(events, start, end, tz, chunk_size)
+
+
+def write_rows(out, rows, format="csv"):
+    """
+    Write rows of ``iter_rows`` to the text stream ``out`` as CSV or JSON lines
+    """
+    if format == "jsonl":
+        for row in rows:
+            out.write(json.dumps(row, default=str) + "\n")
+        return
+    writer = csv.DictWriter(out, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
@@ -1,10 +1,25 @@
 # Register your receivers here
 from collections import OrderedDict
 from django import forms
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from pretix.base.forms import SecretKeySettingsField
-from pretix.base.signals import register_global_settings, register_payment_providers
+from pretix.base.models import (
+    Event,
+    Event_SettingsStore,
+    GlobalSettingsObject_SettingsStore,
+    Organizer_SettingsStore,
+)
+from pretix.base.signals import (
+    periodic_task,
+    register_global_settings,
+    register_multievent_data_exporters,
+    register_payment_providers,
+)
+from pretix.helpers.periodic import minimum_interval
+
+from .constants import REFUND_POLL_INTERVAL_MINUTES
 
 
 @receiver(register_payment_providers, dispatch_uid="payment_cashfree")
@@ -14,6 +29,13 @@ def register_payment_provider(sender, **kwargs):
     return CashfreePaymentProvider
 
 
+@receiver(register_multievent_data_exporters, dispatch_uid="cashfree_settlement_export")
+def register_settlement_exporter(sender, **kwargs):
+    from .exporters import SettlementExporter
+
+    return SettlementExporter
+
+
 @receiver(register_global_settings, dispatch_uid="cashfree_global_settings")
 def register_global_settings(sender, **kwargs):
     return OrderedDict(
@@ -32,5 +54,96 @@ def register_global_settings(sender, **kwargs):
                     required=False,
                 ),
             ),
+            (
+                "payment_cashfree_global_webhook_async",
+                forms.BooleanField(
+                    label=_("Process Cashfree webhooks asynchronously"),
+                    help_text=_(
+                        "Webhooks are acknowledged right after their signature has "
+                        "been verified and applied to the payment in the background."
+                    ),
+                    required=False,
+                ),
+            ),
         ]
     )
+
+
+@receiver(periodic_task, dispatch_uid="cashfree_webhook_inbox")
+def process_webhook_inbox(sender, **kwargs):
+    from .tasks import drain_webhook_inbox
+
+    drain_webhook_inbox()
+
+
+@receiver(periodic_task, dispatch_uid="cashfree_queued_refunds")
+@minimum_interval(minutes_after_success=5, minutes_after_error=5)
+def process_queued_refunds(sender, **kwargs):
+    from .tasks import process_queued_refunds
+
+    process_queued_refunds.apply_async()
+
+
+@receiver(periodic_task, dispatch_uid="cashfree_reconcile")
+@minimum_interval(minutes_after_success=30, minutes_after_error=10)
+def reconcile_pending_payments(sender, **kwargs):
+    from .tasks import reconcile_pending_payments
+
+    reconcile_pending_payments.apply_async()
+
+
+@receiver(periodic_task, dispatch_uid="cashfree_poll_refunds")
+@minimum_interval(minutes_after_success=REFUND_POLL_INTERVAL_MINUTES)
+def poll_in_transit_refunds(sender, **kwargs):
+    from .tasks import poll_in_transit_refunds
+
+    poll_in_transit_refunds.apply_async()
+
+
+@receiver(periodic_task, dispatch_uid="cashfree_prune_stale_data")
+@minimum_interval(minutes_after_success=24 * 60)
+def prune_stale_data(sender, **kwargs):
+    from .tasks import prune_stale_data
+
+    prune_stale_data.apply_async()
+
+
+@receiver(post_save, sender=Event, dispatch_uid="cashfree_event_saved")
+@receiver(post_save, sender=Event_SettingsStore, dispatch_uid="cashfree_settings_saved")
+@receiver(
+    post_delete, sender=Event_SettingsStore, dispatch_uid="cashfree_settings_deleted"
+)
+def invalidate_event_provider(sender, instance, **kwargs):
+    from .provider_cache import invalidate_provider
+
+    if sender is Event_SettingsStore and instance.key in (
+        "payment_cashfree_client_id",
+        "payment_cashfree_client_secret",
+    ):
+        # The set of webhook secrets, including pooled accounts, is shared by all events
+        invalidate_provider()
+    invalidate_provider(instance.pk if sender is Event else instance.object_id)
+
+
+@receiver(
+    post_save, sender=Organizer_SettingsStore, dispatch_uid="cashfree_orgsettings_saved"
+)
+@receiver(
+    post_delete,
+    sender=Organizer_SettingsStore,
+    dispatch_uid="cashfree_orgsettings_deleted",
+)
+@receiver(
+    post_save,
+    sender=GlobalSettingsObject_SettingsStore,
+    dispatch_uid="cashfree_globalsettings_saved",
+)
+@receiver(
+    post_delete,
+    sender=GlobalSettingsObject_SettingsStore,
+    dispatch_uid="cashfree_globalsettings_deleted",
+)
+def invalidate_all_providers(sender, **kwargs):
+    from .provider_cache import invalidate_provider
+
+    invalidate_provider()
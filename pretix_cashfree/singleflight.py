@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+import uuid
+
+from . import metrics
+from .constants import (
+    SINGLE_FLIGHT_LOCK_TIMEOUT,
+    SINGLE_FLIGHT_POLL_INTERVAL,
+    SINGLE_FLIGHT_RESULT_TTL,
+    SINGLE_FLIGHT_WAIT_TIMEOUT,
+)
+from .utils import cache
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+_MISSING = object()
+
+
+def _lock_key(key):
+    return f"plugins:pretix_cashfree:singleflight:{key}:lock"
+
+
+def _result_key(key, flight):
+    return f"plugins:pretix_cashfree:singleflight:{key}:result:{flight}"
+
+
+def _record(outcome, waited):
+    metrics.inc(metrics.cashfree_singleflight_calls_total, outcome=outcome)
+    metrics.inc(
+        metrics.cashfree_singleflight_wait_seconds_total, waited, outcome=outcome
+    )
+
+
+def single_flight(key, fn, wait_timeout=SINGLE_FLIGHT_WAIT_TIMEOUT):
+    """
+    Run ``fn`` at most once at a time for ``key`` across all workers sharing the cache.
+
+    Callers arriving while a call is in flight wait for it and share its result
+    instead of running ``fn`` themselves. The result has to be storable in the cache.
+    Returns a tuple of the result and whether this caller ran ``fn``.
+    """
+    start = time.monotonic()
+    deadline = start + wait_timeout
+    token = uuid.uuid4().hex
+
+    while time.monotonic() < deadline:
+        if cache.add(_lock_key(key), token, timeout=SINGLE_FLIGHT_LOCK_TIMEOUT):
+            _record("leader", time.monotonic() - start)
+            try:
+                result = fn()
+                cache.set(
+                    _result_key(key, token), result, timeout=SINGLE_FLIGHT_RESULT_TTL
+                )
+                return result, True
+            finally:
+                if cache.get(_lock_key(key)) == token:
+                    cache.delete(_lock_key(key))
+
+        flight = cache.get(_lock_key(key))
+        while flight is not None and time.monotonic() < deadline:
+            # The result is stored before the lock is released, so check the lock first
+            ended = cache.get(_lock_key(key)) != flight
+            result = cache.get(_result_key(key, flight), _MISSING)
+            if result is not _MISSING:
+                _record("coalesced", time.monotonic() - start)
+                return result, False
+            if ended:
+                # The flight failed without a result, try to take over
+                break
+            time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+
+    logger.warning("Timed out waiting for in-flight call %s", key)
+    _record("timeout", time.monotonic() - start)
+    return fn(), True
+
+
+async def asingle_flight(key, fn, wait_timeout=SINGLE_FLIGHT_WAIT_TIMEOUT):
+    """
+    Like ``single_flight`` for a coroutine function, waiting without blocking the loop
+
+    Leaders and waiters of both variants share the same flights.
+    """
+    start = time.monotonic()
+    deadline = start + wait_timeout
+    token = uuid.uuid4().hex
+
+    while time.monotonic() < deadline:
+        if cache.add(_lock_key(key), token, timeout=SINGLE_FLIGHT_LOCK_TIMEOUT):
+            _record("leader", time.monotonic() - start)
+            try:
+                result = await fn()
+                cache.set(
+                    _result_key(key, token), result, timeout=SINGLE_FLIGHT_RESULT_TTL
+                )
+                return result, True
+            finally:
+                if cache.get(_lock_key(key)) == token:
+                    cache.delete(_lock_key(key))
+
+        flight = cache.get(_lock_key(key))
+        while flight is not None and time.monotonic() < deadline:
+            ended = cache.get(_lock_key(key)) != flight
+            result = cache.get(_result_key(key, flight), _MISSING)
+            if result is not _MISSING:
+                _record("coalesced", time.monotonic() - start)
+                return result, False
+            if ended:
+                break
+            await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+
+    logger.warning("Timed out waiting for in-flight call %s", key)
+    _record("timeout", time.monotonic() - start)
+    return await fn(), True
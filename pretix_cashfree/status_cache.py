@@ -0,0 +1,42 @@
+from typing import TYPE_CHECKING
+
+import logging
+
+from .constants import ORDER_STATUS_CACHE_DEFAULT_TTL, ORDER_STATUS_CACHE_TTL
+from .utils import cache
+
+if TYPE_CHECKING:
+    from cashfree_pg.models.order_entity import OrderEntity
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+
+def _key(order_id):
+    return f"plugins:pretix_cashfree:order:{order_id}"
+
+
+def get_order_status(order_id: str):
+    """
+    Return the cached ``OrderEntity`` of a Cashfree order, if any
+    """
+    data = cache.get(_key(order_id))
+    if not data:
+        return None
+    from cashfree_pg.models.order_entity import OrderEntity
+
+    return OrderEntity.from_dict(data)
+
+
+def set_order_status(order_entity: "OrderEntity"):
+    """
+    Cache an ``OrderEntity``, terminal states are kept much longer than active ones
+    """
+    ttl = ORDER_STATUS_CACHE_TTL.get(
+        order_entity.order_status, ORDER_STATUS_CACHE_DEFAULT_TTL
+    )
+    cache.set(_key(order_entity.order_id), order_entity.to_dict(), timeout=ttl)
+
+
+def invalidate_order_status(order_id: str):
+    logger.debug("Invalidating cached status of Cashfree order %s", order_id)
+    cache.delete(_key(order_id))
@@ -0,0 +1,260 @@
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderPayment
+from pretix.base.services.tasks import ProfiledTask
+from pretix.celery_app import app
+
+from . import metrics
+from .constants import (
+    RECONCILE_MIN_AGE_MINUTES,
+    REFUND_SCHEDULE_DEBOUNCE,
+    WEBHOOK_INBOX_BATCH_SIZE,
+    WEBHOOK_INBOX_LOCK_TIMEOUT,
+    WEBHOOK_INBOX_MAX_ATTEMPTS,
+    WEBHOOK_INBOX_SCHEDULE_DEBOUNCE,
+)
+from .models import PaymentAttempt, WebhookInboxEvent
+from .utils import cache
+from .webhooks import parse_webhook
+
+logger = logging.getLogger("pretix.plugins.cashfree")
+
+
+def enqueue_webhook_event(payment, webhook):
+    """
+    Store a verified webhook in the inbox and schedule the inbox worker, webhooks
+    received in quick succession share one run
+    """
+    WebhookInboxEvent.objects.create(
+        payment=payment,
+        reference=webhook.order_id,
+        event_type=webhook.type,
+        payload=webhook.raw.decode(),
+    )
+    if settings.HAS_CELERY and cache.add(
+        "plugins:pretix_cashfree:webhook:inbox:scheduled",
+        1,
+        timeout=WEBHOOK_INBOX_SCHEDULE_DEBOUNCE,
+    ):
+        transaction.on_commit(
+            lambda: process_webhook_inbox.apply_async(
+                countdown=WEBHOOK_INBOX_SCHEDULE_DEBOUNCE
+            )
+        )
+
+
+def _paid_at(event):
+    try:
+        return parse_webhook(event.payload.encode()).paid_at
+    except ValueError:
+        return None
+
+
+def _process_payment_events(events):
+    from .provider_cache import get_provider
+
+    payment = events[0].payment
+    ids = [e.pk for e in events]
+
+    # Serialize processing per payment across all workers draining the inbox
+    lock_key = f"plugins:pretix_cashfree:webhook:inbox:lock:{payment.pk}"
+    if not cache.add(lock_key, 1, timeout=WEBHOOK_INBOX_LOCK_TIMEOUT):
+        logger.debug("Inbox events of %s are being processed elsewhere", payment)
+        return 0
+
+    try:
+        pending = WebhookInboxEvent.objects.filter(
+            pk__in=ids, processed_at__isnull=True
+        )
+        if not pending.exists():
+            return 0
+
+        try:
+            # All pending webhooks of a payment collapse into one status fetch
+            prov = get_provider(payment.order.event)
+            was_confirmed = prov._is_payment_confirmed(payment)
+            prov.verify_payment(payment, use_cache=False)
+            if not was_confirmed and prov._is_payment_confirmed(payment):
+                metrics.observe_confirmation_lag(_paid_at(events[0]), "inbox")
+        except Exception as e:
+            logger.exception("Error processing inbox events of %s: %s", payment, e)
+            pending.update(attempts=F("attempts") + 1, last_error=str(e))
+            exhausted = pending.filter(attempts__gte=WEBHOOK_INBOX_MAX_ATTEMPTS).count()
+            if exhausted:
+                # Left to the periodic reconciliation, the inbox does not retry them
+                logger.error(
+                    "Giving up on %d inbox events of %s after %d attempts",
+                    exhausted,
+                    payment,
+                    WEBHOOK_INBOX_MAX_ATTEMPTS,
+                )
+                metrics.inc(metrics.cashfree_webhook_inbox_exhausted_total, exhausted)
+            return 0
+
+        return pending.update(processed_at=now(), attempts=F("attempts") + 1)
+    finally:
+        cache.delete(lock_key)
+
+
+def drain_webhook_inbox(batch_size=WEBHOOK_INBOX_BATCH_SIZE):
+    """
+    Apply all pending inbox events in batches, returns the number of events processed
+    """
+    processed = 0
+    last_id = 0
+    with scopes_disabled():
+        while True:
+            batch = list(
+                WebhookInboxEvent.objects.filter(
+                    processed_at__isnull=True,
+                    attempts__lt=WEBHOOK_INBOX_MAX_ATTEMPTS,
+                    pk__gt=last_id,
+                )
+                .select_related("payment__order__event__organizer")
+                .order_by("pk")[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].pk
+
+            by_payment = OrderedDict()
+            for event in batch:
+                by_payment.setdefault(event.payment_id, []).append(event)
+
+            for events in by_payment.values():
+                processed += _process_payment_events(events)
+
+    return processed
+
+
+@app.task(base=ProfiledTask)
+def process_webhook_inbox():
+    processed = drain_webhook_inbox()
+    logger.debug("Processed %d webhook inbox events", processed)
+
+
+@app.task(base=ProfiledTask)
+def reconcile_pending_payments():
+    from .reconciliation import reconcile_payments
+
+    report = reconcile_payments(
+        older_than=now() - timedelta(minutes=RECONCILE_MIN_AGE_MINUTES)
+    )
+    logger.info(
+        "Reconciled %d Cashfree payments (%.1f/s), %d updated, %d errors",
+        report.checked,
+        report.throughput,
+        report.updated,
+        report.errors,
+    )
+
+
+def schedule_order_precreation(payment, phone):
+    """
+    Create the Cashfree order of a payment in the background
+    """
+    if not settings.HAS_CELERY:
+        # The order is created on execute_payment instead
+        return
+    transaction.on_commit(
+        lambda: precreate_cashfree_order.apply_async(args=(payment.pk, phone.as_e164))
+    )
+
+
+@app.task(base=ProfiledTask)
+def precreate_cashfree_order(payment_id, phone):
+    from phonenumber_field.phonenumber import PhoneNumber
+
+    from .provider_cache import get_provider
+
+    with scopes_disabled():
+        payment = (
+            OrderPayment.objects.select_related("order__event__organizer")
+            .filter(
+                pk=payment_id,
+                state__in=(
+                    OrderPayment.PAYMENT_STATE_CREATED,
+                    OrderPayment.PAYMENT_STATE_PENDING,
+                ),
+            )
+            .first()
+        )
+        if payment is None:
+            return
+        attempt = PaymentAttempt.objects.filter(
+            reference=payment.order.full_code, payment=payment
+        ).first()
+        if attempt and attempt.has_valid_session():
+            return
+        try:
+            prov = get_provider(payment.order.event)
+            prov._create_order_entity(payment, PhoneNumber.from_string(phone))
+        except Exception as e:
+            # execute_payment creates the order itself
+            logger.warning("Could not pre-create Cashfree order of %s: %s", payment, e)
+
+
+def schedule_queued_refunds():
+    """
+    Schedule a batch run for queued refunds, refunds queued in quick succession share one run
+    """
+    if not settings.HAS_CELERY:
+        # Picked up by the periodic task instead
+        return
+    if cache.add(
+        "plugins:pretix_cashfree:refunds:scheduled",
+        1,
+        timeout=REFUND_SCHEDULE_DEBOUNCE,
+    ):
+        transaction.on_commit(
+            lambda: process_queued_refunds.apply_async(
+                countdown=REFUND_SCHEDULE_DEBOUNCE
+            )
+        )
+
+
+@app.task(base=ProfiledTask)
+def process_queued_refunds():
+    from .refunds import execute_refunds
+
+    lock_key = "plugins:pretix_cashfree:refunds:running"
+    if not cache.add(lock_key, 1, timeout=3600):
+        logger.debug("Queued refunds are already being processed")
+        return
+    try:
+        report = execute_refunds()
+    finally:
+        cache.delete(lock_key)
+    logger.info(
+        "Submitted %d queued Cashfree refunds (%.1f/s), %d failed, %d deferred",
+        report.submitted,
+        report.throughput,
+        report.failed,
+        report.deferred,
+    )
+
+
+@app.task(base=ProfiledTask)
+def prune_stale_data():
+    from .retention import prune
+
+    prune()
+
+
+@app.task(base=ProfiledTask)
+def poll_in_transit_refunds():
+    from .refunds import poll_refunds
+
+    report = poll_refunds()
+    logger.info(
+        "Polled %d in-transit Cashfree refunds, %d updated, %d errors",
+        report.checked,
+        report.updated,
+        report.errors,
+    )
@@ -1,17 +1,36 @@
 from django.urls import include, re_path
 
-from .views import redirect_view, return_view, webhook_view
+from .aio import async_views_enabled
+from .views import (
+    redirect_timing_view,
+    redirect_view,
+    return_view,
+    return_view_async,
+    webhook_view,
+    webhook_view_async,
+)
+
+# Under ASGI the views waiting for Cashfree can run without occupying a thread
+if async_views_enabled():
+    _return_view, _webhook_view = return_view_async, webhook_view_async
+else:
+    _return_view, _webhook_view = return_view, webhook_view
 
 event_patterns = [
     re_path(
         r"^cashfree/",
         include(
             [
-                re_path(r"^return/$", return_view, name="return"),
+                re_path(r"^return/$", _return_view, name="return"),
                 re_path(r"^redirect/$", redirect_view, name="redirect"),
+                re_path(
+                    r"^redirect/timing/$",
+                    redirect_timing_view,
+                    name="redirect_timing",
+                ),
                 re_path(
                     r"w/(?P<cart_namespace>[a-zA-Z0-9]{16})/return/",
-                    return_view,
+                    _return_view,
                     name="return",
                 ),
             ]
@@ -20,5 +39,5 @@ event_patterns = [
 ]
 
 urlpatterns = [
-    re_path(r"^_cashfree/webhook/$", webhook_view, name="webhook"),
+    re_path(r"^_cashfree/webhook/$", _webhook_view, name="webhook"),
 ]
@@ -1,4 +1,10 @@
 import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+
+# Prefer the shared redis cache so that state is visible to all workers
+cache = ConnectionProxy(caches, "redis" if "redis" in settings.CACHES else "default")
 
 
 def create_request_id():
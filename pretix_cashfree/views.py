@@ -1,154 +1,378 @@
-import json
 import logging
 from django.contrib import messages
-from django.http import HttpRequest, HttpResponse
+from django.core import signing
+from django.http import HttpRequest, HttpResponse, HttpResponseNotAllowed
 from django.shortcuts import render
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.clickjacking import xframe_options_exempt
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django_scopes import scopes_disabled
-from pretix.base.models import Order
+from pretix.base.models import Order, OrderPayment
+from pretix.base.payment import PaymentException
 from pretix.helpers.http import redirect_to_url
 from pretix.multidomain.urlreverse import eventreverse
+from urllib.parse import quote
 
+from . import metrics
+from .aio import run_blocking
+from .capture import capture_webhook
 from .constants import (
+    HOSTED_CHECKOUT_PRODUCTION,
+    HOSTED_CHECKOUT_SANDBOX,
+    REDIRECT_MODE_JS,
+    REDIRECT_MODE_SERVER,
+    REDIRECT_TIMING_MAX_AGE,
+    REDIRECT_TIMING_SALT,
     REDIRECT_URL_MODE,
     REDIRECT_URL_PAYMENT_SESSION_ID,
     RETURN_URL_PARAM,
     SESSION_KEY_ORDER_ID,
     WEBHOOK_TYPE_PAYMENT,
+    WEBHOOK_TYPE_REFUND,
 )
 from .models import PaymentAttempt
-from .payment import CashfreePaymentProvider
+from .provider_cache import get_provider, webhook_secrets
+from .utils import cache
+from .webhooks import match_secret, parse_webhook, peek_route, read_route_token
 
 logger = logging.getLogger("pretix.plugins.cashfree")
 
 
+def _get_payment_attempt(reference):
+    """
+    Load a ``PaymentAttempt`` along with its payment, order, event and organizer
+    """
+    return PaymentAttempt.objects.select_related(
+        "payment__order__event__organizer"
+    ).get(reference=reference)
+
+
+def _get_routed_payment(route, order_id):
+    """
+    Load the current payment of the Cashfree order of a route token along with its
+    order, event and organizer
+
+    Later payments of a pretix order reuse its Cashfree order and with it the token
+    naming the first payment, so the token only narrows the lookup to its event.
+    """
+    return OrderPayment.objects.select_related("order__event__organizer").get(
+        paymentattempt__reference=order_id, order__event_id=route.event_id
+    )
+
+
 @xframe_options_exempt
+@metrics.instrumented_view("redirect")
 def redirect_view(request, *args, **kwargs):
     payment_session_id = request.GET.get(REDIRECT_URL_PAYMENT_SESSION_ID, "")
+    sandbox = bool(request.event and request.event.testmode)
+    hosted_checkout_url = (
+        HOSTED_CHECKOUT_SANDBOX if sandbox else HOSTED_CHECKOUT_PRODUCTION
+    ) + quote(payment_session_id, safe="")
+
+    prov = get_provider(request.event)
+    if prov.settings.get("redirect_mode", default=REDIRECT_MODE_JS) == (
+        REDIRECT_MODE_SERVER
+    ):
+        # The buyer's browser does not need to start up Cashfree's SDK at all, there
+        # is no hand-off time to record
+        return redirect_to_url(hosted_checkout_url)
 
     r = render(
         request,
         "pretix_cashfree/redirect.html",
         {
             REDIRECT_URL_PAYMENT_SESSION_ID: payment_session_id,
-            REDIRECT_URL_MODE: (
-                "sandbox" if request.event and request.event.testmode else "production"
+            REDIRECT_URL_MODE: "sandbox" if sandbox else "production",
+            "hosted_checkout_url": hosted_checkout_url,
+            "timing_url": eventreverse(
+                request.event, "plugins:pretix_cashfree:redirect_timing"
             ),
+            "timing_token": _timing_token(request.event, payment_session_id),
         },
     )
     r._csp_ignore = True
     return r
 
 
-def return_view(request, *args, **kwargs):
+def _timing_token(event, payment_session_id):
+    """
+    Signed, timestamped reference to the payment session a redirect page was rendered for
+    """
+    signer = signing.TimestampSigner(salt=REDIRECT_TIMING_SALT)
+    return signer.sign(f"{event.pk}.{payment_session_id}")
+
+
+def _accept_timing_token(event, token):
+    """
+    Whether ``token`` was issued by ``redirect_view`` of ``event`` recently and has
+    not reported a timing yet
+    """
+    try:
+        value = signing.TimestampSigner(salt=REDIRECT_TIMING_SALT).unsign(
+            token, max_age=REDIRECT_TIMING_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    event_id, _, payment_session_id = value.partition(".")
+    if not payment_session_id or event_id != str(event.pk):
+        return False
+    # The signature is unique per token and short enough for any cache key
+    signature = token.rsplit(":", 1)[-1]
+    return cache.add(
+        f"plugins:pretix_cashfree:redirect:timing:{signature}",
+        1,
+        timeout=REDIRECT_TIMING_MAX_AGE,
+    )
+
+
+@csrf_exempt
+@require_POST
+def redirect_timing_view(request, *args, **kwargs):
+    """
+    Record how long the redirect page took to hand the buyer over to Cashfree
+
+    Only a page rendered by ``redirect_view`` can report, once, with the token it
+    was rendered with.
+    """
+    try:
+        elapsed = float(request.POST.get("elapsed", "")) / 1000
+    except ValueError:
+        return HttpResponse(status=400)
+    if not _accept_timing_token(request.event, request.POST.get("token", "")):
+        return HttpResponse(status=403)
+    if 0 <= elapsed < 120:
+        metrics.observe(
+            metrics.cashfree_redirect_handoff_seconds, elapsed, mode=REDIRECT_MODE_JS
+        )
+    return HttpResponse(status=204)
+
+
+def _checkout_redirect(request, urlkwargs, step):
+    urlkwargs["step"] = step
+    return redirect_to_url(
+        eventreverse(request.event, "presale:event.checkout", kwargs=urlkwargs)
+    )
+
+
+def _start_return(request, kwargs):
+    """
+    Match the return request with the Cashfree order stored in the session
+
+    Returns the URL kwargs, the payment to verify if any and an early response.
+    """
     urlkwargs = {}
     if "cart_namespace" in kwargs:
         urlkwargs["cart_namespace"] = kwargs["cart_namespace"]
 
     order_id = request.GET.get(RETURN_URL_PARAM, "")
+    session_order_id = request.session.get(SESSION_KEY_ORDER_ID)
 
-    if request.session.get(SESSION_KEY_ORDER_ID):
-        cashfree_object = PaymentAttempt.objects.get(
-            reference=request.session.get(SESSION_KEY_ORDER_ID)
-        )
-        payment = cashfree_object.payment
+    if session_order_id:
+        payment = _get_payment_attempt(session_order_id).payment
     else:
         payment = None
 
-    if order_id == str(request.session.get(SESSION_KEY_ORDER_ID, None)):
-        if payment:
-            prov = CashfreePaymentProvider(request.event)
-
-            if not prov.verify_payment(payment):
-                logger.error("Failed to process payment with id: %s", order_id)
-                messages.error(
-                    request,
-                    _(
-                        "Your payment could not be verified. Please contact support for help."
-                    ),
-                )
-                urlkwargs["step"] = "payment"
-                return redirect_to_url(
-                    eventreverse(
-                        request.event, "presale:event.checkout", kwargs=urlkwargs
-                    )
-                )
-    else:
+    if order_id != str(session_order_id):
         messages.error(request, _("Invalid response received from Cashfree"))
         logger.error(
             "The payment_id received from Cashfree does not match the one stored in the session under key '%s'",
             SESSION_KEY_ORDER_ID,
         )
-        urlkwargs["step"] = "payment"
-        return redirect_to_url(
-            eventreverse(request.event, "presale:event.checkout", kwargs=urlkwargs)
+        return urlkwargs, None, _checkout_redirect(request, urlkwargs, "payment")
+    return urlkwargs, payment, None
+
+
+def _finish_return(request, urlkwargs, payment, verified, error):
+    """
+    Send the buyer on according to the outcome of verifying their payment
+    """
+    if not payment:
+        return _checkout_redirect(request, urlkwargs, "confirm")
+
+    order_id = request.GET.get(RETURN_URL_PARAM, "")
+    if error is not None:
+        logger.warning("Could not verify payment with id: %s", order_id)
+        messages.error(
+            request,
+            str(error) or _("Your payment could not be verified. Please try again."),
         )
+        return _checkout_redirect(request, urlkwargs, "payment")
 
-    if payment:
-        return redirect_to_url(
-            eventreverse(
-                request.event,
-                "presale:event.order",
-                kwargs={"order": payment.order.code, "secret": payment.order.secret},
-            )
-            + ("?paid=yes" if payment.order.status == Order.STATUS_PAID else "")
+    if not verified:
+        logger.error("Failed to process payment with id: %s", order_id)
+        messages.error(
+            request,
+            _("Your payment could not be verified. Please contact support for help."),
         )
-    else:
-        urlkwargs["step"] = "confirm"
-        return redirect_to_url(
-            eventreverse(request.event, "presale:event.checkout", kwargs=urlkwargs)
+        return _checkout_redirect(request, urlkwargs, "payment")
+
+    return redirect_to_url(
+        eventreverse(
+            request.event,
+            "presale:event.order",
+            kwargs={"order": payment.order.code, "secret": payment.order.secret},
         )
+        + ("?paid=yes" if payment.order.status == Order.STATUS_PAID else "")
+    )
 
 
-@csrf_exempt
-@require_POST
-@scopes_disabled()
-def webhook_view(request: HttpRequest, *args, **kwargs):
+@metrics.instrumented_view("return")
+def return_view(request, *args, **kwargs):
+    urlkwargs, payment, response = _start_return(request, kwargs)
+    if response:
+        return response
 
-    try:
-        event_body = request.body.decode("utf-8").strip()
-        event_json = json.loads(event_body)
-        timestamp = request.headers["x-webhook-timestamp"]
-        signature = request.headers["x-webhook-signature"]
-    except Exception as e:
-        logger.exception("Failed to parse webhook payload: %s", e)
-        return HttpResponse(status=400)
+    verified = error = None
+    if payment:
+        try:
+            verified = get_provider(request.event).verify_payment(
+                payment, use_cache=False, hedge=True
+            )
+        except PaymentException as e:
+            error = e
+    return _finish_return(request, urlkwargs, payment, verified, error)
+
+
+@metrics.instrumented_view("return")
+async def return_view_async(request, *args, **kwargs):
+    """
+    ``return_view`` for ASGI, waiting for Cashfree without occupying a thread
+    """
+    urlkwargs, payment, response = await run_blocking(_start_return, request, kwargs)
+    if response:
+        return response
 
-    order_id = str(event_json["data"]["order"]["order_id"])
-    type = event_json["type"]
+    verified = error = None
+    if payment:
+        prov = await run_blocking(get_provider, request.event)
+        try:
+            verified = await prov.averify_payment(payment, use_cache=False, hedge=True)
+        except PaymentException as e:
+            error = e
+    return await run_blocking(
+        _finish_return, request, urlkwargs, payment, verified, error
+    )
+
+
+def _verify_webhook(request):
+    """
+    Check the signature of a webhook and attribute it to a payment
+
+    Returns the webhook, the payment and the provider, or an error response.
+    """
+    body = request.body
+    timestamp = request.headers.get("x-webhook-timestamp", "").encode()
+    signature = request.headers.get("x-webhook-signature", "").encode()
+
+    # Orders created by this plugin name their payment and merchant account in a
+    # signed tag, others are attributed after checking every configured secret. The
+    # tag is read from the raw body, nothing is parsed or looked up in the database
+    # for a webhook we did not sign.
+    route = peek_route(body)
+    secret = match_secret(
+        webhook_secrets(route and route.account), timestamp, signature, body
+    )
+    if secret is None:
+        logger.warning("Rejected webhook with invalid signature")
+        return None, None, None, HttpResponse(status=400)
+
+    # Only webhooks signed by Cashfree are captured, forged ones cannot fill the disk
+    capture_webhook(request)
+
+    try:
+        webhook = parse_webhook(body)
+    except ValueError as e:
+        logger.warning("Failed to parse webhook payload: %s", e)
+        return None, None, None, HttpResponse(status=400)
+    route = read_route_token(webhook.route)
 
-    if type != WEBHOOK_TYPE_PAYMENT:
-        logger.debug("webhook type: %s, aborting", type)
-        return HttpResponse(status=200)
+    if webhook.type not in (WEBHOOK_TYPE_PAYMENT, WEBHOOK_TYPE_REFUND):
+        logger.debug("webhook type: %s, aborting", webhook.type)
+        return None, None, None, HttpResponse(status=200)
 
+    order_id = webhook.order_id
     if not order_id:
-        logger.warning("Webhook payloads missing order_id: %s", event_json)
-        return HttpResponse(status=400)
+        logger.warning("Webhook payload missing order_id: %s", body)
+        return None, None, None, HttpResponse(status=400)
 
     try:
-        cashfree_object = PaymentAttempt.objects.get(reference=order_id)
-        prov = CashfreePaymentProvider(cashfree_object.payment.order.event)
+        if route:
+            payment = _get_routed_payment(route, order_id)
+            account = route.account
+        else:
+            attempt = _get_payment_attempt(order_id)
+            payment, account = attempt.payment, attempt.account
+        prov = get_provider(payment.order.event)
 
-    except PaymentAttempt.DoesNotExist:
-        logger.warning("No ReferencedCashfreeObject found for order_id=%s", order_id)
-        return HttpResponse(status=404)
+    except (PaymentAttempt.DoesNotExist, OrderPayment.DoesNotExist):
+        logger.warning("No payment found for order_id=%s", order_id)
+        return None, None, None, HttpResponse(status=404)
     except Exception as e:
-        logger.exception("Error while fetching ReferencedCashfreeObject: %s", e)
-        return HttpResponse(status=500)
+        logger.exception("Error while fetching payment of %s: %s", order_id, e)
+        return None, None, None, HttpResponse(status=500)
+
+    account = account or prov.payment_account(payment)
+    if prov.config_for(account).client_secret.encode() != secret:
+        logger.warning("Webhook for %s signed with another event's secret", order_id)
+        return None, None, None, HttpResponse(status=400)
+
+    return webhook, payment, prov, None
+
+
+@csrf_exempt
+@require_POST
+@scopes_disabled()
+@metrics.instrumented_view("webhook")
+def webhook_view(request: HttpRequest, *args, **kwargs):
+    webhook, payment, prov, response = _verify_webhook(request)
+    if response:
+        return response
 
     try:
-        logger.debug("Handling webhook for payment: %s", cashfree_object.payment)
-        prov.handle_webhook(
-            raw_payload=event_body,
-            signature=signature,
-            timestamp=timestamp,
-            payment=cashfree_object.payment,
-        )
+        if webhook.type == WEBHOOK_TYPE_REFUND:
+            logger.debug("Handling refund webhook for order: %s", webhook.order_id)
+            prov.handle_refund_webhook(webhook, order=payment.order)
+        else:
+            logger.debug("Handling webhook for payment: %s", payment)
+            prov.handle_webhook(webhook, payment=payment)
     except Exception as e:
         logger.warning("Error occured while processing webhook: %s", e)
         return HttpResponse(status=404)
 
     return HttpResponse(status=200)
+
+
+@metrics.instrumented_view("webhook")
+async def webhook_view_async(request: HttpRequest, *args, **kwargs):
+    """
+    ``webhook_view`` for ASGI, the payment is confirmed on the bounded executor
+    """
+    # Django's require_POST and scopes_disabled decorators only wrap sync views
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    with scopes_disabled():
+        webhook, payment, prov, response = await run_blocking(_verify_webhook, request)
+        if response:
+            return response
+
+        try:
+            if webhook.type == WEBHOOK_TYPE_REFUND:
+                logger.debug("Handling refund webhook for order: %s", webhook.order_id)
+                await run_blocking(
+                    prov.handle_refund_webhook,
+                    webhook,
+                    order=payment.order,
+                )
+            else:
+                logger.debug("Handling webhook for payment: %s", payment)
+                await prov.ahandle_webhook(webhook, payment=payment)
+        except Exception as e:
+            logger.warning("Error occured while processing webhook: %s", e)
+            return HttpResponse(status=404)
+
+    return HttpResponse(status=200)
+
+
+webhook_view_async.csrf_exempt = True
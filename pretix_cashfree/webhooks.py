@@ -0,0 +1,132 @@
+from typing import Optional
+
+import base64
+import hashlib
+import hmac
+import json
+import re
+from dataclasses import dataclass
+from django.core import signing
+
+from .constants import (
+    WEBHOOK_ROUTE_SALT,
+    WEBHOOK_ROUTE_TAG,
+    WEBHOOK_TYPE_PAYMENT,
+    WEBHOOK_TYPE_REFUND,
+)
+
+# The route tag as it appears in the raw body, a token holds no quotes or escapes
+_ROUTE_TAG_RE = re.compile(
+    rb'"%s"\s*:\s*"([^"\\]{1,512})"' % re.escape(WEBHOOK_ROUTE_TAG.encode())
+)
+
+
+@dataclass(frozen=True, slots=True)
+class CashfreeWebhook:
+    """
+    The fields of a verified Cashfree webhook this plugin acts on
+    """
+
+    type: str
+    order_id: str
+    raw: bytes
+    cf_payment_id: Optional[str] = None
+    payment_status: Optional[str] = None
+    paid_at: Optional[str] = None
+    refund: Optional[dict] = None
+    route: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class WebhookRoute:
+    """
+    The payment and merchant account a Cashfree order was created for
+    """
+
+    event_id: int
+    payment_id: int
+    account: str
+
+
+def route_token(event_id: int, payment_id: int, account: str) -> str:
+    """
+    Signed reference to a payment, sent along with its Cashfree order in ``order_tags``
+    """
+    signer = signing.Signer(salt=WEBHOOK_ROUTE_SALT)
+    return signer.sign(f"{event_id}.{payment_id}.{account}")
+
+
+def read_route_token(token: Optional[str]) -> Optional[WebhookRoute]:
+    """
+    The route a token of ``route_token`` points to, ``None`` if it is missing or forged
+    """
+    if not token or not isinstance(token, str):
+        return None
+    try:
+        value = signing.Signer(salt=WEBHOOK_ROUTE_SALT).unsign(token)
+        event_id, payment_id, account = value.split(".", 2)
+        return WebhookRoute(int(event_id), int(payment_id), account)
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def peek_route(body: bytes) -> Optional[WebhookRoute]:
+    """
+    The route tag of a raw, not yet verified webhook body, without parsing it
+
+    The token itself is signed, so it only selects the secrets the webhook signature
+    is checked against. A missing or forged token selects all of them.
+    """
+    match = _ROUTE_TAG_RE.search(body)
+    return read_route_token(match.group(1).decode()) if match else None
+
+
+def sign(secret: bytes, timestamp: bytes, body: bytes) -> bytes:
+    mac = hmac.new(secret, timestamp, hashlib.sha256)
+    mac.update(body)
+    return base64.b64encode(mac.digest())
+
+
+def match_secret(secrets, timestamp: bytes, signature: bytes, body: bytes):
+    """
+    Return the secret out of ``secrets`` the body has been signed with, if any
+
+    Cashfree signs ``timestamp + body`` with HMAC-SHA256. The MAC is computed over the
+    raw request bytes, so the body is not parsed before the signature matches; only
+    the route tag is looked up in it with ``peek_route`` to narrow ``secrets``.
+    """
+    for secret in secrets:
+        if hmac.compare_digest(sign(secret, timestamp, body), signature):
+            return secret
+    return None
+
+
+def parse_webhook(body: bytes) -> CashfreeWebhook:
+    """
+    Parse a webhook body, raises ``ValueError`` if it lacks the fields we need
+    """
+    try:
+        payload = json.loads(body)
+        type = payload["type"]
+        data = payload.get("data")
+        if type == WEBHOOK_TYPE_PAYMENT:
+            order, payment = data["order"], data["payment"]
+            return CashfreeWebhook(
+                type=type,
+                order_id=str(order["order_id"]),
+                raw=body,
+                cf_payment_id=str(payment["cf_payment_id"]),
+                payment_status=payment["payment_status"],
+                paid_at=payment.get("payment_time") or payload.get("event_time"),
+                route=(order.get("order_tags") or {}).get(WEBHOOK_ROUTE_TAG),
+            )
+        if type == WEBHOOK_TYPE_REFUND:
+            return CashfreeWebhook(
+                type=type,
+                order_id=str(data["refund"]["order_id"]),
+                raw=body,
+                refund=data["refund"],
+            )
+        return CashfreeWebhook(type=type, order_id="", raw=body)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed webhook payload: {e!r}") from e
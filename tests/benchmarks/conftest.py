@@ -0,0 +1,26 @@
+import os
+import pytest
+from fake_cashfree import FakeCashfree
+
+
+@pytest.fixture
+def fake_cashfree(event, monkeypatch, settings):
+    """
+    Run a local Cashfree stand-in and point the plugin at it
+    """
+    from pretix_cashfree.provider_cache import invalidate_provider
+
+    fake = FakeCashfree(
+        event.settings.payment_cashfree_client_id,
+        event.settings.payment_cashfree_client_secret,
+        latency=float(os.environ.get("CASHFREE_LOADTEST_LATENCY", 0)),
+        error_rate=float(os.environ.get("CASHFREE_LOADTEST_ERROR_RATE", 0)),
+    ).start()
+    settings.ALLOW_HTTP_TO_PRIVATE_NETWORKS = True
+    # Same as api_url in the [pretix_cashfree] section of pretix.cfg
+    monkeypatch.setenv("PRETIX_PRETIX_CASHFREE_API_URL", fake.api_url)
+    invalidate_provider()
+    yield fake
+    monkeypatch.undo()
+    invalidate_provider()
+    fake.stop()
@@ -0,0 +1,214 @@
+"""
+Local stand-in for the Cashfree PG API, used by the load tests
+
+Implements the endpoints the plugin calls, keeps orders and refunds in memory and
+signs webhooks like Cashfree does. Latency and 5xx errors can be injected.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+ROUTES = [
+    ("POST", re.compile(r"^/pg/orders$"), "create_order"),
+    ("GET", re.compile(r"^/pg/orders/(?P<order_id>[^/]+)$"), "fetch_order"),
+    ("POST", re.compile(r"^/pg/orders/(?P<order_id>[^/]+)/refunds$"), "create_refund"),
+    (
+        "GET",
+        re.compile(r"^/pg/orders/(?P<order_id>[^/]+)/refunds/(?P<refund_id>[^/]+)$"),
+        "fetch_refund",
+    ),
+]
+
+
+class FakeCashfree:
+    def __init__(self, client_id, client_secret, latency=0.0, error_rate=0.0):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = Counter()
+        # Calls being answered right now and the most seen at once
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.orders = {}
+        self.refunds = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def api_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/pg"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                status, data = fake.dispatch(
+                    self.command, self.path, self.headers, body
+                )
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = _handle
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def dispatch(self, method, path, headers, body):
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                break
+        else:
+            return 404, {"message": "unknown endpoint", "code": "not_found"}
+
+        with self._lock:
+            self.calls[name] += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        if (
+            headers.get("x-client-id") != self.client_id
+            or headers.get("x-client-secret") != self.client_secret
+        ):
+            return 401, {"message": "authentication failed", "code": "auth_failed"}
+        if random.random() < self.error_rate:
+            return 500, {"message": "injected error", "code": "internal_error"}
+
+        kwargs = {k: unquote(v) for k, v in match.groupdict().items()}
+        with self._lock:
+            return getattr(self, name)(body=body, **kwargs)
+
+    def create_order(self, body, **kwargs):
+        order_id = body["order_id"]
+        if order_id in self.orders:
+            return 409, {"message": "order already exists", "code": "order_exists"}
+        self.orders[order_id] = {
+            "cf_order_id": str(len(self.orders) + 1),
+            "order_id": order_id,
+            "entity": "order",
+            "order_currency": body["order_currency"],
+            "order_amount": body["order_amount"],
+            "order_status": "ACTIVE",
+            "payment_session_id": f"session_{order_id}",
+            "customer_details": body["customer_details"],
+            "order_meta": body.get("order_meta"),
+        }
+        return 200, self.orders[order_id]
+
+    def fetch_order(self, order_id, **kwargs):
+        if order_id not in self.orders:
+            return 404, {"message": "order not found", "code": "order_not_found"}
+        return 200, self.orders[order_id]
+
+    def create_refund(self, order_id, body, **kwargs):
+        key = (order_id, body["refund_id"])
+        if key in self.refunds:
+            return 409, {"message": "refund already exists", "code": "refund_exists"}
+        self.refunds[key] = {
+            "cf_payment_id": "1",
+            "cf_refund_id": str(len(self.refunds) + 1),
+            "order_id": order_id,
+            "refund_id": body["refund_id"],
+            "entity": "refund",
+            "refund_amount": body["refund_amount"],
+            "refund_currency": "INR",
+            "refund_status": "PENDING",
+            "refund_type": "MERCHANT_INITIATED",
+        }
+        return 200, self.refunds[key]
+
+    def fetch_refund(self, order_id, refund_id, **kwargs):
+        if (order_id, refund_id) not in self.refunds:
+            return 404, {"message": "refund not found", "code": "refund_not_found"}
+        return 200, self.refunds[(order_id, refund_id)]
+
+    def sign(self, body):
+        """
+        Headers for a webhook body, as the Django test client expects them
+        """
+        timestamp = str(int(time.time() * 1000))
+        signature = base64.b64encode(
+            hmac.new(
+                self.client_secret.encode(), (timestamp + body).encode(), hashlib.sha256
+            ).digest()
+        ).decode()
+        return {
+            "HTTP_X_WEBHOOK_TIMESTAMP": timestamp,
+            "HTTP_X_WEBHOOK_SIGNATURE": signature,
+        }
+
+    def pay(self, order_id):
+        """
+        Complete the payment of an order, returns the signed payment webhook
+        """
+        with self._lock:
+            order = self.orders[order_id]
+            order["order_status"] = "PAID"
+            body = json.dumps(
+                {
+                    "type": "PAYMENT_SUCCESS_WEBHOOK",
+                    "event_time": time.strftime("%Y-%m-%dT%H:%M:%S+05:30"),
+                    "data": {
+                        "order": {
+                            "order_id": order_id,
+                            "order_amount": order["order_amount"],
+                        },
+                        "payment": {
+                            "cf_payment_id": f"pay_{order['cf_order_id']}",
+                            "payment_status": "SUCCESS",
+                            "payment_amount": order["order_amount"],
+                        },
+                    },
+                }
+            )
+        return body, self.sign(body)
+
+    def settle_refund(self, order_id, refund_id, status="SUCCESS"):
+        """
+        Move a refund to ``status``, returns the signed refund webhook
+        """
+        with self._lock:
+            refund = self.refunds[(order_id, refund_id)]
+            refund["refund_status"] = status
+            body = json.dumps(
+                {
+                    "type": "REFUND_STATUS_WEBHOOK",
+                    "event_time": time.strftime("%Y-%m-%dT%H:%M:%S+05:30"),
+                    "data": {"refund": refund},
+                }
+            )
+        return body, self.sign(body)
@@ -0,0 +1,126 @@
+"""
+Concurrent payment webhooks in one process, sync views on a thread pool vs async views
+
+Every webhook makes the plugin fetch the order from the Cashfree stand-in, whose
+latency dominates. Sync views wait for at most one fetch per thread, async views
+wait for all of them at once and only take executor threads for the database work.
+Concurrent webhooks need a database which allows concurrent writes::
+
+    PRETIX_CONFIG_FILE=postgres.cfg CASHFREE_LOADTEST_USERS=200 \\
+    CASHFREE_LOADTEST_CONCURRENCY=8 CASHFREE_LOADTEST_LATENCY=0.2 \\
+    python -m pytest tests/benchmarks/test_async_capacity.py -m benchmark -s
+
+``CASHFREE_LOADTEST_CONCURRENCY`` is the number of threads serving sync views.
+"""
+
+import asyncio
+import importlib.util
+import os
+import pytest
+import time
+from asgiref.sync import async_to_sync
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from django.test import RequestFactory
+from django_scopes import scopes_disabled
+from pretix.base.models import Order, OrderPayment
+
+from pretix_cashfree.models import PaymentAttempt
+from pretix_cashfree.views import webhook_view, webhook_view_async
+
+pytestmark = pytest.mark.benchmark
+
+USERS = int(os.environ.get("CASHFREE_LOADTEST_USERS", 50))
+THREADS = int(os.environ.get("CASHFREE_LOADTEST_CONCURRENCY", 8))
+
+
+def _paid_webhooks(event, fake, prefix, n):
+    """
+    Create ``n`` payments with an order paid at the stand-in, returns their webhooks
+    """
+    webhooks = []
+    with scopes_disabled():
+        for i in range(n):
+            order = Order.objects.create(
+                code=f"{prefix}{i}",
+                event=event,
+                email="dummy@dummy.test",
+                status=Order.STATUS_PENDING,
+                datetime=event.date_from,
+                expires=event.date_from,
+                total=23,
+                sales_channel=event.organizer.sales_channels.get(identifier="web"),
+            )
+            payment = order.payments.create(
+                provider="cashfree",
+                amount=order.total,
+                state=OrderPayment.PAYMENT_STATE_CREATED,
+            )
+            PaymentAttempt.objects.create(reference=order.full_code, payment=payment)
+            fake.create_order(
+                body={
+                    "order_id": order.full_code,
+                    "order_currency": "INR",
+                    "order_amount": 23.0,
+                    "customer_details": {
+                        "customer_id": "9999999999",
+                        "customer_phone": "9999999999",
+                    },
+                }
+            )
+            webhooks.append(fake.pay(order.full_code))
+    return webhooks
+
+
+def _request(body, headers):
+    return RequestFactory().post(
+        "/_cashfree/webhook/", body, content_type="application/json", **headers
+    )
+
+
+def _run_sync(webhooks):
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        return list(executor.map(lambda w: webhook_view(_request(*w)), webhooks))
+
+
+async def _run_async(webhooks):
+    return await asyncio.gather(*(webhook_view_async(_request(*w)) for w in webhooks))
+
+
+def _confirmed(prefix):
+    with scopes_disabled():
+        return OrderPayment.objects.filter(
+            order__code__startswith=prefix,
+            state=OrderPayment.PAYMENT_STATE_CONFIRMED,
+        ).count()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_webhook_capacity_sync_vs_async(locmem_cache, event, fake_cashfree):
+    if connection.vendor == "sqlite":
+        pytest.skip("SQLite does not support concurrent writers")
+
+    print()
+    print(
+        f"webhooks={USERS} sync threads={THREADS} latency={fake_cashfree.latency}s "
+        f"async client={'httpx' if importlib.util.find_spec('httpx') else 'executor'}"
+    )
+    for mode, prefix, run in (
+        ("sync", "SYNC", _run_sync),
+        ("async", "ASYNC", async_to_sync(_run_async)),
+    ):
+        webhooks = _paid_webhooks(event, fake_cashfree, prefix, USERS)
+        fake_cashfree.peak_in_flight = 0
+
+        start = time.perf_counter()
+        responses = run(webhooks)
+        duration = time.perf_counter() - start
+
+        print(
+            f"{mode:>5} throughput={USERS / duration:7.1f} webhooks/s "
+            f"peak concurrent Cashfree calls={fake_cashfree.peak_in_flight}"
+        )
+        assert all(r.status_code == 200 for r in responses)
+        assert _confirmed(prefix) == USERS
+        if mode == "sync":
+            assert fake_cashfree.peak_in_flight <= THREADS
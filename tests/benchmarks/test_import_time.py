@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+# Not marked benchmark: this is a regression guard which runs with the regular suite
+
+# What a pretix process loads from the plugin without handling a Cashfree payment
+STARTUP_IMPORTS = (
+    "import django; django.setup(); "
+    "import pretix_cashfree.signals, pretix_cashfree.urls, pretix_cashfree.payment, "
+    "pretix_cashfree.tasks, pretix_cashfree.views, pretix_cashfree.reconciliation"
+)
+
+
+def _importtime(code):
+    """
+    Run ``code`` in a fresh interpreter with ``-X importtime``, returns the longest
+    cumulative import time in microseconds of each top-level package
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env={
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": os.environ.get(
+                "DJANGO_SETTINGS_MODULE", "pretix.testutils.settings"
+            ),
+        },
+        check=True,
+    )
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[12:].split("|"))
+        if not cumulative.isdigit():
+            continue
+        package = name.split(".")[0]
+        packages[package] = max(packages.get(package, 0), int(cumulative))
+    return packages
+
+
+def test_startup_does_not_import_cashfree_sdk():
+    packages = _importtime(STARTUP_IMPORTS)
+
+    print()
+    print(
+        "pretix_cashfree import time: {:.1f} ms".format(
+            packages.get("pretix_cashfree", 0) / 1000
+        )
+    )
+    assert "pretix_cashfree" in packages
+    assert "cashfree_pg" not in packages
@@ -0,0 +1,174 @@
+"""
+Checkout → redirect → return → webhook against a local Cashfree stand-in
+
+Tune the run with environment variables. Concurrent runs need a database which
+allows concurrent writes, e.g. for sizing against PostgreSQL::
+
+    PRETIX_CONFIG_FILE=postgres.cfg CASHFREE_LOADTEST_USERS=500 \\
+    CASHFREE_LOADTEST_CONCURRENCY=16 CASHFREE_LOADTEST_LATENCY=0.15 \\
+    python -m pytest tests/benchmarks/test_load.py -m benchmark -s
+
+``CASHFREE_LOADTEST_ERROR_RATE`` makes the stand-in answer a share of calls with 500.
+"""
+
+import os
+import pytest
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection
+from django.test import Client, RequestFactory
+from django_scopes import scopes_disabled
+from phonenumber_field.phonenumber import PhoneNumber
+from pretix.base.models import Order, OrderPayment
+from urllib.parse import urlsplit
+
+from pretix_cashfree.provider_cache import get_provider
+
+pytestmark = pytest.mark.benchmark
+
+USERS = int(os.environ.get("CASHFREE_LOADTEST_USERS", 20))
+CONCURRENCY = int(os.environ.get("CASHFREE_LOADTEST_CONCURRENCY", 1))
+STEPS = ("checkout", "redirect", "return", "webhook")
+
+
+def _percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _create_payments(event, n):
+    with scopes_disabled():
+        payments = []
+        for i in range(n):
+            order = Order.objects.create(
+                code=f"LOAD{i}",
+                event=event,
+                email="dummy@dummy.test",
+                status=Order.STATUS_PENDING,
+                datetime=event.date_from,
+                expires=event.date_from,
+                total=23,
+                sales_channel=event.organizer.sales_channels.get(identifier="web"),
+            )
+            payments.append(
+                order.payments.create(
+                    provider="cashfree",
+                    amount=order.total,
+                    state=OrderPayment.PAYMENT_STATE_CREATED,
+                )
+            )
+    return payments
+
+
+def _user_journey(event, payment, fake):
+    """
+    Run one customer through the payment flow, returns step timings and query count
+    """
+    timings = {}
+    queries = QueryCounter()
+    client = Client()
+    with connection.execute_wrapper(queries), scopes_disabled():
+        # checkout: the provider creates the Cashfree order on payment confirmation
+        session = SessionStore()
+        request = RequestFactory().post("/")
+        request.event = event
+        request.session = session
+        prov = get_provider(event)
+        session[prov.payment_phone_session_key] = PhoneNumber.from_string(
+            "+919999999999"
+        )
+        t0 = time.perf_counter()
+        redirect_url = prov.execute_payment(request, payment)
+        timings["checkout"] = time.perf_counter() - t0
+        del session[prov.payment_phone_session_key]
+        session.save()
+        client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+        t0 = time.perf_counter()
+        response = client.get(
+            urlsplit(redirect_url)._replace(scheme="", netloc="").geturl()
+        )
+        timings["redirect"] = time.perf_counter() - t0
+        assert response.status_code == 200
+
+        # the customer pays at Cashfree and is sent back while the webhook is in flight
+        order_id = payment.order.full_code
+        webhook_body, webhook_headers = fake.pay(order_id)
+        return_url = fake.orders[order_id]["order_meta"]["return_url"]
+
+        t0 = time.perf_counter()
+        response = client.get(
+            urlsplit(return_url)._replace(scheme="", netloc="").geturl()
+        )
+        timings["return"] = time.perf_counter() - t0
+        assert response.status_code == 302
+
+        t0 = time.perf_counter()
+        response = client.post(
+            "/_cashfree/webhook/",
+            webhook_body,
+            content_type="application/json",
+            **webhook_headers,
+        )
+        timings["webhook"] = time.perf_counter() - t0
+    return timings, queries.count
+
+
+@pytest.mark.django_db(transaction=True)
+def test_payment_flow_under_load(locmem_cache, event, fake_cashfree):
+    if CONCURRENCY > 1 and connection.vendor == "sqlite":
+        pytest.skip("SQLite does not support concurrent writers")
+    payments = _create_payments(event, USERS)
+
+    samples = defaultdict(list)
+    query_counts = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        for timings, queries in executor.map(
+            lambda p: _user_journey(event, p, fake_cashfree), payments
+        ):
+            for step, duration in timings.items():
+                samples[step].append(duration)
+            query_counts.append(queries)
+    duration = time.perf_counter() - start
+
+    with scopes_disabled():
+        confirmed = OrderPayment.objects.filter(
+            pk__in=[p.pk for p in payments],
+            state=OrderPayment.PAYMENT_STATE_CONFIRMED,
+        ).count()
+    calls = sum(fake_cashfree.calls.values())
+
+    print()
+    print(
+        f"users={USERS} concurrency={CONCURRENCY} latency={fake_cashfree.latency}s "
+        f"error_rate={fake_cashfree.error_rate}"
+    )
+    print(f"throughput={USERS / duration:.1f} journeys/s confirmed={confirmed}")
+    for step in STEPS:
+        print(
+            f"{step:>9} p50={_percentile(samples[step], 0.5) * 1000:7.2f}ms "
+            f"p95={_percentile(samples[step], 0.95) * 1000:7.2f}ms "
+            f"p99={_percentile(samples[step], 0.99) * 1000:7.2f}ms"
+        )
+    print(
+        f"cashfree calls={dict(fake_cashfree.calls)} per confirmed payment={calls / max(confirmed, 1):.2f}"
+    )
+    print(f"db queries per journey={sum(query_counts) / len(query_counts):.1f}")
+
+    if not fake_cashfree.error_rate:
+        assert confirmed == USERS
+        # lookup and create on checkout, live fetch on return, fetch on webhook at most
+        assert calls / confirmed <= 4
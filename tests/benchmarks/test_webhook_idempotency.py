@@ -0,0 +1,40 @@
+import pytest
+import time
+from unittest import mock
+
+from pretix_cashfree.client import CashfreeClient
+from pretix_cashfree.idempotency import webhook_store
+
+pytestmark = pytest.mark.benchmark
+
+DUPLICATES = 500
+
+
+def _burst(client, body, headers):
+    timings = []
+    for _ in range(DUPLICATES):
+        t0 = time.perf_counter()
+        response = client.post(
+            "/_cashfree/webhook/", body, content_type="application/json", **headers
+        )
+        timings.append(time.perf_counter() - t0)
+        assert response.status_code == 200
+    return sorted(timings)[len(timings) // 2]
+
+
+@pytest.mark.django_db
+def test_duplicate_burst(locmem_cache, client, payment, make_webhook, order_entity):
+    body, headers = make_webhook(payment.order.full_code, 1)
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(payment.order.full_code, "ACTIVE")
+        hot = _burst(client, body, headers)
+
+        # Every duplicate has to be answered by the shared cache
+        with mock.patch.object(webhook_store.lru, "get", return_value=None):
+            warm = _burst(client, body, headers)
+
+    print()
+    print(
+        f"duplicates={DUPLICATES} median lru={hot * 1000:.2f}ms cache={warm * 1000:.2f}ms"
+    )
+    assert fetch_order.call_count == 1
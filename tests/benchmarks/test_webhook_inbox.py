@@ -0,0 +1,63 @@
+import pytest
+import time
+from django_scopes import scopes_disabled
+
+from pretix_cashfree.models import WebhookInboxEvent
+
+pytestmark = pytest.mark.benchmark
+
+WEBHOOKS_PER_ROUND = 100
+
+
+def _p99(samples):
+    samples = sorted(samples)
+    return samples[int(len(samples) * 0.99) - 1]
+
+
+def _post_webhooks(client, order, make_webhook, offset):
+    timings = []
+    for i in range(WEBHOOKS_PER_ROUND):
+        body, headers = make_webhook(order.full_code, offset + i)
+        t0 = time.perf_counter()
+        response = client.post(
+            "/_cashfree/webhook/", body, content_type="application/json", **headers
+        )
+        timings.append(time.perf_counter() - t0)
+        assert response.status_code == 200
+    return timings
+
+
+@pytest.mark.django_db
+def test_webhook_p99_is_flat_with_growing_backlog(client, event, payment, make_webhook):
+    event.settings.set("payment_cashfree_global_webhook_async", True)
+
+    results = []
+    for backlog in (0, 1000, 10000):
+        with scopes_disabled():
+            WebhookInboxEvent.objects.bulk_create(
+                [
+                    WebhookInboxEvent(
+                        payment=payment,
+                        reference=payment.order.full_code,
+                        event_type="PAYMENT_SUCCESS_WEBHOOK",
+                        payload="{}",
+                    )
+                    for _ in range(backlog - WebhookInboxEvent.objects.count())
+                ]
+            )
+        # warm up
+        _post_webhooks(client, payment.order, make_webhook, backlog * 10)
+        timings = _post_webhooks(
+            client, payment.order, make_webhook, backlog * 10 + WEBHOOKS_PER_ROUND
+        )
+        results.append((backlog, _p99(timings)))
+
+    print()
+    for backlog, p99 in results:
+        print(f"backlog={backlog:>6} webhook p99={p99 * 1000:.2f}ms")
+
+    # Acknowledging a webhook must not depend on how much work is queued
+    assert results[-1][1] < results[0][1] * 3
+    with scopes_disabled():
+        payment.refresh_from_db()
+        assert payment.state == payment.PAYMENT_STATE_CREATED
@@ -0,0 +1,54 @@
+import pytest
+import time
+from django.db import connection
+from unittest import mock
+
+from pretix_cashfree.client import CashfreeClient
+
+pytestmark = pytest.mark.benchmark
+
+DELIVERIES = 1000
+
+
+def _cpu_per_webhook(client, body, headers, status):
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    t0 = time.process_time()
+    with connection.execute_wrapper(count):
+        for _ in range(DELIVERIES):
+            response = client.post(
+                "/_cashfree/webhook/", body, content_type="application/json", **headers
+            )
+            assert response.status_code == status
+    return (time.process_time() - t0) / DELIVERIES, len(queries) / DELIVERIES
+
+
+@pytest.mark.django_db
+def test_cpu_cost_of_invalid_and_duplicate_webhooks(
+    locmem_cache, client, payment, make_webhook, order_entity
+):
+    body, headers = make_webhook(payment.order.full_code, 1)
+    forged = {**headers, "HTTP_X_WEBHOOK_SIGNATURE": "Zm9yZ2Vk"}
+
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(payment.order.full_code, "ACTIVE")
+        client.post(
+            "/_cashfree/webhook/", body, content_type="application/json", **headers
+        )
+
+        invalid, invalid_queries = _cpu_per_webhook(client, body, forged, 400)
+        duplicate, duplicate_queries = _cpu_per_webhook(client, body, headers, 200)
+
+    print()
+    print(
+        f"deliveries={DELIVERIES} cpu per webhook: invalid={invalid * 1e6:.0f}us "
+        f"({invalid_queries:.1f} queries) duplicate={duplicate * 1e6:.0f}us "
+        f"({duplicate_queries:.1f} queries)"
+    )
+    # Forged webhooks are dropped before the payload is parsed or the database is hit
+    assert invalid_queries == 0
+    assert fetch_order.call_count == 1
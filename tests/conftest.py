@@ -1 +1,203 @@
-# put your pytest fixtures here
+import base64
+import hashlib
+import hmac
+import json
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, Order, OrderPayment, Organizer
+
+from pretix_cashfree.models import PaymentAttempt
+
+CLIENT_ID = "TEST_CLIENT_ID"
+CLIENT_SECRET = "TEST_CLIENT_SECRET"
+
+
+@pytest.fixture(autouse=True)
+def idempotency_lru():
+    from pretix_cashfree.idempotency import webhook_store
+
+    webhook_store.lru.clear()
+
+
+@pytest.fixture
+def locmem_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    yield
+    from pretix_cashfree.utils import cache
+
+    cache.clear()
+
+
+@pytest.fixture
+def event():
+    with scopes_disabled():
+        organizer = Organizer.objects.create(name="Dummy", slug="dummy")
+        event = Event.objects.create(
+            organizer=organizer,
+            name="Dummy",
+            slug="dummy",
+            date_from=now(),
+            currency="INR",
+            plugins="pretix_cashfree",
+            live=True,
+        )
+    event.settings.set("payment_cashfree_client_id", CLIENT_ID)
+    event.settings.set("payment_cashfree_client_secret", CLIENT_SECRET)
+    event.settings.set("payment_cashfree__enabled", True)
+    return event
+
+
+@pytest.fixture
+def order(event):
+    with scopes_disabled():
+        return Order.objects.create(
+            code="FOO1",
+            event=event,
+            email="dummy@dummy.test",
+            status=Order.STATUS_PENDING,
+            datetime=now(),
+            expires=now() + timedelta(days=10),
+            total=Decimal("23.00"),
+            sales_channel=event.organizer.sales_channels.get(identifier="web"),
+        )
+
+
+@pytest.fixture
+def payment(order):
+    with scopes_disabled():
+        payment = order.payments.create(
+            provider="cashfree",
+            amount=order.total,
+            state=OrderPayment.PAYMENT_STATE_CREATED,
+        )
+        PaymentAttempt.objects.create(reference=order.full_code, payment=payment)
+    return payment
+
+
+def _sign(body):
+    timestamp = str(int(now().timestamp() * 1000))
+    signature = base64.b64encode(
+        hmac.new(
+            CLIENT_SECRET.encode(), (timestamp + body).encode(), hashlib.sha256
+        ).digest()
+    ).decode()
+    return {
+        "HTTP_X_WEBHOOK_TIMESTAMP": timestamp,
+        "HTTP_X_WEBHOOK_SIGNATURE": signature,
+    }
+
+
+def _make_webhook(order_id, cf_payment_id, type="PAYMENT_SUCCESS_WEBHOOK", route=None):
+    order = {"order_id": order_id, "order_amount": 23.0}
+    if route:
+        order["order_tags"] = {"pretix_route": route}
+    body = json.dumps(
+        {
+            "type": type,
+            "event_time": now().isoformat(),
+            "data": {
+                "order": order,
+                "payment": {
+                    "cf_payment_id": cf_payment_id,
+                    "payment_status": "SUCCESS",
+                    "payment_amount": 23.0,
+                },
+            },
+        }
+    )
+    return body, _sign(body)
+
+
+def _make_refund_webhook(order_id, refund_id, status="SUCCESS", amount=23.0):
+    body = json.dumps(
+        {
+            "type": "REFUND_STATUS_WEBHOOK",
+            "event_time": now().isoformat(),
+            "data": {
+                "refund": {
+                    "cf_payment_id": "5114910592817",
+                    "cf_refund_id": f"cf-{refund_id}",
+                    "order_id": order_id,
+                    "refund_id": refund_id,
+                    "entity": "refund",
+                    "refund_amount": amount,
+                    "refund_currency": "INR",
+                    "refund_status": status,
+                    "refund_type": "MERCHANT_INITIATED",
+                }
+            },
+        }
+    )
+    return body, _sign(body)
+
+
+@pytest.fixture
+def make_webhook():
+    """
+    Build a Cashfree webhook body and the headers signed with the test secret
+    """
+    return _make_webhook
+
+
+@pytest.fixture
+def make_refund_webhook():
+    """
+    Build a signed Cashfree refund status webhook
+    """
+    return _make_refund_webhook
+
+
+@pytest.fixture
+def order_entity():
+    """
+    Build a Cashfree ``OrderEntity`` as returned by the orders API
+    """
+    from cashfree_pg.models.order_entity import OrderEntity
+
+    def factory(order_id, status="PAID", amount=23.0):
+        return OrderEntity.from_dict(
+            {
+                "order_id": order_id,
+                "cf_order_id": "2149460581",
+                "order_status": status,
+                "order_amount": amount,
+                "order_currency": "INR",
+                "payment_session_id": "session_test",
+                "customer_details": {
+                    "customer_id": "9999999999",
+                    "customer_phone": "9999999999",
+                },
+            }
+        )
+
+    return factory
+
+
+@pytest.fixture
+def refund_entity():
+    """
+    Build a Cashfree ``RefundEntity`` as returned by the refunds API
+    """
+    from cashfree_pg.models.refund_entity import RefundEntity
+
+    def factory(order_id, refund_id, status="PENDING", amount=23.0):
+        return RefundEntity.from_dict(
+            {
+                "cf_payment_id": "5114910592817",
+                "cf_refund_id": f"cf-{refund_id}",
+                "order_id": order_id,
+                "refund_id": refund_id,
+                "entity": "refund",
+                "refund_amount": amount,
+                "refund_currency": "INR",
+                "refund_status": status,
+                "refund_type": "MERCHANT_INITIATED",
+            }
+        )
+
+    return factory
@@ -0,0 +1,96 @@
+import pytest
+from collections import Counter
+from django_scopes import scopes_disabled
+from phonenumber_field.phonenumber import PhoneNumber
+from unittest import mock
+
+from pretix_cashfree.accounts import route
+from pretix_cashfree.client import CashfreeClient, CashfreeConfig, breaker_for
+from pretix_cashfree.models import PaymentAttempt
+from pretix_cashfree.payment import CashfreePaymentProvider
+from pretix_cashfree.webhooks import read_route_token
+
+CONFIGS = [CashfreeConfig(f"CF{i}", f"secret{i}", sandbox=True) for i in range(3)]
+
+
+def test_route_is_stable_and_only_moves_orders_of_removed_accounts(locmem_cache):
+    keys = [f"DUMMY-ORDER{i}" for i in range(300)]
+    routed = {key: route(CONFIGS, key).client_id for key in keys}
+    assert routed == {key: route(CONFIGS, key).client_id for key in keys}
+    assert min(Counter(routed.values()).values()) > 50
+
+    for key in keys:
+        moved = route(CONFIGS[:2], key).client_id
+        assert moved == routed[key] or routed[key] == "CF2"
+
+
+def test_route_passes_over_unavailable_accounts(locmem_cache):
+    preferred = route(CONFIGS, "DUMMY-FOO1")
+    breaker_for(preferred).trip()
+    assert route(CONFIGS, "DUMMY-FOO1") != preferred
+
+    for config in CONFIGS:
+        breaker_for(config).trip()
+    assert route(CONFIGS, "DUMMY-FOO1") == preferred
+
+
+@pytest.mark.django_db
+def test_order_stays_with_its_routed_account(
+    locmem_cache, monkeypatch, event, payment, order_entity
+):
+    monkeypatch.setenv(
+        "PRETIX_PRETIX_CASHFREE_ACCOUNTS_TEST_CLIENT_ID", "SHARD_1, SHARD_2"
+    )
+    monkeypatch.setenv("PRETIX_PRETIX_CASHFREE_CLIENT_SECRET_SHARD_1", "secret-1")
+    monkeypatch.setenv("PRETIX_PRETIX_CASHFREE_CLIENT_SECRET_SHARD_2", "secret-2")
+    prov = CashfreePaymentProvider(event)
+    assert list(prov.configs) == ["TEST_CLIENT_ID", "SHARD_1", "SHARD_2"]
+
+    order_id = payment.order.full_code
+    account = route(prov.configs.values(), order_id).client_id
+    with mock.patch.object(
+        CashfreeClient, "create_order", autospec=True
+    ) as create_order, mock.patch.object(
+        CashfreeClient, "fetch_order", autospec=True
+    ) as fetch_order:
+        create_order.return_value = order_entity(order_id, status="ACTIVE")
+        fetch_order.return_value = order_entity(order_id, status="PAID")
+        with scopes_disabled():
+            prov._create_order_entity(payment, PhoneNumber.from_string("+919999999999"))
+            assert payment.info_data["account"] == account
+            assert PaymentAttempt.objects.get(reference=order_id).account == account
+
+            prov.verify_payment(payment, use_cache=False)
+            assert payment.info_data["account"] == account
+
+    assert create_order.call_args.args[0].config.client_id == account
+    order_tags = create_order.call_args.kwargs["create_order_request"].order_tags
+    assert read_route_token(order_tags["pretix_route"]).account == account
+    assert fetch_order.call_args.args[0].config.client_id == account
+
+
+@pytest.mark.django_db
+def test_later_payment_uses_the_account_of_the_order(
+    locmem_cache, monkeypatch, event, payment
+):
+    monkeypatch.setenv(
+        "PRETIX_PRETIX_CASHFREE_ACCOUNTS_TEST_CLIENT_ID", "SHARD_1, SHARD_2"
+    )
+    monkeypatch.setenv("PRETIX_PRETIX_CASHFREE_CLIENT_SECRET_SHARD_1", "secret-1")
+    monkeypatch.setenv("PRETIX_PRETIX_CASHFREE_CLIENT_SECRET_SHARD_2", "secret-2")
+    prov = CashfreePaymentProvider(event)
+    order_id = payment.order.full_code
+    routed = route(prov.configs.values(), order_id).client_id
+    account = next(a for a in prov.configs if a != routed)
+
+    with scopes_disabled():
+        PaymentAttempt.objects.filter(reference=order_id).update(
+            cf_order_id="1", account=account
+        )
+        retry = payment.order.payments.create(
+            provider="cashfree", amount=payment.amount
+        )
+        assert prov.payment_account(retry) == account
+
+        PaymentAttempt.objects.filter(reference=order_id).update(account=None)
+        assert prov.payment_account(retry) == "TEST_CLIENT_ID"
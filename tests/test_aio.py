@@ -0,0 +1,70 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderPayment
+from unittest import mock
+
+from pretix_cashfree.client import CashfreeClient, CashfreeConfig
+from pretix_cashfree.provider_cache import invalidate_provider
+from pretix_cashfree.views import webhook_view_async
+
+
+@pytest.fixture
+def clear_providers(db):
+    invalidate_provider()
+
+
+def test_async_client_retries_and_raises_sdk_errors(locmem_cache, order_entity):
+    httpx = pytest.importorskip("httpx")
+    from cashfree_pg.exceptions import NotFoundException
+
+    from pretix_cashfree.aio import AsyncCashfreeClient
+
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            return httpx.Response(503, json={"message": "busy"})
+        if request.url.path.endswith("/MISSING"):
+            return httpx.Response(404, json={"message": "order not found"})
+        return httpx.Response(200, json=order_entity("FOO1").to_dict())
+
+    async def run():
+        client = AsyncCashfreeClient(CashfreeConfig("id", "secret", sandbox=True))
+        client.http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        order = await client.fetch_order("FOO1", "x-request-id")
+        with pytest.raises(NotFoundException):
+            await client.fetch_order("MISSING", "x-request-id")
+        await client.aclose()
+        return order
+
+    with mock.patch("pretix_cashfree.aio.backoff", return_value=0):
+        order = async_to_sync(run)()
+    assert order.order_status == "PAID"
+    assert calls == ["/pg/orders/FOO1", "/pg/orders/FOO1", "/pg/orders/MISSING"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_webhook_view_confirms_payment(
+    locmem_cache, clear_providers, payment, make_webhook, order_entity
+):
+    order_id = payment.order.full_code
+    body, headers = make_webhook(order_id, 1)
+    request = RequestFactory().post(
+        "/_cashfree/webhook/", body, content_type="application/json", **headers
+    )
+
+    # Without httpx the async views fall back to the pooled client on the executor
+    with mock.patch(
+        "pretix_cashfree.aio.AsyncCashfreeClient", side_effect=ImportError
+    ), mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(order_id, "PAID")
+        response = async_to_sync(webhook_view_async)(request)
+
+    assert response.status_code == 200
+    assert fetch_order.call_count == 1
+    with scopes_disabled():
+        payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
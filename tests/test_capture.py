@@ -0,0 +1,102 @@
+import gzip
+import pytest
+import time
+from dataclasses import replace
+from unittest import mock
+
+from pretix_cashfree.capture import CapturedWebhook, capture_files, read_capture
+from pretix_cashfree.client import CashfreeClient
+from pretix_cashfree.replay import in_process_sender, replay
+
+
+@pytest.fixture
+def capture(tmp_path, monkeypatch):
+    path = str(tmp_path / "webhooks.gz")
+    monkeypatch.setenv("PRETIX_PRETIX_CASHFREE_WEBHOOK_CAPTURE", path)
+    return path
+
+
+@pytest.mark.django_db
+def test_webhooks_are_captured_and_rotated(
+    client, event, capture, monkeypatch, make_webhook
+):
+    # Every record after the first rotates the log, two rotated files are kept
+    monkeypatch.setenv("PRETIX_PRETIX_CASHFREE_WEBHOOK_CAPTURE_MAX_BYTES", "1")
+    monkeypatch.setenv("PRETIX_PRETIX_CASHFREE_WEBHOOK_CAPTURE_KEEP", "2")
+    sent = []
+    for i in range(4):
+        body, headers = make_webhook(f"DUMMY-ORDER{i}", i)
+        client.post(
+            "/_cashfree/webhook/", body, content_type="application/json", **headers
+        )
+        sent.append((body.encode(), headers["HTTP_X_WEBHOOK_SIGNATURE"]))
+
+    # Forged webhooks are not captured
+    headers["HTTP_X_WEBHOOK_SIGNATURE"] = "invalid"
+    client.post("/_cashfree/webhook/", body, content_type="application/json", **headers)
+
+    files = capture_files(capture)
+    assert len(files) == 3 and files[-1] == capture
+    records = list(read_capture(files))
+    assert [(r.body, r.headers["x-webhook-signature"]) for r in records] == sent[1:]
+    assert records[0].headers["content-type"] == "application/json"
+
+    # Records captured after the files were opened are not read
+    records = read_capture(files)
+    body, headers = make_webhook("DUMMY-ORDER4", 4)
+    client.post("/_cashfree/webhook/", body, content_type="application/json", **headers)
+    assert len(list(records)) == 3
+
+    # A record cut short by a killed worker ends the file without failing
+    with open(capture, "ab") as f:
+        f.write(gzip.compress(b'{"t": 1}\n')[:10])
+    assert len(list(read_capture([capture]))) == 1
+
+
+def test_replay_keeps_the_captured_pace():
+    records = [
+        CapturedWebhook(time=100.0 + i * 0.1, headers={}, body=b"{}") for i in range(4)
+    ]
+
+    def send(record):
+        if record.time > 100.25:
+            raise ValueError()
+        return 200
+
+    started = time.monotonic()
+    report = replay(records, send, speed=2, concurrency=2)
+    assert time.monotonic() - started >= 0.15
+    assert report.sent == 4
+    assert report.outcomes == {"200": 3, "ValueError": 1}
+    assert len(report.latencies) == 4
+
+    report = replay(records, lambda record: 200, speed=0)
+    assert report.duration < 0.15
+
+
+@pytest.mark.django_db(transaction=True)
+def test_replay_in_process(capture, payment, make_webhook, order_entity):
+    order_id = payment.order.full_code
+    body, headers = make_webhook(order_id, 1)
+    record = CapturedWebhook(
+        time=time.time(),
+        headers={
+            "content-type": "application/json",
+            "x-webhook-signature": headers["HTTP_X_WEBHOOK_SIGNATURE"],
+            "x-webhook-timestamp": headers["HTTP_X_WEBHOOK_TIMESTAMP"],
+        },
+        body=body.encode(),
+    )
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(order_id, "ACTIVE")
+        report = replay(
+            [record, record, replace(record, body=b"junk")],
+            in_process_sender(),
+            speed=0,
+            concurrency=1,
+        )
+    # The redelivery is acknowledged without being applied again
+    assert report.outcomes == {"200": 2, "400": 1}
+    assert fetch_order.call_count == 1
+    # Replayed webhooks are not captured again
+    assert capture_files(capture) == []
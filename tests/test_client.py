@@ -0,0 +1,29 @@
+from pretix_cashfree.client import CashfreeConfig, ClientRegistry
+
+
+def test_registry_reuses_client_per_event_and_environment():
+    registry = ClientRegistry()
+    config = CashfreeConfig(client_id="id", client_secret="secret", sandbox=True)
+
+    client = registry.get(1, config)
+    assert registry.get(1, config) is client
+    assert registry.get(2, config) is not client
+    assert registry.get(1, CashfreeConfig("id", "secret", False)) is not client
+
+
+def test_registry_replaces_client_on_credential_change():
+    registry = ClientRegistry()
+    client = registry.get(1, CashfreeConfig("id", "secret", True))
+
+    replaced = registry.get(1, CashfreeConfig("id", "rotated", True))
+    assert replaced is not client
+    assert replaced.config.client_secret == "rotated"
+
+
+def test_registry_evicts_idle_clients():
+    registry = ClientRegistry(idle_timeout=0)
+    config = CashfreeConfig("id", "secret", True)
+
+    client = registry.get(1, config)
+    client.last_used -= 1
+    assert registry.get(1, config) is not client
@@ -0,0 +1,86 @@
+import pytest
+import time
+from django_scopes import scopes_disabled
+from unittest import mock
+
+from pretix_cashfree.client import CashfreeClient
+from pretix_cashfree.idempotency import IdempotencyStore, LRUCache, webhook_store
+from pretix_cashfree.models import IdempotencyKey
+from pretix_cashfree.utils import cache
+
+
+def test_lru_is_bounded():
+    lru = LRUCache(maxsize=2)
+    lru.set("a", 1, ttl=60)
+    lru.set("b", 2, ttl=60)
+    lru.get("a")
+    lru.set("c", 3, ttl=60)
+    assert len(lru) == 2
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+
+
+@pytest.mark.django_db
+def test_discarded_key_is_accepted_by_other_processes(locmem_cache):
+    # Two workers sharing the cache and the database
+    first = IdempotencyStore("test", ttl=3600, lru_ttl=10)
+    second = IdempotencyStore("test", ttl=3600, lru_ttl=10)
+    assert first.add("key")
+    assert not second.add("key")
+
+    # Processing failed in the first worker, Cashfree retries on the second one
+    first.discard("key")
+    with mock.patch("time.monotonic", return_value=time.monotonic() + 11):
+        assert second.add("key")
+    assert not first.add("key")
+
+
+@pytest.mark.django_db
+def test_duplicate_webhooks_are_processed_once(
+    locmem_cache, client, payment, make_webhook, order_entity
+):
+    body, headers = make_webhook(payment.order.full_code, 1)
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(payment.order.full_code, "ACTIVE")
+        for _ in range(3):
+            response = client.post(
+                "/_cashfree/webhook/", body, content_type="application/json", **headers
+            )
+            assert response.status_code == 200
+        assert fetch_order.call_count == 1
+
+        # Without the process-local and shared layers the table still knows the key
+        webhook_store.lru.clear()
+        cache.clear()
+        client.post(
+            "/_cashfree/webhook/", body, content_type="application/json", **headers
+        )
+        assert fetch_order.call_count == 1
+
+    with scopes_disabled():
+        stored = IdempotencyKey.objects.get()
+    assert len(stored.digest) == 32
+
+
+@pytest.mark.django_db
+def test_failed_webhook_can_be_retried(
+    locmem_cache, client, payment, make_webhook, order_entity
+):
+    body, headers = make_webhook(payment.order.full_code, 1)
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.side_effect = OSError("connection reset")
+        response = client.post(
+            "/_cashfree/webhook/", body, content_type="application/json", **headers
+        )
+        assert response.status_code == 404
+
+        fetch_order.side_effect = None
+        fetch_order.return_value = order_entity(payment.order.full_code)
+        response = client.post(
+            "/_cashfree/webhook/", body, content_type="application/json", **headers
+        )
+        assert response.status_code == 200
+
+    with scopes_disabled():
+        payment.refresh_from_db()
+    assert payment.state == payment.PAYMENT_STATE_CONFIRMED
@@ -0,0 +1,63 @@
+import json
+import pytest
+import socket
+import urllib3
+from unittest import mock
+
+from pretix_cashfree import metrics
+
+
+@pytest.fixture
+def statsd(monkeypatch):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(1)
+    monkeypatch.setenv("PRETIX_PRETIX_CASHFREE_METRICS", "statsd")
+    monkeypatch.setenv("PRETIX_PRETIX_CASHFREE_STATSD_HOST", "127.0.0.1")
+    monkeypatch.setenv("PRETIX_PRETIX_CASHFREE_STATSD_PORT", str(sock.getsockname()[1]))
+    metrics.get_backend.cache_clear()
+
+    def received():
+        lines = []
+        try:
+            while True:
+                lines.append(sock.recv(1024).decode())
+        except socket.timeout:
+            return lines
+
+    yield received
+    monkeypatch.undo()
+    metrics.get_backend.cache_clear()
+    sock.close()
+
+
+@pytest.mark.django_db
+def test_webhook_is_instrumented(statsd, client, payment, make_webhook, order_entity):
+    body, headers = make_webhook(payment.order.full_code, 1)
+    response = urllib3.HTTPResponse(
+        body=json.dumps(order_entity(payment.order.full_code).to_dict()).encode(),
+        status=200,
+    )
+    with mock.patch.object(urllib3.PoolManager, "request", return_value=response):
+        for _ in range(2):
+            client.post(
+                "/_cashfree/webhook/", body, content_type="application/json", **headers
+            )
+
+    names = [line.split(":")[0] for line in statsd()]
+    assert names.count("pretix_cashfree_api_duration_seconds.fetch_order.success") == 1
+    assert "pretix_cashfree_webhook_dedupe_total.new" in names
+    assert "pretix_cashfree_webhook_dedupe_total.duplicate" in names
+    assert "pretix_cashfree_operation_duration_seconds.verify_payment.success" in names
+    assert "pretix_cashfree_confirmation_lag_seconds.webhook" in names
+    assert names.count("pretix_cashfree_view_duration_seconds.webhook.2xx") == 2
+
+
+def test_disabled_metrics_do_not_time(settings):
+    settings.METRICS_ENABLED = False
+    metrics.get_backend.cache_clear()
+    with mock.patch("time.perf_counter") as perf_counter:
+        with metrics.timed(metrics.cashfree_api_duration_seconds, "noop", method="x"):
+            pass
+    assert not perf_counter.called
+    metrics.get_backend.cache_clear()
@@ -0,0 +1,85 @@
+import pytest
+from django_scopes import scopes_disabled
+from unittest import mock
+
+from pretix_cashfree.client import CashfreeClient
+from pretix_cashfree.models import PaymentAttempt
+from pretix_cashfree.payment import CashfreePaymentProvider
+
+
+@pytest.mark.django_db
+def test_active_order_status_is_cached_until_webhook(
+    locmem_cache, client, event, payment, make_webhook, order_entity
+):
+    order_id = payment.order.full_code
+    prov = CashfreePaymentProvider(event)
+
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(order_id, status="ACTIVE")
+        with scopes_disabled():
+            assert prov.verify_payment(payment).order_status == "ACTIVE"
+            assert prov.verify_payment(payment).order_status == "ACTIVE"
+        assert fetch_order.call_count == 1
+
+        fetch_order.return_value = order_entity(order_id, status="PAID")
+        body, headers = make_webhook(order_id, 1)
+        response = client.post(
+            "/_cashfree/webhook/", body, content_type="application/json", **headers
+        )
+        assert response.status_code == 200
+        assert fetch_order.call_count == 2
+
+        with scopes_disabled():
+            payment.refresh_from_db()
+            assert payment.state == payment.PAYMENT_STATE_CONFIRMED
+            assert prov.verify_payment(payment).order_status == "PAID"
+        assert fetch_order.call_count == 2
+
+
+@pytest.mark.django_db
+def test_precreated_order_skips_round_trips(
+    locmem_cache, rf, event, payment, order_entity
+):
+    from pretix_cashfree.tasks import precreate_cashfree_order
+
+    order_id = payment.order.full_code
+    with mock.patch.object(
+        CashfreeClient, "create_order"
+    ) as create_order, mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        create_order.return_value = order_entity(order_id, status="ACTIVE")
+        precreate_cashfree_order(payment.pk, "+919999999999")
+        assert create_order.call_count == 1
+
+        request = rf.get("/")
+        request.event = event
+        request.session = {}
+        with scopes_disabled():
+            url = CashfreePaymentProvider(event).execute_payment(request, payment)
+        assert "payment_session_id=session_test" in url
+        assert request.session["payment_cashfree_pid"] == order_id
+        assert create_order.call_count == 1
+        fetch_order.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_payment_attempt_tracks_cashfree_state(
+    locmem_cache, event, payment, order_entity
+):
+    order_id = payment.order.full_code
+    prov = CashfreePaymentProvider(event)
+
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        with scopes_disabled():
+            for status in ("ACTIVE", "ACTIVE", "PAID"):
+                fetch_order.return_value = order_entity(order_id, status=status)
+                prov.verify_payment(payment, use_cache=False)
+
+            attempt = PaymentAttempt.objects.get(reference=order_id)
+            assert attempt.status == "PAID"
+            assert attempt.cf_order_id == "2149460581"
+            assert attempt.amount == payment.amount
+            assert attempt.session_expires is None
+            assert [(h.status, h.source) for h in attempt.history.order_by("pk")] == [
+                ("ACTIVE", "fetch"),
+                ("PAID", "fetch"),
+            ]
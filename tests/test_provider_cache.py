@@ -0,0 +1,45 @@
+import pytest
+from unittest import mock
+
+from pretix_cashfree.client import CashfreeClient
+from pretix_cashfree.payment import CashfreePaymentProvider
+from pretix_cashfree.provider_cache import get_provider, invalidate_provider
+
+
+@pytest.fixture(autouse=True)
+def clear_providers():
+    invalidate_provider()
+
+
+@pytest.mark.django_db
+def test_webhooks_reuse_provider(client, event, payment, make_webhook, order_entity):
+    order_id = payment.order.full_code
+    with mock.patch.object(
+        CashfreePaymentProvider,
+        "init_cashfree",
+        autospec=True,
+        side_effect=CashfreePaymentProvider.init_cashfree,
+    ) as init_cashfree, mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(order_id, status="ACTIVE")
+        for i in range(3):
+            body, headers = make_webhook(order_id, i)
+            response = client.post(
+                "/_cashfree/webhook/", body, content_type="application/json", **headers
+            )
+            assert response.status_code == 200
+        assert init_cashfree.call_count == 1
+
+
+@pytest.mark.django_db
+def test_settings_change_invalidates_provider(event):
+    prov = get_provider(event)
+    assert get_provider(event) is prov
+
+    event.settings.set("payment_cashfree_client_secret", "NEW_SECRET")
+    new_prov = get_provider(event)
+    assert new_prov is not prov
+    assert new_prov.config.client_secret == "NEW_SECRET"
+
+    event.testmode = True
+    event.save()
+    assert get_provider(event).config.sandbox
@@ -0,0 +1,51 @@
+import pytest
+from unittest import mock
+
+from pretix_cashfree.constants import RATE_LIMIT_PRIORITIES
+from pretix_cashfree.ratelimit import RateLimitExceeded, SharedRateLimiter, background
+
+
+@pytest.fixture
+def frozen():
+    with mock.patch(
+        "pretix_cashfree.ratelimit.time.time", return_value=1000.5
+    ), mock.patch.dict(
+        RATE_LIMIT_PRIORITIES, {"critical": (1.0, 0), "background": (0.5, 0)}
+    ):
+        yield
+
+
+def test_background_calls_leave_room_for_checkout(locmem_cache, frozen):
+    limiter = SharedRateLimiter("client", rate=4)
+    with background():
+        limiter.acquire()
+        limiter.acquire()
+        with pytest.raises(RateLimitExceeded):
+            limiter.acquire()
+
+    limiter.acquire()
+    limiter.acquire()
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire()
+
+
+def test_limit_is_shared_between_limiters_of_a_client(locmem_cache, frozen):
+    SharedRateLimiter("client", rate=1).acquire()
+    SharedRateLimiter("other", rate=1).acquire()
+    with pytest.raises(RateLimitExceeded):
+        SharedRateLimiter("client", rate=1).acquire()
+
+
+def test_caller_waits_for_next_window(locmem_cache):
+    limiter = SharedRateLimiter("client", rate=1)
+    clock = [1000.5]
+
+    def sleep(seconds):
+        clock[0] += seconds
+
+    with mock.patch(
+        "pretix_cashfree.ratelimit.time.time", side_effect=lambda: clock[0]
+    ), mock.patch("pretix_cashfree.ratelimit.time.sleep", side_effect=sleep) as slept:
+        limiter.acquire()
+        limiter.acquire()
+    assert slept.call_count == 1
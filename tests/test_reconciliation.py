@@ -0,0 +1,37 @@
+import pytest
+from django.core.management import call_command
+from django_scopes import scopes_disabled
+from io import StringIO
+from unittest import mock
+
+from pretix_cashfree.client import CashfreeClient
+from pretix_cashfree.reconciliation import reconcile_payments
+
+
+@pytest.mark.django_db
+def test_reconcile_applies_terminal_status(payment, order_entity):
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(payment.order.full_code, "PAID")
+        report = reconcile_payments(chunk_size=1)
+
+    assert report.checked == 1
+    assert report.updated == 1
+    assert report.mismatches == {"PAID": 1}
+    with scopes_disabled():
+        payment.refresh_from_db()
+    assert payment.state == payment.PAYMENT_STATE_CONFIRMED
+
+
+@pytest.mark.django_db
+def test_reconcile_command_dry_run(payment, order_entity):
+    out = StringIO()
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(payment.order.full_code, "EXPIRED")
+        call_command("cashfree_reconcile", "--dry-run", "--min-age=0", stdout=out)
+
+    assert (
+        f"{payment.full_id}: created in pretix, EXPIRED at Cashfree" in out.getvalue()
+    )
+    with scopes_disabled():
+        payment.refresh_from_db()
+    assert payment.state == payment.PAYMENT_STATE_CREATED
@@ -0,0 +1,145 @@
+import pytest
+from cashfree_pg.exceptions import ApiException, BadRequestException
+from django.core.management import call_command
+from django_scopes import scopes_disabled
+from io import StringIO
+from pretix.base.models import OrderPayment, OrderRefund
+from unittest import mock
+
+from pretix_cashfree.client import CashfreeClient
+from pretix_cashfree.refunds import in_transit_refunds, poll_refunds, queued_refunds
+
+
+@pytest.fixture
+def refunds(event, payment):
+    event.settings.set("payment_cashfree_queue_refunds", True)
+    with scopes_disabled():
+        payment.state = OrderPayment.PAYMENT_STATE_CONFIRMED
+        payment.save()
+        refunds = []
+        for _ in range(3):
+            refund = payment.order.refunds.create(
+                payment=payment,
+                source=OrderRefund.REFUND_SOURCE_ADMIN,
+                state=OrderRefund.REFUND_STATE_CREATED,
+                amount=payment.amount,
+                provider="cashfree",
+            )
+            refund.payment_provider.execute_refund(refund)
+            refunds.append(refund)
+    return refunds
+
+
+@pytest.mark.django_db
+def test_queued_refunds_are_submitted_idempotently(refunds, refund_entity):
+    order_id = refunds[0].order.full_code
+    with scopes_disabled():
+        assert queued_refunds().count() == 3
+
+    def request(name, method, path, x_request_id, body=None, retry=False):
+        assert retry
+        if name == "fetch_refund":
+            return refund_entity(order_id, refunds[1].full_id).to_dict()
+        if body["refund_id"] == refunds[1].full_id:
+            raise ApiException(status=409, reason="refund already exists")
+        if body["refund_id"] == refunds[2].full_id:
+            raise BadRequestException(status=400, reason="invalid amount")
+        return refund_entity(order_id, body["refund_id"], "SUCCESS").to_dict()
+
+    out = StringIO()
+    with mock.patch.object(CashfreeClient, "_request", side_effect=request):
+        call_command("cashfree_refund", "--rate=100", stdout=out)
+
+    assert "Submitted 2 refunds" in out.getvalue()
+    with scopes_disabled():
+        for refund in refunds:
+            refund.refresh_from_db()
+        assert queued_refunds().count() == 0
+    assert [r.state for r in refunds] == ["done", "transit", "failed"]
+    assert refunds[1].info_data["refund_id"] == refunds[1].full_id
+
+
+@pytest.mark.django_db
+def test_only_refunds_queued_by_the_plugin_are_submitted(event, refunds):
+    with scopes_disabled():
+        # e.g. created through the API, pretix did not ask to execute it
+        refunds[0].order.refunds.create(
+            payment=refunds[0].payment,
+            source=OrderRefund.REFUND_SOURCE_EXTERNAL,
+            state=OrderRefund.REFUND_STATE_TRANSIT,
+            amount=refunds[0].amount,
+            provider="cashfree",
+        )
+        assert queued_refunds().count() == 3
+
+
+@pytest.mark.django_db
+def test_refunds_stay_queued_when_queueing_is_switched_off(event, refunds):
+    event.settings.set("payment_cashfree_queue_refunds", False)
+    with scopes_disabled():
+        assert queued_refunds().count() == 3
+        assert refunds[0].payment_provider.refund_matching_id(refunds[0]) is None
+
+
+@pytest.fixture
+def in_transit(refunds, refund_entity):
+    with mock.patch.object(
+        CashfreeClient,
+        "create_refund",
+        side_effect=lambda order_id, create_refund_request, x_request_id: refund_entity(
+            order_id, create_refund_request.refund_id
+        ),
+    ):
+        call_command("cashfree_refund", "--rate=100", stdout=StringIO())
+    with scopes_disabled():
+        assert in_transit_refunds().count() == 3
+    return refunds
+
+
+@pytest.mark.django_db
+def test_refund_webhook_completes_refund(client, in_transit, make_refund_webhook):
+    refund = in_transit[0]
+    body, headers = make_refund_webhook(refund.order.full_code, refund.full_id)
+    response = client.post(
+        "/_cashfree/webhook/", body, content_type="application/json", **headers
+    )
+    assert response.status_code == 200
+    with scopes_disabled():
+        refund.refresh_from_db()
+    assert refund.state == OrderRefund.REFUND_STATE_DONE
+    assert refund.info_data["refund_status"] == "SUCCESS"
+
+
+@pytest.mark.django_db
+def test_refund_webhook_of_foreign_refund_is_acknowledged(
+    client, payment, make_refund_webhook
+):
+    # Refunded in the Cashfree dashboard, Cashfree must not retry it
+    for refund_id in ("dashboard-refund-1", f"{payment.order.code}-R-99"):
+        body, headers = make_refund_webhook(payment.order.full_code, refund_id)
+        response = client.post(
+            "/_cashfree/webhook/", body, content_type="application/json", **headers
+        )
+        assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_poller_writes_only_changed_refunds(in_transit, refund_entity):
+    statuses = {
+        in_transit[0].full_id: "SUCCESS",
+        in_transit[1].full_id: "CANCELLED",
+        in_transit[2].full_id: "PENDING",
+    }
+
+    def fetch_refund(order_id, refund_id, x_request_id):
+        return refund_entity(order_id, refund_id, statuses[refund_id])
+
+    with mock.patch.object(CashfreeClient, "fetch_refund", side_effect=fetch_refund):
+        report = poll_refunds(rate=100)
+
+    assert (report.checked, report.updated, report.errors) == (3, 2, 0)
+    with scopes_disabled():
+        for refund in in_transit:
+            refund.refresh_from_db()
+        assert in_transit_refunds().count() == 1
+    assert [r.state for r in in_transit] == ["done", "failed", "transit"]
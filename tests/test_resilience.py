@@ -0,0 +1,108 @@
+import json
+import pytest
+import threading
+import urllib3
+from cashfree_pg.exceptions import ServiceException
+from unittest import mock
+
+from pretix_cashfree.client import CashfreeClient, CashfreeConfig
+from pretix_cashfree.ratelimit import RateLimitExceeded
+from pretix_cashfree.resilience import CircuitBreaker, CircuitOpenError, hedged
+
+
+def _response(status, data=None):
+    return urllib3.HTTPResponse(body=json.dumps(data or {}).encode(), status=status)
+
+
+@pytest.fixture
+def no_sleep():
+    with mock.patch("pretix_cashfree.client.time.sleep"):
+        yield
+
+
+def test_breaker_opens_and_probes(locmem_cache):
+    breaker = CircuitBreaker("test", threshold=2, cooldown=30)
+    assert not breaker.allow()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    # Let the cooldown pass
+    from pretix_cashfree.utils import cache
+
+    cache.delete(breaker._key("open"))
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success(probe=True)
+    assert breaker.state == "closed"
+
+
+def test_only_idempotent_calls_are_retried(locmem_cache, no_sleep, order_entity):
+    client = CashfreeClient(CashfreeConfig("id", "secret", True))
+    with mock.patch.object(urllib3.PoolManager, "request") as request:
+        request.side_effect = [
+            _response(503),
+            _response(200, order_entity("ORDER-1").to_dict()),
+        ]
+        assert client.fetch_order("ORDER-1", "x").order_id == "ORDER-1"
+        assert request.call_count == 2
+        assert request.call_args.kwargs["timeout"].read_timeout == 5
+
+        request.reset_mock(side_effect=True)
+        request.return_value = _response(503)
+        with pytest.raises(ServiceException):
+            client.create_order(mock.Mock(**{"to_dict.return_value": {}}), "x")
+        assert request.call_count == 1
+
+
+def test_open_breaker_fails_fast(locmem_cache, no_sleep):
+    client = CashfreeClient(CashfreeConfig("id", "secret", True))
+    client.breaker.threshold = 3
+    with mock.patch.object(
+        urllib3.PoolManager, "request", return_value=_response(503)
+    ) as request:
+        with pytest.raises(ServiceException):
+            client.fetch_order("ORDER-1", "x")
+        with pytest.raises(CircuitOpenError):
+            client.fetch_order("ORDER-1", "x")
+        assert request.call_count == 3
+
+
+def test_rate_limited_call_does_not_hold_the_probe(locmem_cache, order_entity):
+    from pretix_cashfree.utils import cache
+
+    client = CashfreeClient(CashfreeConfig("id", "secret", True, rate_limit=1))
+    client.breaker.trip()
+    cache.delete(client.breaker._key("open"))
+    with mock.patch.object(client.limiter, "acquire") as acquire, mock.patch.object(
+        urllib3.PoolManager,
+        "request",
+        return_value=_response(200, order_entity("ORDER-1").to_dict()),
+    ):
+        acquire.side_effect = RateLimitExceeded
+        with pytest.raises(RateLimitExceeded):
+            client.fetch_order("ORDER-1", "x")
+
+        acquire.side_effect = None
+        assert client.fetch_order("ORDER-1", "x").order_id == "ORDER-1"
+    assert client.breaker.state == "closed"
+
+
+def test_hedged_call_returns_first_result():
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            return "slow"
+        return "fast"
+
+    assert hedged(fn, 0.01) == "fast"
+    release.set()
+    assert len(calls) == 2
@@ -0,0 +1,68 @@
+import json
+import pytest
+import zlib
+from datetime import timedelta
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix_cashfree.models import (
+    PaymentAttempt,
+    PaymentAttemptArchive,
+    PaymentAttemptHistory,
+)
+from pretix_cashfree.retention import prune
+
+
+def _attempt(payment, reference, status, age_days):
+    attempt = PaymentAttempt.objects.create(
+        reference=reference, payment=payment, status=status
+    )
+    attempt.history.create(status=status, source="webhook")
+    PaymentAttempt.objects.filter(pk=attempt.pk).update(
+        updated=now() - timedelta(days=age_days)
+    )
+    return attempt
+
+
+@pytest.mark.django_db
+def test_prune_archives_stale_attempts_by_status(payment):
+    with scopes_disabled():
+        _attempt(payment, "old-expired", "EXPIRED", 100)
+        _attempt(payment, "old-paid", "PAID", 100)
+        _attempt(payment, "new-expired", "EXPIRED", 10)
+
+        report = prune(dry_run=True, chunk_size=1)
+        assert report.attempts == {"EXPIRED": 1}
+        assert report.history == 1
+        assert report.bytes > 0
+        assert PaymentAttempt.objects.count() == 4
+
+        report = prune(chunk_size=1, archive=True)
+        assert report.attempts == {"EXPIRED": 1}
+        assert set(PaymentAttempt.objects.values_list("reference", flat=True)) == {
+            payment.order.full_code,
+            "old-paid",
+            "new-expired",
+        }
+        assert PaymentAttemptHistory.objects.count() == 2
+
+        archived = PaymentAttemptArchive.objects.get()
+        data = json.loads(zlib.decompress(bytes(archived.data)))
+        assert data["reference"] == "old-expired"
+        assert data["history"][0][:2] == ["EXPIRED", "webhook"]
+
+
+@pytest.mark.django_db
+def test_prune_without_archive_and_kept_status(payment):
+    with scopes_disabled():
+        _attempt(payment, "old-paid", "PAID", 1000)
+        _attempt(payment, "old-active", "ACTIVE", 1000)
+
+        # Refunds and settlements are attributed through the attempts of paid orders
+        report = prune(archive=False, policy={"PAID": 1, "ACTIVE": 180, "unknown": 1})
+        assert report.attempts == {"ACTIVE": 1}
+        assert set(PaymentAttempt.objects.values_list("reference", flat=True)) == {
+            payment.order.full_code,
+            "old-paid",
+        }
+        assert not PaymentAttemptArchive.objects.exists()
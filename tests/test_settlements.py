@@ -0,0 +1,121 @@
+import io
+import json
+import pytest
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, OrderPayment, OrderRefund, Organizer
+
+from pretix_cashfree.exporters import SettlementExporter
+from pretix_cashfree.models import SettlementEntry
+from pretix_cashfree.settlements import import_settlements, iter_rows
+
+REPORT = """Event Id,Event Type,Order Id,Event Amount,Event Settlement Amount,Settlement UTR,Settlement Date
+5114910592817,PAYMENT,DUMMY-FOO1,23.00,22.45,UTR1,2024-10-01 10:00:00
+5114910592818,PAYMENT,DUMMY-BAR2,42.00,41.10,UTR1,2024-10-01 10:00:00
+5114910592819,PAYMENT,DUMMY-BAZ3,abc,,UTR1,2024-10-01 10:00:00
+"""
+
+
+@pytest.mark.django_db
+def test_import_settlements_upserts_in_chunks():
+    report = import_settlements(io.StringIO(REPORT), chunk_size=1)
+    assert (report.rows, report.skipped) == (2, 1)
+
+    entry = SettlementEntry.objects.get(event_id="5114910592817")
+    assert entry.order_id == "DUMMY-FOO1"
+    assert entry.settlement_amount == Decimal("22.45")
+    # Report times without an offset are Indian Standard Time
+    assert entry.settled_at == datetime(2024, 10, 1, 4, 30, tzinfo=timezone.utc)
+
+    report = import_settlements(io.StringIO(REPORT.replace("UTR1", "UTR2")))
+    assert report.rows == 2
+    assert SettlementEntry.objects.count() == 2
+    assert set(SettlementEntry.objects.values_list("settlement_utr", flat=True)) == {
+        "UTR2"
+    }
+
+    with pytest.raises(ValueError):
+        import_settlements(io.StringIO("Order Id,Amount\nDUMMY-FOO1,23\n"))
+
+
+@pytest.mark.django_db
+def test_rows_flag_mismatches(event, payment):
+    import_settlements(io.StringIO(REPORT))
+    SettlementEntry.objects.create(
+        event_id="CB-1",
+        event_type="CHARGEBACK",
+        order_id="DUMMY-FOO1",
+        amount=Decimal("23.00"),
+        event_time=now(),
+    )
+    with scopes_disabled():
+        OrderPayment.objects.filter(pk=payment.pk).update(
+            state=OrderPayment.PAYMENT_STATE_CONFIRMED, payment_date=now()
+        )
+        payment.order.refunds.create(
+            payment=payment,
+            source=OrderRefund.REFUND_SOURCE_ADMIN,
+            state=OrderRefund.REFUND_STATE_DONE,
+            amount=Decimal("5.00"),
+            provider="cashfree",
+            info=json.dumps({"order_id": "DUMMY-FOO1", "cf_refund_id": "cf-R-1"}),
+        )
+        rows = list(iter_rows(Event.objects.all(), chunk_size=1))
+
+    payment_row, refund_row, unmatched_row = rows
+    assert payment_row["order_id"] == "DUMMY-FOO1"
+    assert payment_row["settlement_amount"] == Decimal("22.45")
+    assert payment_row["mismatch"] == ""
+    assert refund_row["cashfree_id"] == "cf-R-1"
+    assert refund_row["mismatch"] == "not_settled"
+    assert unmatched_row["type"] == "chargeback"
+    assert unmatched_row["order_id"] == "DUMMY-FOO1"
+    assert unmatched_row["mismatch"] == "unmatched"
+
+    SettlementEntry.objects.filter(order_id="DUMMY-FOO1").update(amount=Decimal("20"))
+    with scopes_disabled():
+        rows = list(iter_rows(Event.objects.all()))
+    assert rows[0]["mismatch"] == "amount"
+
+    with scopes_disabled():
+        rows = list(iter_rows(Event.objects.all(), start=now() + timedelta(days=1)))
+    assert rows == []
+
+
+@pytest.mark.django_db
+def test_rows_of_another_organizer_are_not_listed(event, payment):
+    SettlementEntry.objects.create(
+        event_id="CB-1", event_type="CHARGEBACK", order_id="DUMMY-FOO1", amount=23
+    )
+    with scopes_disabled():
+        # Event slugs are only unique within an organizer
+        organizer = Organizer.objects.create(name="Other", slug="other")
+        other = organizer.events.create(
+            name="Other", slug=event.slug, date_from=now(), currency="INR"
+        )
+        assert list(iter_rows(Event.objects.filter(pk=other.pk))) == []
+
+
+@pytest.mark.django_db
+def test_exporter_streams_csv_and_jsonl(event, payment):
+    import_settlements(io.StringIO(REPORT))
+    with scopes_disabled():
+        exporter = SettlementExporter(Event.objects.all(), event.organizer)
+
+        output = io.BytesIO()
+        filename, content_type, data = exporter.render({"format": "csv"}, output)
+        assert filename == "dummy_cashfree_settlements.csv"
+        assert data is None
+        lines = output.getvalue().decode().splitlines()
+        assert lines[0].startswith("type,event,order,order_id,")
+        assert len(lines) == 2
+
+        filename, content_type, data = exporter.render(
+            {"format": "jsonl", "date_from": "2020-01-01"}
+        )
+    assert content_type == "application/x-ndjson"
+    assert [json.loads(line)["type"] for line in data.decode().splitlines()] == [
+        "payment"
+    ]
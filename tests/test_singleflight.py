@@ -0,0 +1,37 @@
+import pytest
+import threading
+import time
+
+from pretix_cashfree.singleflight import single_flight
+
+
+def test_concurrent_calls_share_one_flight(locmem_cache):
+    calls = []
+    results = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"order_status": "PAID"}
+
+    def worker():
+        results.append(single_flight("verify:TEST-FOO1", fetch))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert [leader for _, leader in results].count(True) == 1
+    assert all(result == {"order_status": "PAID"} for result, _ in results)
+
+
+def test_failed_flight_is_taken_over(locmem_cache):
+    def failing():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        single_flight("verify:TEST-FOO2", failing)
+    assert single_flight("verify:TEST-FOO2", lambda: 42) == (42, True)
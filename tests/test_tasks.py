@@ -0,0 +1,86 @@
+import pytest
+from django_scopes import scopes_disabled
+from unittest import mock
+
+from pretix_cashfree import metrics
+from pretix_cashfree.client import CashfreeClient
+from pretix_cashfree.models import WebhookInboxEvent
+from pretix_cashfree.tasks import drain_webhook_inbox
+
+
+@pytest.mark.django_db
+def test_async_webhooks_are_coalesced_per_payment(
+    client, event, payment, make_webhook, order_entity
+):
+    event.settings.set("payment_cashfree_global_webhook_async", True)
+    order_id = payment.order.full_code
+
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        for cf_payment_id in (1, 2):
+            body, headers = make_webhook(order_id, cf_payment_id)
+            response = client.post(
+                "/_cashfree/webhook/", body, content_type="application/json", **headers
+            )
+            assert response.status_code == 200
+        fetch_order.assert_not_called()
+
+        fetch_order.return_value = order_entity(order_id)
+        assert drain_webhook_inbox() == 2
+        assert fetch_order.call_count == 1
+
+    with scopes_disabled():
+        payment.refresh_from_db()
+        assert payment.state == payment.PAYMENT_STATE_CONFIRMED
+        assert not WebhookInboxEvent.objects.filter(processed_at__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_webhooks_in_quick_succession_schedule_one_inbox_run(
+    client,
+    event,
+    payment,
+    make_webhook,
+    settings,
+    locmem_cache,
+    django_capture_on_commit_callbacks,
+):
+    event.settings.set("payment_cashfree_global_webhook_async", True)
+    settings.HAS_CELERY = True
+
+    with mock.patch(
+        "pretix_cashfree.tasks.process_webhook_inbox.apply_async"
+    ) as apply_async:
+        for cf_payment_id in (1, 2, 3):
+            body, headers = make_webhook(payment.order.full_code, cf_payment_id)
+            with django_capture_on_commit_callbacks(execute=True):
+                client.post(
+                    "/_cashfree/webhook/",
+                    body,
+                    content_type="application/json",
+                    **headers,
+                )
+    assert apply_async.call_count == 1
+
+
+@pytest.mark.django_db
+def test_exhausted_inbox_events_are_reported(
+    client, event, payment, make_webhook, caplog
+):
+    event.settings.set("payment_cashfree_global_webhook_async", True)
+    body, headers = make_webhook(payment.order.full_code, 1)
+    client.post("/_cashfree/webhook/", body, content_type="application/json", **headers)
+
+    with mock.patch.object(
+        CashfreeClient, "fetch_order", side_effect=Exception("unavailable")
+    ), mock.patch("pretix_cashfree.metrics.inc") as inc:
+        for _ in range(5):
+            assert drain_webhook_inbox() == 0
+        # Not retried any more
+        assert drain_webhook_inbox() == 0
+
+    assert [
+        c.args[1:]
+        for c in inc.call_args_list
+        if c.args[0] is metrics.cashfree_webhook_inbox_exhausted_total
+    ] == [(1,)]
+    assert "Giving up on 1 inbox events" in caplog.text
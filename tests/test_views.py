@@ -0,0 +1,151 @@
+import pytest
+from django.test import RequestFactory
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, OrderPayment
+from time import time
+from unittest import mock
+
+from pretix_cashfree import metrics
+from pretix_cashfree.client import CashfreeClient
+from pretix_cashfree.constants import RETURN_URL_PARAM, SESSION_KEY_ORDER_ID
+from pretix_cashfree.provider_cache import invalidate_provider
+from pretix_cashfree.status_cache import set_order_status
+from pretix_cashfree.views import return_view
+
+
+@pytest.fixture(autouse=True)
+def clear_providers():
+    invalidate_provider()
+
+
+@pytest.mark.django_db
+def test_return_view_query_budget(
+    locmem_cache, event, payment, order_entity, django_assert_num_queries
+):
+    order_id = payment.order.full_code
+    set_order_status(order_entity(order_id, status="ACTIVE"))
+    with scopes_disabled():
+        event = Event.objects.select_related("organizer").get(pk=event.pk)
+
+    def get():
+        request = RequestFactory().get("/", {RETURN_URL_PARAM: order_id})
+        request.event = event
+        request.session = {SESSION_KEY_ORDER_ID: order_id}
+        return return_view(request)
+
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(order_id, status="ACTIVE")
+        # Warm up the provider and the event's domain
+        get()
+        # The payment attempt, its payment, order and event come from a single query,
+        # storing the fetched status updates the payment and its attempt
+        with django_assert_num_queries(4):
+            response = get()
+    assert response.status_code == 302
+
+
+@pytest.mark.django_db
+def test_return_view_does_not_trust_cached_status(
+    locmem_cache, event, payment, order_entity
+):
+    order_id = payment.order.full_code
+    # Cached before the customer paid
+    set_order_status(order_entity(order_id, status="ACTIVE"))
+
+    request = RequestFactory().get("/", {RETURN_URL_PARAM: order_id})
+    request.event = event
+    request.session = {SESSION_KEY_ORDER_ID: order_id}
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(order_id, status="PAID")
+        with scopes_disabled():
+            response = return_view(request)
+
+    assert response.status_code == 302
+    assert fetch_order.call_count == 1
+    with scopes_disabled():
+        payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+
+
+@pytest.mark.django_db
+def test_webhook_view_query_budget(
+    locmem_cache, client, payment, make_webhook, order_entity, django_assert_num_queries
+):
+    body, headers = make_webhook(payment.order.full_code, 1)
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(payment.order.full_code, "ACTIVE")
+        client.post(
+            "/_cashfree/webhook/", body, content_type="application/json", **headers
+        )
+
+        # A redelivery only needs the joined lookup of its payment attempt
+        with django_assert_num_queries(1):
+            response = client.post(
+                "/_cashfree/webhook/", body, content_type="application/json", **headers
+            )
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_redirect_view_hands_off_without_delay(client, event):
+    response = client.get("/dummy/dummy/cashfree/redirect/?payment_session_id=abc")
+    assert response.status_code == 200
+    assert b"setTimeout" not in response.content
+    assert b"https://payments.cashfree.com/order/#abc" in response.content
+
+    event.settings.set("payment_cashfree_redirect_mode", "server")
+    response = client.get("/dummy/dummy/cashfree/redirect/?payment_session_id=abc")
+    assert response.status_code == 302
+    assert response["Location"] == "https://payments.cashfree.com/order/#abc"
+
+
+@pytest.mark.django_db
+def test_redirect_timing_is_recorded(client, event, locmem_cache):
+    url = "/dummy/dummy/cashfree/redirect/timing/"
+    response = client.get("/dummy/dummy/cashfree/redirect/?payment_session_id=abc")
+    token = response.context["timing_token"]
+
+    with mock.patch("pretix_cashfree.metrics.observe") as observe:
+        response = client.post(url, {"elapsed": "x", "token": token})
+        assert response.status_code == 400
+
+        response = client.post(url, {"elapsed": 850, "token": token})
+        assert response.status_code == 204
+        observe.assert_called_once_with(
+            metrics.cashfree_redirect_handoff_seconds, 0.85, mode="js"
+        )
+
+
+@pytest.mark.django_db
+def test_redirect_timing_needs_a_fresh_token_of_a_redirect_page(
+    client, event, locmem_cache
+):
+    url = "/dummy/dummy/cashfree/redirect/timing/"
+    response = client.get("/dummy/dummy/cashfree/redirect/?payment_session_id=abc")
+    token = response.context["timing_token"]
+    client.post(url, {"elapsed": 850, "token": token})
+
+    with mock.patch("pretix_cashfree.metrics.observe") as observe:
+        # Each page reports once
+        response = client.post(url, {"elapsed": 850, "token": token})
+        assert response.status_code == 403
+        response = client.post(url, {"elapsed": 850})
+        assert response.status_code == 403
+        response = client.post(url, {"elapsed": 850, "token": token[:-1] + "x"})
+        assert response.status_code == 403
+        response = client.get("/dummy/dummy/cashfree/redirect/?payment_session_id=def")
+        token = response.context["timing_token"]
+        with mock.patch("django.core.signing.time.time", return_value=time() + 600):
+            response = client.post(url, {"elapsed": 850, "token": token})
+        assert response.status_code == 403
+    observe.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_server_redirect_records_no_timing(client, event):
+    event.settings.set("payment_cashfree_redirect_mode", "server")
+    with mock.patch("pretix_cashfree.metrics.observe") as observe:
+        client.get("/dummy/dummy/cashfree/redirect/?payment_session_id=abc")
+    assert metrics.cashfree_redirect_handoff_seconds not in [
+        c.args[0] for c in observe.call_args_list
+    ]
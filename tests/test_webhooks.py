@@ -0,0 +1,165 @@
+import pytest
+from django.test import RequestFactory
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderPayment
+from unittest import mock
+
+from pretix_cashfree.client import CashfreeClient
+from pretix_cashfree.models import PaymentAttempt
+from pretix_cashfree.views import webhook_view
+from pretix_cashfree.webhooks import (
+    WebhookRoute,
+    match_secret,
+    parse_webhook,
+    peek_route,
+    read_route_token,
+    route_token,
+    sign,
+)
+
+SECRET = b"secret"
+
+
+def test_match_secret_uses_raw_bytes():
+    body = b'{"type": "PAYMENT_SUCCESS_WEBHOOK"}\n'
+    signature = sign(SECRET, b"1700000000000", body)
+
+    assert match_secret([b"other", SECRET], b"1700000000000", signature, body) == SECRET
+    assert match_secret([SECRET], b"1700000000000", signature, body.strip()) is None
+    assert match_secret([SECRET], b"1700000000001", signature, body) is None
+
+
+def test_parse_webhook(make_webhook, make_refund_webhook):
+    body, _ = make_webhook("ORDER-1", 42)
+    webhook = parse_webhook(body.encode())
+    assert webhook.order_id == "ORDER-1"
+    assert webhook.cf_payment_id == "42"
+    assert webhook.payment_status == "SUCCESS"
+
+    body, _ = make_refund_webhook("ORDER-1", "ORDER-1-R-1")
+    assert parse_webhook(body.encode()).refund["refund_id"] == "ORDER-1-R-1"
+
+    with pytest.raises(ValueError):
+        parse_webhook(b'{"type": "PAYMENT_SUCCESS_WEBHOOK", "data": {}}')
+
+
+def test_route_token():
+    token = route_token(1, 23, "CF.1")
+    assert read_route_token(token) == WebhookRoute(1, 23, "CF.1")
+    assert read_route_token(token.replace("1.23", "1.24")) is None
+    assert read_route_token("1.23.CF") is None
+    assert read_route_token(None) is None
+    assert read_route_token(123) is None
+
+
+def test_peek_route(make_webhook):
+    token = route_token(1, 23, "CF.1")
+    body, _ = make_webhook("ORDER-1", 42, route=token)
+    assert peek_route(body.encode()) == WebhookRoute(1, 23, "CF.1")
+    body, _ = make_webhook("ORDER-1", 42, route=token.replace("1.23", "1.24"))
+    assert peek_route(body.encode()) is None
+    body, _ = make_webhook("ORDER-1", 42)
+    assert peek_route(body.encode()) is None
+
+
+@pytest.mark.django_db
+def test_routed_webhook_loads_only_its_payment(
+    locmem_cache,
+    client,
+    event,
+    payment,
+    make_webhook,
+    order_entity,
+    django_assert_num_queries,
+):
+    order_id = payment.order.full_code
+    route = route_token(event.pk, payment.pk, "TEST_CLIENT_ID")
+    body, headers = make_webhook(order_id, 1, route=route)
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(order_id, "ACTIVE")
+        client.post(
+            "/_cashfree/webhook/", body, content_type="application/json", **headers
+        )
+
+        with django_assert_num_queries(1):
+            response = client.post(
+                "/_cashfree/webhook/", body, content_type="application/json", **headers
+            )
+    assert response.status_code == 200
+
+    # A token only routes webhooks of the order it was created for
+    body, headers = make_webhook("DUMMY-OTHER", 2, route=route)
+    response = client.post(
+        "/_cashfree/webhook/", body, content_type="application/json", **headers
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_routed_webhook_of_a_later_payment_applies_to_it(
+    client, event, payment, make_webhook, order_entity
+):
+    order_id = payment.order.full_code
+    # The Cashfree order and its token were created for the first payment
+    body, headers = make_webhook(
+        order_id, 1, route=route_token(event.pk, payment.pk, "TEST_CLIENT_ID")
+    )
+    with scopes_disabled():
+        OrderPayment.objects.filter(pk=payment.pk).update(
+            state=OrderPayment.PAYMENT_STATE_CANCELED
+        )
+        retry = payment.order.payments.create(
+            provider="cashfree", amount=payment.amount
+        )
+        PaymentAttempt.objects.filter(reference=order_id).update(payment=retry)
+
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order:
+        fetch_order.return_value = order_entity(order_id)
+        response = client.post(
+            "/_cashfree/webhook/", body, content_type="application/json", **headers
+        )
+    assert response.status_code == 200
+    with scopes_disabled():
+        retry.refresh_from_db()
+        payment.refresh_from_db()
+    assert retry.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+    assert payment.state == OrderPayment.PAYMENT_STATE_CANCELED
+
+
+@pytest.mark.django_db
+def test_invalid_signature_is_rejected_without_queries(
+    event, payment, make_webhook, django_assert_num_queries
+):
+    body, headers = make_webhook(payment.order.full_code, 1)
+    headers["HTTP_X_WEBHOOK_SIGNATURE"] = "invalid"
+    # Straight to the view, pretix' middleware queries on its own
+    request = RequestFactory().post(
+        "/_cashfree/webhook/", body, content_type="application/json", **headers
+    )
+    # The configured secrets are loaded once per process
+    webhook_view(request)
+
+    with mock.patch.object(CashfreeClient, "fetch_order") as fetch_order, mock.patch(
+        "pretix_cashfree.views.parse_webhook"
+    ) as parse:
+        with django_assert_num_queries(0):
+            response = webhook_view(request)
+        assert response.status_code == 400
+        fetch_order.assert_not_called()
+        parse.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_secret_of_another_event_is_rejected(client, event, payment, make_webhook):
+    body, headers = make_webhook(payment.order.full_code, 1)
+    with scopes_disabled():
+        event.settings.set("payment_cashfree_client_secret", "ROTATED")
+        other = event.organizer.events.create(
+            name="Other", slug="other", date_from=event.date_from, currency="INR"
+        )
+    other.settings.set("payment_cashfree_client_secret", "TEST_CLIENT_SECRET")
+
+    response = client.post(
+        "/_cashfree/webhook/", body, content_type="application/json", **headers
+    )
+    assert response.status_code == 400